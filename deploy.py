@@ -1,9 +1,39 @@
 import sys
+import argparse
+import atexit
+import asyncio
 import os
+import posixpath
 import json
+import mmap
+import codecs
+import contextlib
+import ctypes
+import ctypes.util
+import errno
+import queue
+import random
 import threading
 import re
+import select
+import stat
+import struct
 import time
+import signal
+import socket
+import subprocess
+import shlex
+import shutil
+import zipfile
+import hashlib
+import heapq
+import uuid
+import tempfile
+import weakref
+import zlib
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 import paramiko
 
@@ -11,9 +41,11 @@ from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox,
     QPushButton, QProgressBar, QMessageBox, QTextEdit, QDialog,
     QTreeWidget, QTreeWidgetItem, QFormLayout, QScrollArea, QLineEdit,
-    QFileDialog, QTabWidget, QGroupBox, QInputDialog, QMenu
+    QFileDialog, QTabWidget, QGroupBox, QInputDialog, QMenu, QPlainTextEdit,
+    QSpinBox, QCheckBox, QListWidget, QListWidgetItem, QListView, QAbstractItemView, QCompleter
 )
-from PyQt6.QtCore import Qt, pyqtSignal, QObject
+from PyQt6.QtGui import QStandardItemModel, QStandardItem
+from PyQt6.QtCore import Qt, pyqtSignal, QObject, QTimer, QSortFilterProxyModel
 
 
 # ============================================================
@@ -53,6 +85,13 @@ DEFAULT_CONFIG = {
 }
 
 
+# 项目配置中由表单直接编辑的字段，其余字段在"高级配置"中以 JSON 编辑
+PROJECT_FORM_KEYS = ("name", "server", "pre_commands", "files", "scripts")
+
+# 服务器表单中始终显示的可选字段，留空表示不启用
+SERVER_OPTIONAL_KEYS = ("local", "via", "relay", "rate_limit", "compression", "cas_enabled", "cas_max_size_mb", "max_parallel")
+
+
 # ============================================================
 # 全局 QSS 美化主题
 # ============================================================
@@ -144,14 +183,95 @@ def ensure_config_exists():
             json.dump(DEFAULT_CONFIG, f, indent=4, ensure_ascii=False)
 
 
+CONFIG_SAVE_DELAY = 0.5                    # 秒，短时间内的多次保存合并为一次写入
+CONFIG_ENTRY_SECTIONS = ("servers", "projects")
+
+
+class ConfigWriter:
+    """config.json 的写入
+
+    - servers / projects 按条目缓存序列化结果，只重新序列化新增、替换或标记为已修改的条目
+    - 先写临时文件再原子替换，写入中途退出不会留下损坏的配置
+    - 短时间内的多次保存合并为一次写入；读取配置和程序退出前写入尚未落盘的修改
+    """
+
+    def __init__(self, path, delay=CONFIG_SAVE_DELAY):
+        self.path = path
+        self.delay = delay
+        self._fragments = {}   # (分区, 条目名) -> (条目对象, 序列化结果)
+        self._pending = None   # 尚未写入的完整文本
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def _entry_text(self, section, key, entry, changed):
+        # 条目对象被替换（编辑器保存时生成新字典）时自动重新序列化，原地修改的条目需要列入 changed
+        cached = self._fragments.get((section, key))
+        if cached is not None and cached[0] is entry and (section, key) not in changed:
+            return cached[1]
+        text = json.dumps(entry, indent=4, ensure_ascii=False).replace("\n", "\n" + " " * 8)
+        self._fragments[(section, key)] = (entry, text)
+        return text
+
+    def render(self, data, changed=()):
+        """生成与 json.dump(data, indent=4, ensure_ascii=False) 相同的文本"""
+        changed = set(changed)
+        live = set()
+        parts = []
+        for name, value in data.items():
+            if name in CONFIG_ENTRY_SECTIONS and isinstance(value, dict) and value:
+                live.update((name, key) for key in value)
+                entries = ",\n".join(
+                    f"        {json.dumps(key, ensure_ascii=False)}: {self._entry_text(name, key, entry, changed)}"
+                    for key, entry in value.items()
+                )
+                text = "{\n" + entries + "\n    }"
+            else:
+                text = json.dumps(value, indent=4, ensure_ascii=False).replace("\n", "\n    ")
+            parts.append(f"    {json.dumps(name, ensure_ascii=False)}: {text}")
+        for stale in self._fragments.keys() - live:
+            del self._fragments[stale]
+        return "{\n" + ",\n".join(parts) + "\n}" if parts else "{}"
+
+    def save(self, data, changed=()):
+        """生成配置文本并延迟写入，changed 为原地修改过的 (分区, 条目名)"""
+        with self._lock:
+            self._pending = self.render(data, changed)
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """立即写入尚未落盘的修改"""
+        with self._lock:
+            text, self._pending = self._pending, None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if text is None:
+                return
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+
+config_writer = ConfigWriter(CONFIG_FILE)
+atexit.register(config_writer.flush)
+
+
 def load_full_config():
+    config_writer.flush()
     with open(CONFIG_FILE, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
-def save_full_config(data):
-    with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+def save_full_config(data, changed=()):
+    """保存配置（延迟合并写入），changed 为原地修改过的 (分区, 条目名)，被替换或新增的条目会自动检测"""
+    config_writer.save(data, changed)
 
 
 # ============================================================
@@ -159,17 +279,264 @@ def save_full_config(data):
 # ============================================================
 class SSHSignals(QObject):
     progress = pyqtSignal(int)
+    progress_max = pyqtSignal(int)   # 文件数在解析目录/通配符后才确定
     log = pyqtSignal(str)
     finished = pyqtSignal(bool, str)
 
 
+# ============================================================
+# 停止控制
+# ============================================================
+class OperationStopped(Exception):
+    """用户主动停止操作"""
+
+
+_stop_lock = threading.Lock()
+
+
+def is_stopped(stop_flag):
+    return bool(stop_flag and stop_flag.get('stop'))
+
+
+def reset_stop_flag(stop_flag):
+    """开始新操作前重置停止标志"""
+    with _stop_lock:
+        stop_flag['stop'] = False
+        stop_flag.pop('stop_time', None)
+        stop_flag['callbacks'] = []
+
+
+def register_stop_callback(stop_flag, callback):
+    """注册停止回调（关闭通道、终止进程树等），已停止时立即执行"""
+    if stop_flag is None:
+        return
+    with _stop_lock:
+        if not stop_flag.get('stop'):
+            stop_flag.setdefault('callbacks', []).append(callback)
+            return
+    _run_stop_callbacks([callback])
+
+
+def unregister_stop_callback(stop_flag, callback):
+    if stop_flag is None:
+        return
+    with _stop_lock:
+        callbacks = stop_flag.get('callbacks', [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+
+def request_stop(stop_flag):
+    """设置停止标志并立即执行所有已注册的停止回调"""
+    with _stop_lock:
+        stop_flag['stop'] = True
+        stop_flag['stop_time'] = time.time()
+        callbacks = stop_flag.get('callbacks', [])
+        stop_flag['callbacks'] = []
+    # 在后台线程执行，避免阻塞界面
+    threading.Thread(target=_run_stop_callbacks, args=(callbacks,), daemon=True).start()
+
+
+def linked_stop_flag(stop_flag):
+    """创建随 stop_flag 一起停止的子停止标志，子标志可以单独停止（如预检失败时只中止构建）
+
+    子标志用完后调用 unlink_stop_flag，否则它的回调会一直留在 stop_flag 上。
+    """
+    child = {'stop': False, 'callbacks': []}
+    callback = lambda: request_stop(child)
+    child['unlink'] = lambda: unregister_stop_callback(stop_flag, callback)
+    register_stop_callback(stop_flag, callback)
+    return child
+
+
+def unlink_stop_flag(child):
+    """从父停止标志上移除 linked_stop_flag 注册的回调"""
+    unlink = child.pop('unlink', None)
+    if unlink is not None:
+        unlink()
+
+
+def _run_stop_callbacks(callbacks):
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception:
+            pass
+
+
+def kill_process_tree(process):
+    """终止本地进程及其所有子进程（shell=True 时 terminate 只能杀掉 shell 本身）"""
+    if process.poll() is not None:
+        return
+    if os.name == 'nt':
+        subprocess.run(
+            ["taskkill", "/F", "/T", "/PID", str(process.pid)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    # 给进程 200ms 优雅退出，否则强制杀掉
+    deadline = time.time() + 0.2
+    while time.time() < deadline:
+        if process.poll() is not None:
+            return
+        time.sleep(0.02)
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
 # ============================================================
 # SSH 操作工具函数
 # ============================================================
+# 本地命令输出按块读取、按批次写入日志
+LOCAL_OUTPUT_CHUNK_SIZE = 64 * 1024
+LOG_BATCH_INTERVAL = 0.1
+LOG_BATCH_MAX_LINES = 500
+
+_LINE_BREAK_RE = re.compile(r"\r\n|\r|\n")
+
+
+class StreamLineDecoder:
+    """命令输出的增量解码器
+
+    编码在第一个含非 ASCII 字节的数据块上检测一次（UTF-8 优先，否则使用系统默认编码），
+    之后整个流都使用同一个增量解码器，不再逐行试错。
+    按 \\n、\\r\\n 和单独的 \\r（进度条刷新）切分行。
+    """
+
+    def __init__(self, fallback_encoding):
+        self.fallback_encoding = fallback_encoding
+        self.encoding = None
+        self._decoder = None
+        self._pending = ""
+
+    def _detect(self, data):
+        try:
+            data.decode('utf-8')
+            return 'utf-8'
+        except UnicodeDecodeError as e:
+            # 块尾被截断的多字节字符不算失败
+            if e.reason == 'unexpected end of data' and e.start >= len(data) - 3:
+                return 'utf-8'
+            return self.fallback_encoding
+
+    def feed(self, data, final=False):
+        """输入一个数据块，返回 [(行文本, 是否以 \\r 结尾)]"""
+        if self._decoder is None:
+            if not final and data.isascii():
+                # 纯 ASCII 对任何候选编码都一样，推迟检测
+                text = data.decode('ascii')
+            else:
+                self.encoding = self._detect(data)
+                self._decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+                text = self._decoder.decode(data, final)
+        else:
+            text = self._decoder.decode(data, final)
+
+        text = self._pending + text
+        parts = _LINE_BREAK_RE.split(text)
+        breaks = _LINE_BREAK_RE.findall(text)
+        self._pending = parts.pop()
+        # 块尾的 \\r 可能是被截断的 \\r\\n，留到下一块再判断
+        if not final and breaks and breaks[-1] == "\r" and not self._pending:
+            self._pending = parts.pop() + "\r"
+            breaks.pop()
+        return [(line, brk == "\r") for line, brk in zip(parts, breaks)]
+
+    def take_partial(self):
+        """取出尚未换行的残留输出（进度条等），用于长时间无换行时及时显示"""
+        partial, self._pending = self._pending.rstrip("\r"), ""
+        return partial
+
+    def close(self):
+        lines = self.feed(b"", final=True)
+        partial = self.take_partial()
+        if partial:
+            lines.append((partial, False))
+        return lines
+
+
+def _read_output_chunks(stream, chunk_queue):
+    """后台线程：按大块读取进程输出放入队列，读到 EOF 时放入 None"""
+    fd = stream.fileno()
+    try:
+        while True:
+            data = os.read(fd, LOCAL_OUTPUT_CHUNK_SIZE)
+            if not data:
+                break
+            chunk_queue.put(data)
+    except OSError:
+        pass
+    finally:
+        chunk_queue.put(None)
+
+
+def pump_process_output(process, signals, stop_flag=None, fallback_encoding='utf-8', prefix="  "):
+    """读取进程输出并按批次写入日志，返回 False 表示被停止"""
+    chunk_queue = queue.Queue()
+    reader = threading.Thread(target=_read_output_chunks, args=(process.stdout, chunk_queue), daemon=True)
+    reader.start()
+
+    decoder = StreamLineDecoder(fallback_encoding)
+    batch = []
+    last_cr = False  # batch 最后一行是否为 \r 进度刷新，连续刷新只保留最新一条
+    last_flush = time.time()
+    last_data = last_flush
+
+    def add_lines(lines):
+        nonlocal last_cr
+        for line, is_cr in lines:
+            if last_cr and batch:
+                batch[-1] = prefix + line
+            else:
+                batch.append(prefix + line)
+            last_cr = is_cr
+
+    def flush():
+        nonlocal last_flush, last_cr
+        if batch:
+            signals.log.emit("\n".join(batch))
+            batch.clear()
+        last_cr = False
+        last_flush = time.time()
+
+    while True:
+        if stop_flag and stop_flag.get('stop'):
+            flush()
+            return False
+        try:
+            data = chunk_queue.get(timeout=LOG_BATCH_INTERVAL)
+        except queue.Empty:
+            data = b""
+        if data is None:
+            break
+
+        now = time.time()
+        if data:
+            last_data = now
+            add_lines(decoder.feed(data))
+        elif now - last_data >= LOG_BATCH_INTERVAL:
+            # 一段时间没有新数据：把没有换行的进度输出也显示出来
+            partial = decoder.take_partial()
+            if partial:
+                add_lines([(partial, False)])
+
+        if len(batch) >= LOG_BATCH_MAX_LINES or now - last_flush >= LOG_BATCH_INTERVAL:
+            flush()
+
+    add_lines(decoder.close())
+    flush()
+    return not (stop_flag and stop_flag.get('stop'))
+
+
 def execute_local_commands(commands, signals, stop_flag=None):
     """执行本地前置命令"""
-    import subprocess
-    import sys
     import locale
     
     # 获取系统默认编码
@@ -188,14 +555,15 @@ def execute_local_commands(commands, signals, stop_flag=None):
         
         try:
             # 在 Windows 上使用 cmd，在 Linux/Mac 上使用 bash
+            # 新建进程组，停止时可以终止整个进程树
             if os.name == 'nt':
                 process = subprocess.Popen(
                     cmd,
                     shell=True,
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
-                    bufsize=1,
-                    # 移除文本模式参数，使用二进制读取
+                    bufsize=0,
+                    creationflags=subprocess.CREATE_NEW_PROCESS_GROUP,
                 )
             else:
                 process = subprocess.Popen(
@@ -204,40 +572,30 @@ def execute_local_commands(commands, signals, stop_flag=None):
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
                     executable='/bin/bash',
-                    bufsize=1,
-                    # 移除文本模式参数，使用二进制读取
+                    bufsize=0,
+                    start_new_session=True,
                 )
+
+            # 停止时立即杀掉进程树，即使命令没有任何输出读取线程也会因管道关闭而结束
+            kill_callback = lambda: kill_process_tree(process)
+            register_stop_callback(stop_flag, kill_callback)
             
-            # 实时读取输出（二进制模式）
-            for line_bytes in iter(process.stdout.readline, b''):
-                if stop_flag and stop_flag.get('stop'):
-                    process.terminate()
-                    signals.log.emit("🛑 操作已停止，正在终止进程...")
-                    return False
-                
-                if line_bytes:
-                    # 尝试解码
-                    try:
-                        # 优先尝试系统默认编码（如GBK）
-                        line = line_bytes.decode(default_encoding).rstrip()
-                    except UnicodeDecodeError:
-                        try:
-                            # 失败则尝试 UTF-8
-                            line = line_bytes.decode('utf-8').rstrip()
-                        except UnicodeDecodeError:
-                            # 最后使用 replace 策略
-                            line = line_bytes.decode(default_encoding, errors='replace').rstrip()
-                            
-                    signals.log.emit(f"  {line}")
+            # 按块读取输出，批量写入日志
+            if not pump_process_output(process, signals, stop_flag, default_encoding):
+                kill_process_tree(process)
+                signals.log.emit("🛑 操作已停止，正在终止进程...")
+                return False
             
             # 等待命令完成
             process.wait()
+            unregister_stop_callback(stop_flag, kill_callback)
             return_code = process.returncode
             
+            if stop_flag and stop_flag.get('stop'):
+                signals.log.emit("🛑 操作已停止，进程已终止")
+                return False
+
             if return_code != 0:
-                # 如果是手动停止导致的非0退出，不报错
-                if stop_flag and stop_flag.get('stop'):
-                    return False
                 signals.log.emit(f"✗ 命令执行失败，退出码: {return_code}")
                 return False
             else:
@@ -250,8 +608,645 @@ def execute_local_commands(commands, signals, stop_flag=None):
     return True
 
 
+def server_configs(config):
+    """配置中的所有服务器，via 中的跳板机名称替换为同一份配置中的跳板机配置
+
+    工作线程直接使用替换后的配置连接跳板机，不在部署过程中重新读取 config.json。
+    """
+    servers = config.get("servers", {})
+
+    def resolve(server_cfg, seen):
+        via = server_cfg.get("via")
+        if not via or isinstance(via, dict) or via in seen or via not in servers:
+            return server_cfg
+        return dict(server_cfg, via=resolve(servers[via], seen | {via}))
+
+    return {name: resolve(server_cfg, {name}) for name, server_cfg in servers.items()}
+
+
+def resolve_via(server_cfg):
+    """返回服务器 via 字段指定的跳板机配置（由 server_configs 替换为配置字典）"""
+    via = server_cfg.get("via")
+    if isinstance(via, dict):
+        return via
+    raise RuntimeError(f"跳板机配置不存在: {via}")
+
+
+def connect_ssh(server_cfg, stop_flag=None, timeout=10):
+    """建立 SSH 连接，连接过程中点击停止会直接关闭 socket 中断握手
+
+    配置了 via 时，通过连接池中跳板机的持久连接打开 direct-tcpip 通道作为 socket，
+    经同一跳板机的所有连接共用一个 Transport。配置了 local 时返回本机执行的 LocalSSHClient。
+    """
+    if is_local_server(server_cfg):
+        ssh = LocalSSHClient()
+        bandwidth.bind(ssh.get_transport(), server_cfg)
+        return ssh
+
+    sock = None
+    if server_cfg.get("via"):
+        bastion = ssh_pool.get(resolve_via(server_cfg), stop_flag)
+        try:
+            sock = bastion.get_transport().open_channel(
+                "direct-tcpip",
+                (server_cfg["host"], int(server_cfg["port"])),
+                ("127.0.0.1", 0),
+                timeout=timeout
+            )
+        except Exception:
+            # 跳板机连接可能已失效，丢弃后下次重新建立
+            ssh_pool.discard(resolve_via(server_cfg))
+            raise
+
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    register_stop_callback(stop_flag, ssh.close)
+    try:
+        ssh.connect(
+            server_cfg["host"],
+            int(server_cfg["port"]),
+            server_cfg["username"],
+            server_cfg["password"],
+            timeout=timeout,
+            sock=sock,
+            compress=bool(server_cfg.get("_compress"))
+        )
+    except Exception:
+        if stop_flag and stop_flag.get('stop'):
+            raise OperationStopped()
+        raise
+    finally:
+        unregister_stop_callback(stop_flag, ssh.close)
+    if stop_flag and stop_flag.get('stop'):
+        ssh.close()
+        raise OperationStopped()
+    bandwidth.bind(ssh.get_transport(), server_cfg)
+    return ssh
+
+
+class SSHConnectionPool:
+    """按服务器复用 SSH 连接（同一 Transport 上可并发打开多个通道）"""
+
+    def __init__(self, keepalive=30):
+        self.keepalive = keepalive
+        self._clients = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_of(server_cfg):
+        # 内网地址可能在不同跳板机后重复，跳板机也作为键的一部分
+        via = server_cfg.get("via")
+        via_key = SSHConnectionPool.key_of(via) if isinstance(via, dict) else via
+        if is_local_server(server_cfg):
+            return ("local", 0, "", via_key)
+        return (server_cfg["host"], int(server_cfg["port"]), server_cfg["username"], via_key)
+
+    def _pool_key(self, server_cfg):
+        # 同一服务器可同时保持普通连接和启用 SSH 压缩的连接
+        return self.key_of(server_cfg) + (bool(server_cfg.get("_compress")),)
+
+    def get(self, server_cfg, stop_flag=None):
+        """获取可用连接，失效时自动重连；同一服务器的并发请求只会建立一个连接"""
+        key = self._pool_key(server_cfg)
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            ssh = self._clients.get(key)
+            transport = ssh.get_transport() if ssh else None
+            if transport is None or not transport.is_active():
+                ssh = connect_ssh(server_cfg, stop_flag)
+                ssh.get_transport().set_keepalive(self.keepalive)
+                self._clients[key] = ssh
+            return ssh
+
+    def discard(self, server_cfg):
+        """丢弃连接（执行出错后调用，下次获取时重连）"""
+        with self._lock:
+            ssh = self._clients.pop(self._pool_key(server_cfg), None)
+        if ssh:
+            ssh.close()
+
+    def close_all(self):
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for ssh in clients:
+            ssh.close()
+
+
+ssh_pool = SSHConnectionPool()
+
+
+# ============================================================
+# 本机传输（local 服务器：本机或已挂载的 NFS/SMB 目录）
+# ============================================================
+LOCAL_COPY_CHUNK_SIZE = 1024 * 1024
+# 远程命令都是 bash 脚本，本机执行同样用 bash；Windows 上需要 Git for Windows 的 bash
+LOCAL_SHELL = shutil.which("bash") if os.name == 'nt' else '/bin/bash'
+
+
+def is_local_server(server_cfg):
+    """服务器配置了 local 时，文件直接在本机复制、命令在本机执行，不建立 SSH 连接"""
+    return bool(server_cfg) and parse_bool(server_cfg.get("local", False))
+
+
+def server_label(server_cfg):
+    """日志中显示的服务器地址，本机服务器没有 host"""
+    return "本机" if is_local_server(server_cfg) else server_cfg.get("host", "")
+
+
+class LocalChannel:
+    """本机进程的通道，接口与 paramiko Channel 中用到的部分一致"""
+
+    def __init__(self):
+        self.process = None
+        self.combine_stderr = False
+        self._stderr_file = None
+        self._reader = None
+        self._forwarder = None
+
+    def settimeout(self, timeout):
+        pass
+
+    def set_combine_stderr(self, combine):
+        self.combine_stderr = combine
+
+    def exec_command(self, command):
+        # 标准错误写入临时文件，调用方只读取标准输出时不会因管道写满而阻塞
+        if LOCAL_SHELL is None:
+            raise RuntimeError("本机服务器的命令需要 bash 执行，Windows 上请安装 Git for Windows 并将 bash 加入 PATH")
+        self._stderr_file = None if self.combine_stderr else tempfile.TemporaryFile()
+        options = dict(
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT if self.combine_stderr else self._stderr_file,
+            bufsize=0,
+        )
+        if os.name == 'nt':
+            self.process = subprocess.Popen(
+                [LOCAL_SHELL, "-c", command], creationflags=subprocess.CREATE_NEW_PROCESS_GROUP, **options
+            )
+            # Windows 的 select 只支持套接字：后台线程把管道输出转发到套接字对
+            self._reader, writer = socket.socketpair()
+            self._forwarder = threading.Thread(target=self._forward_output, args=(writer,), daemon=True)
+            self._forwarder.start()
+        else:
+            self.process = subprocess.Popen(
+                command, shell=True, executable=LOCAL_SHELL, start_new_session=True, **options
+            )
+
+    def _forward_output(self, writer):
+        try:
+            while True:
+                data = os.read(self.process.stdout.fileno(), 65536)
+                if not data:
+                    break
+                writer.sendall(data)
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+    def fileno(self):
+        if self._reader is not None:
+            return self._reader.fileno()
+        return self.process.stdout.fileno()
+
+    def recv_ready(self):
+        readable, _, _ = select.select([self._reader or self.process.stdout], [], [], 0)
+        return bool(readable)
+
+    def recv(self, size):
+        if self._reader is not None:
+            return self._reader.recv(size)
+        return os.read(self.process.stdout.fileno(), size)
+
+    def read_stderr(self):
+        if self._stderr_file is None:
+            return b""
+        self.process.wait()
+        self._stderr_file.seek(0)
+        return self._stderr_file.read()
+
+    def sendall(self, data):
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+
+    def interrupt(self):
+        """对应伪终端中的 Ctrl+C"""
+        try:
+            if os.name == 'nt':
+                self.process.send_signal(signal.CTRL_BREAK_EVENT)
+            else:
+                os.killpg(self.process.pid, signal.SIGINT)
+        except OSError:
+            pass
+
+    def exit_status_ready(self):
+        # Windows 上等转发线程把剩余输出送完，调用方才不会漏掉最后的输出
+        if self._forwarder is not None and self._forwarder.is_alive():
+            return False
+        return self.process.poll() is not None
+
+    def recv_exit_status(self):
+        return self.process.wait()
+
+    def close(self):
+        if self.process is not None:
+            kill_process_tree(self.process)
+            for stream in (self.process.stdin, self.process.stdout):
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+        if self._reader is not None:
+            self._reader.close()
+        if self._stderr_file is not None:
+            self._stderr_file.close()
+
+
+class LocalChannelFile:
+    """exec_command 返回的 stdin / stdout / stderr"""
+
+    def __init__(self, channel, kind):
+        self.channel = channel
+        self.kind = kind
+
+    def read(self):
+        if self.kind == "stderr":
+            return self.channel.read_stderr()
+        chunks = []
+        while True:
+            data = self.channel.recv(65536)
+            if not data:
+                break
+            chunks.append(data)
+        self.channel.recv_exit_status()
+        return b"".join(chunks)
+
+    def write(self, data):
+        if data == '\x03':
+            self.channel.interrupt()
+            return
+        self.channel.sendall(data.encode() if isinstance(data, str) else data)
+
+
+class LocalTransport:
+    def is_active(self):
+        return True
+
+    def set_keepalive(self, interval):
+        pass
+
+    def open_session(self, timeout=None):
+        return LocalChannel()
+
+    def open_channel(self, kind, dest_addr, src_addr=None, timeout=None):
+        """direct-tcpip 通道（健康检查、经本机跳转）即直接建立 TCP 连接"""
+        try:
+            return socket.create_connection(dest_addr, timeout=timeout)
+        except OSError as e:
+            raise paramiko.ChannelException(2, str(e))
+
+
+class LocalSFTPChannel:
+    def __init__(self, transport):
+        self._transport = transport
+
+    def get_transport(self):
+        return self._transport
+
+    def close(self):
+        pass
+
+
+class LocalSFTPClient:
+    """本机文件操作，接口与 paramiko SFTPClient 中用到的部分一致"""
+
+    def __init__(self, transport):
+        self._channel = LocalSFTPChannel(transport)
+
+    def get_channel(self):
+        return self._channel
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def open(self, path, mode="r"):
+        return open(path, mode if "b" in mode else mode + "b")
+
+    def mkdir(self, path):
+        os.mkdir(path)
+
+    def chmod(self, path, mode):
+        os.chmod(path, mode)
+
+    def remove(self, path):
+        os.remove(path)
+
+    def rename(self, src_path, dst_path):
+        os.rename(src_path, dst_path)
+
+    def posix_rename(self, src_path, dst_path):
+        os.replace(src_path, dst_path)
+
+    def close(self):
+        pass
+
+
+class LocalSSHClient:
+    """本机服务器的"连接"，接口与 paramiko SSHClient 中用到的部分一致，所有部署流程无需区分"""
+
+    def __init__(self):
+        self._transport = LocalTransport()
+        self._channels = weakref.WeakSet()
+
+    def get_transport(self):
+        return self._transport
+
+    def exec_command(self, command, get_pty=False, timeout=None):
+        channel = LocalChannel()
+        channel.set_combine_stderr(get_pty)  # 伪终端中标准错误与标准输出合并
+        channel.exec_command(command)
+        self._channels.add(channel)
+        return (LocalChannelFile(channel, "stdin"), LocalChannelFile(channel, "stdout"),
+                LocalChannelFile(channel, "stderr"))
+
+    def open_sftp(self):
+        return LocalSFTPClient(self._transport)
+
+    def close(self):
+        # 与断开 SSH 连接一致：结束仍在运行的前台命令（后台 nohup 的脚本不受影响）
+        for channel in list(self._channels):
+            channel.close()
+
+
+def _copy_chunk_read_write(src, dst, offset, count):
+    src.seek(offset)
+    dst.seek(offset)
+    data = src.read(count)
+    dst.write(data)
+    return len(data)
+
+
+def _copy_chunk_file_range(src, dst, offset, count):
+    return os.copy_file_range(src.fileno(), dst.fileno(), count, offset, offset)
+
+
+def _copy_chunk_sendfile(src, dst, offset, count):
+    dst.seek(offset)
+    return os.sendfile(dst.fileno(), src.fileno(), offset, count)
+
+
+def local_copy(sftp, local_path, target_path, callback, stop_flag=None):
+    """本机复制：优先内核内拷贝（copy_file_range，其次 sendfile），不支持时普通读写；同样经过限速"""
+    limiters = bandwidth.limiters_for(sftp)
+    file_size = os.path.getsize(local_path)
+    methods = [_copy_chunk_read_write]
+    if hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+        methods.insert(0, _copy_chunk_sendfile)
+    if hasattr(os, "copy_file_range"):
+        methods.insert(0, _copy_chunk_file_range)
+    copied = 0
+    with open(local_path, "rb") as src, open(target_path, "wb") as dst:
+        while copied < file_size:
+            count = min(LOCAL_COPY_CHUNK_SIZE, file_size - copied)
+            bandwidth.throttle(limiters, count, stop_flag)
+            try:
+                sent = methods[0](src, dst, copied, count)
+            except OSError as e:
+                # 跨文件系统、网络文件系统等不支持内核内拷贝时换下一种方式
+                if len(methods) == 1 or e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+                methods.pop(0)
+                continue
+            if sent == 0:
+                break  # 源文件在复制过程中变短
+            copied += sent
+            callback(copied, file_size)
+    if os.path.getsize(target_path) != file_size:
+        raise IOError(f"复制后大小不一致: {os.path.getsize(target_path)} != {file_size}")
+
+
+# ============================================================
+# 上传限速
+# ============================================================
+TRANSFER_CHUNK_SIZE = 32768
+THROUGHPUT_WINDOW = 3.0     # 实际吞吐统计窗口（秒）
+
+
+class TokenBucket:
+    """令牌桶限速：rate 为每秒补充的令牌数，burst 为桶容量"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self.tokens = self.burst
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, amount=1):
+        """令牌足够则扣除并返回 True，否则不阻塞直接返回 False"""
+        with self.lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return True
+            return False
+
+    def reserve(self, amount):
+        """预约令牌并返回需要等待的秒数（允许透支，后来者等待更久，并发调用按到达顺序轮流获得配额）"""
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def set_rate(self, rate, burst=None):
+        """运行中调整速率，已积累的令牌按新容量截断"""
+        with self.lock:
+            self._refill()
+            self.rate = float(rate)
+            self.burst = float(burst if burst is not None else rate)
+            self.tokens = min(self.tokens, self.burst)
+
+
+class BandwidthLimiter:
+    """一个限速点（全局或单台服务器），速率单位 KB/s，0 表示不限速；同时统计实际吞吐"""
+
+    def __init__(self, rate_kb=0):
+        self.bucket = TokenBucket(1)
+        self.rate_kb = 0.0
+        self.samples = deque()
+        self.lock = threading.Lock()
+        self.set_rate(rate_kb)
+
+    def set_rate(self, rate_kb):
+        try:
+            rate_kb = max(0.0, float(rate_kb or 0))
+        except ValueError:
+            rate_kb = 0.0
+        if rate_kb:
+            rate = rate_kb * 1024
+            # 桶容量约 0.25 秒的流量，至少容纳一个数据块
+            self.bucket.set_rate(rate, max(rate / 4, TRANSFER_CHUNK_SIZE))
+        self.rate_kb = rate_kb
+
+    def reserve(self, amount):
+        return self.bucket.reserve(amount) if self.rate_kb else 0.0
+
+    def record(self, amount):
+        now = time.time()
+        with self.lock:
+            self.samples.append((now, amount))
+            while self.samples and self.samples[0][0] < now - THROUGHPUT_WINDOW:
+                self.samples.popleft()
+
+    def throughput_kb(self):
+        now = time.time()
+        with self.lock:
+            samples = [(t, amount) for t, amount in self.samples if t >= now - THROUGHPUT_WINDOW]
+        if not samples:
+            return 0.0
+        # 刚开始传输时按实际经过的时间计算，避免统计值偏低
+        elapsed = min(THROUGHPUT_WINDOW, max(now - samples[0][0], 0.5))
+        return sum(amount for _, amount in samples) / elapsed / 1024
+
+
+class BandwidthManager:
+    """全局限速 + 按服务器限速；连接建立时把 Transport 绑定到对应服务器的限速点"""
+
+    def __init__(self):
+        self.global_limiter = BandwidthLimiter()
+        self._servers = {}
+        self._bound = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def set_global_rate(self, rate_kb):
+        self.global_limiter.set_rate(rate_kb)
+
+    def bind(self, transport, server_cfg):
+        """server_cfg 中的 rate_limit（KB/s）在每次连接时重新读取，修改配置后对新的传输生效"""
+        key = SSHConnectionPool.key_of(server_cfg)
+        with self._lock:
+            limiter = self._servers.setdefault(key, BandwidthLimiter())
+            self._bound[transport] = limiter
+        limiter.set_rate(server_cfg.get("rate_limit", 0))
+
+    def limiters_for(self, sftp):
+        with self._lock:
+            server_limiter = self._bound.get(sftp.get_channel().get_transport())
+        return [self.global_limiter] + ([server_limiter] if server_limiter else [])
+
+    def throttle(self, limiters, amount, stop_flag=None):
+        """等待到可以发送 amount 字节，等待期间响应停止"""
+        deadline = time.time() + max(limiter.reserve(amount) for limiter in limiters)
+        while True:
+            if stop_flag and stop_flag.get('stop'):
+                raise OperationStopped()
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 0.1))
+        for limiter in limiters:
+            limiter.record(amount)
+
+    def report(self):
+        """返回 [(名称, 实际 KB/s, 限速 KB/s)]，包含全局和正在传输的服务器"""
+        rows = [("全部", self.global_limiter.throughput_kb(), self.global_limiter.rate_kb)]
+        with self._lock:
+            servers = list(self._servers.items())
+        for key, limiter in servers:
+            actual = limiter.throughput_kb()
+            if actual > 0:
+                rows.append((key[0], actual, limiter.rate_kb))
+        return rows
+
+
+bandwidth = BandwidthManager()
+
+
+def run_remote_command(ssh, command, timeout=30):
+    """执行远程命令并等待结束，返回 (退出码, 合并后的输出)"""
+    channel = ssh.get_transport().open_session(timeout=timeout)
+    try:
+        channel.settimeout(timeout)
+        channel.set_combine_stderr(True)
+        channel.exec_command(command)
+        chunks = []
+        while True:
+            data = channel.recv(65536)
+            if not data:
+                break
+            chunks.append(data)
+        return channel.recv_exit_status(), b"".join(chunks).decode('utf-8', errors='replace')
+    finally:
+        channel.close()
+
+
+# sshd 把整条命令作为 bash -c 的一个参数，Linux 单个参数最长 128 KiB，留出脚本本身的余量
+REMOTE_ARGS_MAX_BYTES = 64 * 1024
+
+
+def chunk_shell_words(words, max_bytes=REMOTE_ARGS_MAX_BYTES):
+    """把已转义的参数（或命令片段）分组，每组拼接后不超过 max_bytes，用于分批执行远程命令"""
+    chunk, size = [], 0
+    for word in words:
+        length = len(word.encode("utf-8")) + 1
+        if chunk and size + length > max_bytes:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(word)
+        size += length
+    if chunk:
+        yield chunk
+
+
+ANSI_ESCAPE_RE = re.compile(r'\x1b\[[0-9;]*m')
+
+
+class ChannelLineStream:
+    """远程通道输出的非阻塞按行读取
+
+    按块接收、增量解码 UTF-8、去除 ANSI 颜色代码；没有换行的输出不会阻塞调用方，
+    调用方可以在两次读取之间检查停止标志或做其他轮询。
+    """
+
+    def __init__(self, channel, chunk_size=65536):
+        self.channel = channel
+        self.chunk_size = chunk_size
+        self.eof = False
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._pending = ""
+
+    def read_lines(self):
+        """返回当前已到达的完整行，没有数据时立即返回空列表"""
+        if self.eof or not self.channel.recv_ready():
+            return []
+        data = self.channel.recv(self.chunk_size)
+        if not data:
+            self.eof = True
+            return []
+        self._pending += self._decoder.decode(data)
+        *lines, self._pending = self._pending.split("\n")
+        return [ANSI_ESCAPE_RE.sub('', line.rstrip()) for line in lines]
+
+    def take_partial(self):
+        """取出尚未换行的残留输出"""
+        partial, self._pending = self._pending, ""
+        return ANSI_ESCAPE_RE.sub('', partial.rstrip())
+
+
 def mkdir_recursive(sftp, remote_path):
     """递归创建远程目录"""
+    if isinstance(sftp, LocalSFTPClient):
+        # 本机路径交给操作系统解析，Windows 上的 D:/app、D:\app 不能拼成 /D:/app
+        os.makedirs(remote_path, exist_ok=True)
+        return
     parts = remote_path.split("/")
     path = ""
     for part in parts:
@@ -264,8 +1259,53 @@ def mkdir_recursive(sftp, remote_path):
             sftp.mkdir(path)
 
 
-def upload_file_to_server(sftp, local_path, remote_path, signals):
-    """上传单个文件，带进度显示"""
+def replace_remote_file(sftp, src_path, dst_path):
+    """原子替换远程文件并保留原文件权限（不支持 posix-rename 扩展时退化为先删除再重命名）"""
+    try:
+        sftp.chmod(src_path, stat.S_IMODE(sftp.stat(dst_path).st_mode))
+    except IOError:
+        pass
+    try:
+        sftp.posix_rename(src_path, dst_path)
+    except IOError:
+        try:
+            sftp.remove(dst_path)
+        except IOError:
+            pass
+        sftp.rename(src_path, dst_path)
+
+
+def copy_to_remote(sftp, local_path, remote_path, callback, stop_flag=None, digest=None):
+    """按数据块写入远程文件（流水线写入），每块发送前经过限速；传入 digest 时边传输边计算哈希
+
+    本机服务器且不需要计算哈希时，直接在内核中复制。
+    """
+    if isinstance(sftp, LocalSFTPClient) and digest is None:
+        local_copy(sftp, local_path, remote_path, callback, stop_flag)
+        return
+    limiters = bandwidth.limiters_for(sftp)
+    file_size = os.path.getsize(local_path)
+    transferred = 0
+    with open(local_path, "rb") as src, sftp.open(remote_path, "wb") as dst:
+        if hasattr(dst, "set_pipelined"):  # 本机服务器打开的是普通文件
+            dst.set_pipelined(True)
+        while True:
+            data = src.read(TRANSFER_CHUNK_SIZE)
+            if not data:
+                break
+            bandwidth.throttle(limiters, len(data), stop_flag)
+            dst.write(data)
+            if digest is not None:
+                digest.update(data)
+            transferred += len(data)
+            callback(transferred, file_size)
+    remote_size = sftp.stat(remote_path).st_size
+    if remote_size != file_size:
+        raise IOError(f"上传后大小不一致: {remote_size} != {file_size}")
+
+
+def upload_file_to_server(sftp, local_path, remote_path, signals, stop_flag=None, digest=None):
+    """上传单个文件，带进度显示，停止时中断正在进行的传输；返回传输耗时（秒）"""
     mkdir_recursive(sftp, os.path.dirname(remote_path))
     
     # 获取文件大小
@@ -274,6 +1314,8 @@ def upload_file_to_server(sftp, local_path, remote_path, signals):
     
     def progress_callback(transferred, total):
         """上传进度回调"""
+        if stop_flag and stop_flag.get('stop'):
+            raise OperationStopped()
         if total == 0:
             return
         
@@ -290,212 +1332,3327 @@ def upload_file_to_server(sftp, local_path, remote_path, signals):
     file_size_mb = file_size / 1024 / 1024
     signals.log.emit(f"开始上传: {file_name} ({file_size_mb:.2f}MB)")
     
-    sftp.put(local_path, remote_path, callback=progress_callback)
+    # 先上传到临时文件再原子替换，传输过程中服务不会读到写了一半的文件
+    tmp_path = f"{remote_path}.qd-part"
+
+    # 回调只在每个数据块写完后触发，网络阻塞时需要直接关闭 SFTP 通道才能及时中断
+    close_channel = lambda: sftp.get_channel().close()
+    register_stop_callback(stop_flag, close_channel)
+    started = time.time()
+    try:
+        copy_to_remote(sftp, local_path, tmp_path, progress_callback, stop_flag, digest)
+        replace_remote_file(sftp, tmp_path, remote_path)
+    except Exception:
+        try:
+            sftp.remove(tmp_path)
+        except Exception:
+            pass
+        if stop_flag and stop_flag.get('stop'):
+            raise OperationStopped()
+        raise
+    finally:
+        unregister_stop_callback(stop_flag, close_channel)
     signals.progress.emit(1)
-    signals.log.emit(f"✓ 上传完成: {file_name} -> {remote_path}")
+    elapsed = max(time.time() - started, 0.001)
+    signals.log.emit(f"✓ 上传完成: {file_name} -> {remote_path}（{file_size / 1024 / elapsed:.0f} KB/s）")
+    return elapsed
 
 
+# ============================================================
+# 部署后健康检查
+# ============================================================
+# 健康检查默认参数：首次间隔、退避倍数、最大间隔、总超时（秒）
+HEALTH_DEFAULTS = {
+    "interval": 0.25,
+    "backoff": 1.3,
+    "max_interval": 3,
+    "timeout": 120,
+    "check_timeout": 10,
+}
 
 
-def upload_project_files_worker(server_cfg, project_cfg, signals, stop_flag=None):
-    """上传项目配置的所有文件"""
-    try:
-        # 执行前置命令（如果有）
-        pre_commands = project_cfg.get("pre_commands", [])
-        if pre_commands:
-            signals.log.emit("=" * 60)
-            signals.log.emit("执行前置命令...")
-            signals.log.emit("=" * 60)
-            if not execute_local_commands(pre_commands, signals, stop_flag):
-                signals.finished.emit(False, "前置命令执行失败或被停止")
-                return
-            
-            if stop_flag and stop_flag.get('stop'):
-                return
+def _health_option(health_cfg, key):
+    return float(health_cfg.get(key, HEALTH_DEFAULTS[key]))
 
-            signals.log.emit("=" * 60)
-            signals.log.emit("前置命令执行完成")
-            signals.log.emit("=" * 60)
-        
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(
-            server_cfg["host"],
-            int(server_cfg["port"]),
-            server_cfg["username"],
-            server_cfg["password"]
-        )
-        signals.log.emit(f"✓ SSH 连接成功: {server_cfg['host']}")
 
-        sftp = ssh.open_sftp()
+def describe_health_check(health_cfg):
+    check_type = health_cfg.get("type", "command")
+    if check_type == "command":
+        return f"命令 {health_cfg.get('command', '')}"
+    target = f"{health_cfg.get('host', '127.0.0.1')}:{health_cfg.get('port')}"
+    if check_type == "http":
+        return f"HTTP {target}{health_cfg.get('path', '/')}"
+    return f"端口 {target}"
 
-        files = project_cfg.get("files", [])
-        if not files:
-            signals.finished.emit(False, "项目未配置任何文件")
-            return
 
-        total_files = len(files)
-        signals.progress.emit(0)
-        signals.log.emit(f"开始上传项目文件，共 {total_files} 个文件...")
+def run_health_check(ssh, health_cfg):
+    """执行一次健康检查，返回 (是否健康, 输出)
 
-        for file_info in files:
-            if stop_flag and stop_flag.get('stop'):
-                signals.log.emit("🛑 上传已停止")
-                sftp.close()
-                ssh.close()
-                signals.finished.emit(False, "操作已停止")
-                return
+    - command：在远程执行命令，退出码为 0 视为健康
+    - port：通过 SSH 隧道（direct-tcpip）连接服务器视角下的端口
+    - http：通过 SSH 隧道发送 HTTP GET，状态码 2xx/3xx 视为健康
+    """
+    check_type = health_cfg.get("type", "command")
+    check_timeout = _health_option(health_cfg, "check_timeout")
 
-            local_path = file_info.get("local", "")
-            remote_path = file_info.get("remote", "")
-            
-            if not local_path or not remote_path:
-                signals.log.emit(f"⚠ 跳过无效配置: {file_info}")
-                continue
-            
-            if not os.path.exists(local_path):
-                signals.log.emit(f"✗ 本地文件不存在: {local_path}")
-                continue
-            
-            # 如果远程路径以 / 结尾，说明是目录，需要添加文件名
-            if remote_path.endswith("/"):
-                remote_path = remote_path + os.path.basename(local_path)
-            
-            upload_file_to_server(sftp, local_path, remote_path, signals)
+    if check_type == "command":
+        stdin, stdout, stderr = ssh.exec_command(health_cfg["command"], timeout=check_timeout)
+        output = (stdout.read() + stderr.read()).decode('utf-8', errors='replace').strip()
+        return stdout.channel.recv_exit_status() == 0, output
 
+    host = health_cfg.get("host", "127.0.0.1")
+    port = int(health_cfg["port"])
+    try:
+        channel = ssh.get_transport().open_channel(
+            "direct-tcpip", (host, port), ("127.0.0.1", 0), timeout=check_timeout
+        )
+    except (paramiko.ChannelException, paramiko.SSHException) as e:
+        return False, f"无法连接 {host}:{port}: {str(e)}"
 
-        sftp.close()
-        ssh.close()
+    try:
+        if check_type == "port":
+            return True, f"端口 {host}:{port} 可连接"
+
+        channel.settimeout(check_timeout)
+        path = health_cfg.get("path", "/")
+        request = f"GET {path} HTTP/1.0\r\nHost: {host}:{port}\r\nConnection: close\r\n\r\n"
+        channel.sendall(request.encode('utf-8'))
+        response = b""
+        while len(response) < 65536:
+            data = channel.recv(8192)
+            if not data:
+                break
+            response += data
+        text = response.decode('utf-8', errors='replace')
+        status_line = text.split("\r\n", 1)[0]
+        match = re.match(r"HTTP/\d(?:\.\d)?\s+(\d{3})", status_line)
+        if not match:
+            return False, f"无效的 HTTP 响应: {status_line[:200]}"
+        status = int(match.group(1))
+        body = text.split("\r\n\r\n", 1)[-1].strip()
+        return 200 <= status < 400, f"{status_line} {body[:500]}".strip()
+    finally:
+        channel.close()
+
+
+class HealthGate:
+    """按自适应退避节奏轮询健康检查
+
+    首次检查间隔较短，未通过时按倍数逐步放大到 max_interval，
+    这样启动快的服务能立即结束，启动慢的服务也不会被频繁轮询。
+    """
+
+    def __init__(self, ssh, health_cfg):
+        self.ssh = ssh
+        self.health_cfg = health_cfg
+        self.interval = _health_option(health_cfg, "interval")
+        self.backoff = _health_option(health_cfg, "backoff")
+        self.max_interval = _health_option(health_cfg, "max_interval")
+        self.deadline = time.time() + _health_option(health_cfg, "timeout")
+        self.next_check = time.time()
+        self.attempts = 0
+        self.last_output = ""
+
+    def expired(self):
+        return time.time() >= self.deadline
+
+    def poll(self):
+        """到达检查时间则执行一次检查，返回 True 表示健康"""
+        now = time.time()
+        if now < self.next_check:
+            return False
+        self.attempts += 1
+        try:
+            healthy, self.last_output = run_health_check(self.ssh, self.health_cfg)
+        except Exception as e:
+            healthy, self.last_output = False, str(e)
+        self.next_check = time.time() + self.interval
+        self.interval = min(self.interval * self.backoff, self.max_interval)
+        return healthy
+
+
+def wait_for_healthy(ssh, health_cfg, signals, stop_flag=None):
+    """阻塞等待服务健康，返回 (是否成功, 消息)"""
+    gate = HealthGate(ssh, health_cfg)
+    start_time = time.time()
+    signals.log.emit(f"等待服务就绪: {describe_health_check(health_cfg)}")
+    while True:
+        if stop_flag and stop_flag.get('stop'):
+            raise OperationStopped()
+        if gate.poll():
+            elapsed = time.time() - start_time
+            signals.log.emit(f"✓ 健康检查通过（{elapsed:.1f} 秒，第 {gate.attempts} 次检查）")
+            return True, "服务健康检查通过"
+        if gate.expired():
+            signals.log.emit(f"✗ 健康检查超时，最后一次输出: {gate.last_output}")
+            return False, f"健康检查未通过: {gate.last_output}"
+        time.sleep(min(0.1, max(0.0, gate.next_check - time.time())))
+
+
+# ============================================================
+# 版本目录发布（release 模式）
+# ============================================================
+# 目录结构：
+#   <base>/releases/<时间戳>/   每次部署上传到新的版本目录，旧版本继续运行
+#   <base>/current -> releases/<时间戳>   上传完成后原子切换软链接
+RELEASE_KEEP_DEFAULT = 5
+
+
+def release_config(project_cfg):
+    """返回项目的 release 配置，未启用时返回 None"""
+    release_cfg = project_cfg.get("release")
+    if not release_cfg or not release_cfg.get("base"):
+        return None
+    return release_cfg
+
+
+def release_target_path(release_cfg, release_dir, remote_path):
+    """把配置中的远程路径映射到版本目录内，不在 base 下的路径返回 None"""
+    base = release_cfg["base"].rstrip("/")
+    for prefix in (f"{base}/current/", f"{base}/"):
+        if remote_path.startswith(prefix):
+            return f"{release_dir}/{remote_path[len(prefix):]}"
+    if not remote_path.startswith("/"):
+        return f"{release_dir}/{remote_path}"
+    return None
+
+
+def new_release_name():
+    """版本目录名：精确到毫秒的时间戳加随机后缀，同一秒内的多次部署互不冲突，按名称排序即按时间排序"""
+    now = time.time()
+    return time.strftime("%Y%m%d%H%M%S", time.localtime(now)) + f"{int(now * 1000) % 1000:03d}-{uuid.uuid4().hex[:6]}"
+
+
+def prepare_release(ssh, release_cfg, release_name=None):
+    """创建新版本目录，并以硬链接复制当前版本（未上传的文件保持不变，几乎不占空间）
+
+    指定 release_name 时可以重复调用（连接中断后重试），不会创建多余的版本目录。
+    """
+    base = release_cfg["base"].rstrip("/")
+    release_dir = f"{base}/releases/{release_name or new_release_name()}"
+    current = f"{base}/current"
+    command = (
+        f"mkdir -p {shlex.quote(release_dir)} && "
+        f"if [ -d {shlex.quote(current)} ]; then "
+        f"cp -alf {shlex.quote(current)}/. {shlex.quote(release_dir)}/ 2>/dev/null || "
+        f"cp -af {shlex.quote(current)}/. {shlex.quote(release_dir)}/; fi"
+    )
+    exit_code, output = run_remote_command(ssh, command)
+    if exit_code != 0:
+        raise Exception(f"创建版本目录失败: {output.strip()}")
+    return release_dir
+
+
+def activate_release(ssh, release_cfg, release_name):
+    """原子切换 current 软链接到指定版本"""
+    base = shlex.quote(release_cfg["base"].rstrip("/"))
+    name = shlex.quote(release_name)
+    command = (
+        f"cd {base} && test -d releases/{name} && "
+        f"ln -sfn releases/{name} .current.tmp && mv -Tf .current.tmp current"
+    )
+    exit_code, output = run_remote_command(ssh, command)
+    if exit_code != 0:
+        raise Exception(f"切换版本失败: {output.strip() or '版本不存在'}")
+
+
+def prune_releases(ssh, release_cfg):
+    """只保留最近 keep 个版本，当前版本永远不会被删除"""
+    keep = int(release_cfg.get("keep", RELEASE_KEEP_DEFAULT))
+    base = shlex.quote(release_cfg["base"].rstrip("/"))
+    command = (
+        f"cd {base}/releases && current=$(basename \"$(readlink ../current)\") && "
+        f"ls -1 | sort -r | tail -n +{keep + 1} | grep -vxF \"$current\" | xargs -r rm -rf --"
+    )
+    run_remote_command(ssh, command)
+
+
+def list_releases(ssh, release_cfg):
+    """返回 (版本列表（新到旧）, 当前版本)"""
+    base = shlex.quote(release_cfg["base"].rstrip("/"))
+    exit_code, output = run_remote_command(
+        ssh, f"ls -1 {base}/releases 2>/dev/null | sort -r; echo ---; basename \"$(readlink {base}/current)\""
+    )
+    releases, _, current = output.partition("---\n")
+    return [name for name in releases.split() if name], current.strip()
+
+
+def rollback_release_worker(server_cfg, project_cfg, release_name, signals, stop_flag=None):
+    """切换到已有版本，并执行重启脚本"""
+    try:
+        release_cfg = release_config(project_cfg)
+        ssh = connect_ssh(server_cfg, stop_flag)
+        try:
+            activate_release(ssh, release_cfg, release_name)
+        finally:
+            ssh.close()
+        signals.log.emit(f"✓ 已切换到版本: {release_name}")
+
+        restart_script = project_cfg.get("scripts", {}).get("restart", "")
+        if restart_script:
+            execute_script_worker(server_cfg, restart_script, signals, stop_flag, project_cfg.get("health_check"))
+            return
+        signals.finished.emit(True, f"已切换到版本 {release_name}")
+    except OperationStopped:
+        signals.finished.emit(False, "操作已停止")
+    except Exception as e:
+        signals.finished.emit(False, f"回滚失败: {str(e)}")
+
+
+# ============================================================
+# 本地文件指纹缓存
+# ============================================================
+FINGERPRINT_FILE = os.path.join(os.path.dirname(os.path.abspath(CONFIG_FILE)), "fingerprints.json")
+HASH_CHUNK_SIZE = 1024 * 1024
+MMAP_HASH_CHUNK_SIZE = 8 * 1024 * 1024
+HASH_MAX_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def _hash_file(path):
+    """计算整个文件的 SHA-256（与服务器上 sha256sum 的结果一致）
+
+    通过 mmap 直接读取页缓存，避免复制到 Python 缓冲区；hashlib 处理大块数据时会释放 GIL，
+    多个文件可以在线程池中并行计算。
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, len(view), MMAP_HASH_CHUNK_SIZE):
+                    digest.update(view[offset:offset + MMAP_HASH_CHUNK_SIZE])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+class FingerprintCache:
+    """本地文件 SHA-256 索引，以 (路径, 大小, 修改时间, inode) 判断文件是否变化
+
+    未变化的文件直接返回缓存的哈希，变化的文件重新计算后增量写回 fingerprints.json。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def lookup(self, path):
+        """返回未变化文件的缓存哈希，没有缓存或文件已变化时返回 None"""
+        path = os.path.abspath(path)
+        key = _stat_key(path)
+        with self._lock:
+            entry = self._load().get(path)
+        if entry and entry["stat"] == key:
+            return entry["sha256"]
+        return None
+
+    def _compute(self, path):
+        key = _stat_key(path)
+        digest = _hash_file(path)
+        # 计算期间文件被修改则不缓存，下次重新计算
+        if _stat_key(path) == key:
+            with self._lock:
+                self._load()[path] = {"stat": key, "sha256": digest}
+                self._dirty = True
+        return digest
+
+    def remember(self, path, stat_key, digest):
+        """记录在其他流程中（如上传时）顺带算出的哈希，文件在此期间未变化才记录"""
+        path = os.path.abspath(path)
+        if _stat_key(path) != stat_key:
+            return
+        with self._lock:
+            self._load()[path] = {"stat": stat_key, "sha256": digest}
+            self._dirty = True
+
+    def sha256_many(self, paths, stop_flag=None):
+        """返回 {路径: 哈希}，缓存未命中的文件并行计算，结束后保存索引"""
+        result = {}
+        missing = []
+        for path in paths:
+            digest = self.lookup(path)
+            if digest:
+                result[path] = digest
+            elif path not in missing:
+                missing.append(path)
+        if missing:
+            if stop_flag and stop_flag.get('stop'):
+                raise OperationStopped()
+            workers = min(HASH_MAX_WORKERS, len(missing))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                digests = executor.map(lambda p: self._compute(os.path.abspath(p)), missing)
+                result.update(zip(missing, digests))
+            self.save()
+        return result
+
+    def sha256(self, path):
+        return self.sha256_many([path])[path]
+
+    def save(self):
+        """原子写入索引文件，并清理已不存在的文件记录"""
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = {path: entry for path, entry in self._entries.items() if os.path.exists(path)}
+            self._entries = entries
+            self._dirty = False
+            # 在锁内写入，并发保存不会共用同一个临时文件
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+fingerprints = FingerprintCache(FINGERPRINT_FILE)
+
+
+def file_sha256(path):
+    return fingerprints.sha256(path)
+
+
+# ============================================================
+# 文件映射解析（目录 / 通配符 + 增量扫描索引）
+# ============================================================
+SCAN_INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(CONFIG_FILE)), "scan_index.json")
+GLOB_CHARS = "*?["
+SCAN_RACY_SECONDS = 2   # 修改时间距扫描时刻太近的目录下次仍重新扫描（同一时间粒度内的变化可能看不出来）
+
+
+def expand_remote_path(local_path, remote_path):
+    """远程路径以 / 结尾表示目录，补上本地文件名"""
+    if remote_path.endswith("/"):
+        return remote_path + os.path.basename(local_path)
+    return remote_path
+
+
+def glob_to_regex(pattern):
+    """通配符转正则：* 不跨目录，** 匹配任意层目录，? 匹配单个字符，[...] 为字符集"""
+    i, parts = 0, []
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            body = pattern[i + 1:end].replace("\\", "\\\\")
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            parts.append(f"[{body}]")
+            i = end + 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile("".join(parts) + r"\Z")
+
+
+class PathFilter:
+    """include / exclude 规则：不含 / 的规则匹配任意层级的名称，含 / 的规则匹配相对路径"""
+
+    def __init__(self, include=None, exclude=None):
+        self.include = [self._compile(p) for p in (include or [])]
+        self.exclude = [self._compile(p) for p in (exclude or [])]
+
+    @staticmethod
+    def _compile(pattern):
+        pattern = pattern.strip().replace("\\", "/").strip("/")
+        return "/" in pattern, glob_to_regex(pattern)
+
+    @staticmethod
+    def _matches(rules, rel_path):
+        name = rel_path.rsplit("/", 1)[-1]
+        return any(regex.match(rel_path if has_slash else name) for has_slash, regex in rules)
+
+    def exclude_paths(self, rel_paths):
+        """按相对路径排除（连同其下的所有内容），不做通配符解释"""
+        for rel_path in rel_paths:
+            self.exclude.append((True, re.compile(re.escape(rel_path.strip("/")) + r"(?:/.*)?$")))
+
+    def excluded(self, rel_path):
+        return self._matches(self.exclude, rel_path)
+
+    def accepts(self, rel_path):
+        if self.excluded(rel_path):
+            return False
+        return not self.include or self._matches(self.include, rel_path)
+
+
+def parse_path_filter(text):
+    """把 "*.js; !*.map" 形式的过滤规则拆成 (include, exclude)"""
+    include, exclude = [], []
+    for rule in text.split(";"):
+        rule = rule.strip()
+        if rule.startswith("!"):
+            if rule[1:].strip():
+                exclude.append(rule[1:].strip())
+        elif rule:
+            include.append(rule)
+    return include, exclude
+
+
+def format_path_filter(include, exclude):
+    return "; ".join(list(include or []) + [f"!{rule}" for rule in exclude or []])
+
+
+class ScanIndex:
+    """目录扫描快照：记录每个目录的修改时间和其中的文件、子目录名，以及每条映射上次解析的结果
+
+    目录的修改时间只在增删、重命名其中的条目时变化，未变化的目录直接复用上次的列表；
+    整棵目录树都没有变化时直接返回上次过滤后的结果，再次解析大目录树只需要对每个目录做一次 stat。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+            self._data.setdefault("trees", {})
+            self._data.setdefault("resolved", {})
+        return self._data
+
+    def scan(self, root, path_filter, tree_key):
+        """返回 (目录快照, 版本号)，目录树有变化时版本号加一；被 exclude 的目录不再深入"""
+        with self._lock:
+            tree = self._load()["trees"].get(tree_key) or {"version": 0, "dirs": {}}
+        cached = tree["dirs"]
+        snapshot = {}
+        changed = False
+        now = time.time()
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            abs_dir = os.path.join(root, rel_dir) if rel_dir else root
+            try:
+                mtime_ns = os.stat(abs_dir).st_mtime_ns
+            except OSError:
+                continue
+            entry = cached.get(rel_dir)
+            if entry and entry[0] == mtime_ns:
+                files, dirs = entry[1], entry[2]
+            else:
+                files, dirs = [], []
+                try:
+                    with os.scandir(abs_dir) as it:
+                        for item in it:
+                            if item.is_dir(follow_symlinks=False):
+                                dirs.append(item.name)
+                            elif item.is_file():
+                                files.append(item.name)
+                except OSError:
+                    continue
+                changed = True
+            racy = now - mtime_ns / 1e9 < SCAN_RACY_SECONDS
+            snapshot[rel_dir] = [None if racy else mtime_ns, files, dirs]
+            prefix = f"{rel_dir}/" if rel_dir else ""
+            for name in dirs:
+                child = prefix + name
+                if not path_filter.excluded(child):
+                    stack.append(child)
+        version = tree["version"]
+        if changed or snapshot.keys() != cached.keys():
+            version += 1
+        if version != tree["version"] or any(entry[0] is None for entry in snapshot.values()):
+            with self._lock:
+                self._load()["trees"][tree_key] = {"version": version, "dirs": snapshot}
+                self._dirty = True
+        return snapshot, version
+
+    @staticmethod
+    def files_of(snapshot):
+        result = []
+        for rel_dir, (_, files, _) in snapshot.items():
+            prefix = f"{rel_dir}/" if rel_dir else ""
+            result.extend(prefix + name for name in files)
+        return result
+
+    def resolved(self, key, version):
+        """同一版本目录树上按相同规则解析过的结果"""
+        with self._lock:
+            entry = self._load()["resolved"].get(key)
+        if entry and entry[0] == version:
+            return entry[1]
+        return None
+
+    def store_resolved(self, key, version, rel_paths):
+        with self._lock:
+            self._load()["resolved"][key] = [version, rel_paths]
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            # 在锁内序列化和写入：扫描线程会同时修改索引，并发保存也不会共用同一个临时文件
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+scan_index = ScanIndex(SCAN_INDEX_FILE)
+
+
+def _split_glob(local_path):
+    """把通配符路径拆成 (不含通配符的基准目录, 相对基准目录的匹配规则)"""
+    parts = local_path.replace("\\", "/").split("/")
+    for i, part in enumerate(parts):
+        if any(ch in part for ch in GLOB_CHARS):
+            return "/".join(parts[:i]) or ".", "/".join(parts[i:])
+    return local_path, None
+
+
+def resolve_file_mappings(project_cfg, signals=None):
+    """把项目的 files 配置展开为 [(本地文件, 远程文件)]
+
+    local 可以是单个文件、目录（递归包含其中所有文件）或通配符（如 dist/**/*.js），
+    目录和通配符按 include / exclude 规则过滤，远程路径为 remote 目录加上相对路径。
+    单个文件即使不存在也会返回，由调用方提示。
+    """
+    mappings = []
+    for file_info in project_cfg.get("files", []):
+        local_path = file_info.get("local", "")
+        remote_path = file_info.get("remote", "")
+        if not local_path or not remote_path:
+            if signals:
+                signals.log.emit(f"⚠ 跳过无效配置: {file_info}")
+            continue
+
+        base, pattern = _split_glob(local_path)
+        if pattern is None and not os.path.isdir(local_path):
+            mappings.append((local_path, expand_remote_path(local_path, remote_path)))
+            continue
+
+        include, exclude = file_info.get("include") or [], file_info.get("exclude") or []
+        path_filter = PathFilter(include, exclude)
+        root = os.path.abspath(base)
+        snapshot, version = scan_index.scan(root, path_filter, json.dumps([root, sorted(exclude)]))
+        key = json.dumps([root, pattern, include, exclude])
+        rel_paths = scan_index.resolved(key, version)
+        if rel_paths is None:
+            pattern_regex = glob_to_regex(pattern) if pattern else None
+            rel_paths = sorted(
+                rel_path for rel_path in scan_index.files_of(snapshot)
+                if (not pattern_regex or pattern_regex.match(rel_path)) and path_filter.accepts(rel_path)
+            )
+            scan_index.store_resolved(key, version, rel_paths)
+
+        local_base = base.rstrip("/\\")
+        remote_base = remote_path.rstrip("/")
+        mappings.extend(
+            (f"{local_base}{os.sep}{rel_path.replace('/', os.sep)}", f"{remote_base}/{rel_path}")
+            for rel_path in rel_paths
+        )
+        if not rel_paths and signals:
+            signals.log.emit(f"⚠ 没有匹配的文件: {local_path}")
+    scan_index.save()
+    return mappings
+
+
+# ============================================================
+# 服务器端内容寻址缓存（CAS）
+# ============================================================
+CAS_DIR = "$HOME/.quickdeploy/cas"
+CAS_MAX_SIZE_MB_DEFAULT = 2048
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def parse_bool(value):
+    """服务器表单中的值保存为字符串，"true"/"1"/"yes"/"on" 视为开启"""
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def cas_config(server_cfg):
+    """服务器的 CAS 配置，未启用时返回 None"""
+    if not server_cfg or not parse_bool(server_cfg.get("cas_enabled", False)):
+        return None
+    try:
+        max_size_mb = float(server_cfg.get("cas_max_size_mb") or CAS_MAX_SIZE_MB_DEFAULT)
+    except ValueError:
+        max_size_mb = CAS_MAX_SIZE_MB_DEFAULT
+    return {"max_size_mb": max_size_mb}
+
+
+def cas_lookup(ssh, hashes):
+    """确认缓存目录，并返回 (缓存目录绝对路径, 已存在的哈希集合)
+
+    哈希较多时分批查询，第一批同时创建缓存目录并输出其绝对路径。
+    """
+    cas_dir, present = None, set()
+    for checks in list(chunk_shell_words(hashes)) or [[]]:
+        prefix = f'mkdir -p "{CAS_DIR}" && cd "{CAS_DIR}" && pwd' if cas_dir is None else f"cd {shlex.quote(cas_dir)}"
+        command = f'{prefix} && for h in {" ".join(checks)}; do [ -f "$h" ] && echo "$h"; done; true'
+        code, output = run_remote_command(ssh, command)
+        lines = output.strip().splitlines()
+        if code != 0 or (cas_dir is None and not lines):
+            raise RuntimeError(f"无法访问服务器缓存目录: {output.strip()}")
+        if cas_dir is None:
+            cas_dir, lines = lines[0].strip(), lines[1:]
+        present.update(line.strip() for line in lines if _SHA256_RE.match(line.strip()))
+    return cas_dir, present
+
+
+def cas_gc_command(cas_dir, max_size_mb):
+    """按最近使用时间（mtime）淘汰最旧的缓存对象，直到总大小不超过上限"""
+    max_kb = int(max_size_mb * 1024)
+    return (
+        f"cd {shlex.quote(cas_dir)} && total=$(du -sk . | cut -f1) && "
+        f"for f in $(ls -1tr | grep -E '^[0-9a-f]{{64}}$'); do "
+        f'[ "$total" -le {max_kb} ] && break; '
+        f'size=$(du -k "$f" | cut -f1); rm -f "$f"; total=$((total - size)); '
+        f"done; true"
+    )
+
+
+def cas_place_files(ssh, sftp, cas_cfg, uploads, signals, stop_flag=None, channels=None):
+    """通过服务器缓存放置文件：缺失的对象才上传，随后在服务器端从缓存复制到目标路径
+
+    复制而不是硬链接：部署后的文件被原地修改时不会改动缓存对象（支持时用 reflink 共享数据块）。
+
+    uploads 为 (本地路径, 远程写入路径) 列表；同一内容在每台服务器上只传输一次。
+    返回未放置的暂存路径集合（目标文件内容已相同，无需替换）。
+    """
+    digests = fingerprints.sha256_many([local_path for local_path, _ in uploads], stop_flag)
+    hashes = [digests[local_path] for local_path, _ in uploads]
+
+    cas_dir, present = cas_lookup(ssh, sorted(set(hashes)))
+    sent = {}
+    for (local_path, target_path), digest in zip(uploads, hashes):
+        if stop_flag and stop_flag.get('stop'):
+            raise OperationStopped()
+        if digest in present or digest in sent:
+            signals.log.emit(f"✓ 服务器缓存命中，跳过传输: {os.path.basename(local_path)} ({digest[:12]})")
+            signals.progress.emit(1)
+            continue
+        # 每次上传使用独立的临时名，多个部署同时写入同一对象时互不影响
+        tmp_object = f"{cas_dir}/{digest}.{uuid.uuid4().hex[:8]}"
+        if channels:
+            channels.upload(local_path, tmp_object, signals, stop_flag)
+        else:
+            upload_file_to_server(sftp, local_path, tmp_object, signals, stop_flag)
+        sent[digest] = tmp_object
+
+    # 校验通过后才放入缓存，缓存中的对象始终与文件名（哈希）一致
+    if channels:
+        channels.verify(ssh)
+    for digest, tmp_object in sent.items():
+        replace_remote_file(sftp, tmp_object, f"{cas_dir}/{digest}")
+
+    # 放置文件和刷新使用时间合并为尽量少的远程命令（按参数长度上限分批）
+    # 目标文件内容已与缓存对象相同时无需替换，直接跳过并输出路径
+    commands = []
+    for (_, target_path), digest in zip(uploads, hashes):
+        obj = shlex.quote(f"{cas_dir}/{digest}")
+        target = shlex.quote(target_path)
+        tmp = shlex.quote(f"{target_path}.qd-part")
+        # 先复制到临时文件再替换：版本目录中的目标是当前版本的硬链接，直接写入会改动线上文件
+        place = (
+            f"{{ {{ cp --reflink=auto -f {obj} {tmp} 2>/dev/null || cp -f {obj} {tmp}; }} && "
+            f"{{ [ ! -e {target} ] || chmod --reference={target} {tmp} 2>/dev/null; true; }} && mv -f {tmp} {target}; }}"
+        )
+        if target_path.endswith(STAGED_SUFFIX):
+            final = shlex.quote(target_path[:-len(STAGED_SUFFIX)])
+            place = f"{{ cmp -s {final} {obj} && echo {target} || {place}; }}"
+        commands.append(f"mkdir -p {shlex.quote(os.path.dirname(target_path))} && {place}")
+    objects = [shlex.quote(f"{cas_dir}/{digest}") for digest in sorted(set(hashes))]
+    commands.extend(f"touch -c {' '.join(chunk)}" for chunk in chunk_shell_words(objects))
+    skipped = set()
+    for chunk in chunk_shell_words(commands):
+        code, output = run_remote_command(ssh, " && ".join(chunk), timeout=120)
+        if code != 0:
+            raise RuntimeError(f"从服务器缓存放置文件失败: {output.strip()}")
+        skipped.update(line.strip() for line in output.splitlines() if line.strip())
+    run_remote_command(ssh, cas_gc_command(cas_dir, cas_cfg["max_size_mb"]), timeout=120)
+    signals.log.emit(f"服务器缓存: {len(uploads)} 个文件，传输 {len(sent)} 个，命中 {len(uploads) - len(sent)} 个")
+    return skipped
+
+
+# ============================================================
+# 自适应传输压缩
+# ============================================================
+COMPRESSION_MODES = ("auto", "on", "off")
+COMPRESSION_SAMPLE_SIZE = 64 * 1024
+COMPRESSION_SAMPLE_COUNT = 4
+COMPRESSION_MIN_FILE_SIZE = 256 * 1024   # 小文件压缩收益有限，直接使用普通通道
+COMPRESSION_MAX_RATIO = 0.8              # 采样压缩率低于该值才使用压缩通道
+
+
+def compression_mode(server_cfg):
+    mode = str((server_cfg or {}).get("compression") or "auto").strip().lower()
+    return mode if mode in COMPRESSION_MODES else "auto"
+
+
+def sample_compression_ratio(path):
+    """在文件中均匀选取几段数据做快速 zlib 压缩，估算压缩后/原始大小之比"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return 1.0
+    count = 1 if size <= COMPRESSION_SAMPLE_SIZE * COMPRESSION_SAMPLE_COUNT else COMPRESSION_SAMPLE_COUNT
+    step = size // count
+    raw = compressed = 0
+    with open(path, "rb") as f:
+        for i in range(count):
+            f.seek(i * step)
+            data = f.read(COMPRESSION_SAMPLE_SIZE if count > 1 else size)
+            raw += len(data)
+            compressed += len(zlib.compress(data, 1))
+    return compressed / raw if raw else 1.0
+
+
+VERIFY_RETRIES = 2
+
+
+def remote_sha256(ssh, remote_paths):
+    """分批远程计算多个文件的 SHA-256，返回 {路径: 哈希}，文件不存在时对应值为 None"""
+    lines = []
+    for quoted in chunk_shell_words([shlex.quote(path) for path in remote_paths]):
+        command = (
+            "command -v sha256sum >/dev/null || { echo 'sha256sum not found'; exit 127; }; "
+            f'for f in {" ".join(quoted)}; do if [ -f "$f" ]; then h=$(sha256sum < "$f" 2>/dev/null | cut -c1-64); '
+            f'echo "${{h:-missing}}"; else echo missing; fi; done'
+        )
+        code, output = run_remote_command(ssh, command, timeout=600)
+        if code == 127:
+            raise RuntimeError("服务器缺少 sha256sum，无法校验上传文件（可在项目中设置 \"verify\": false 关闭校验）")
+        chunk_lines = output.strip().splitlines()
+        if code != 0 or len(chunk_lines) != len(quoted):
+            raise RuntimeError(f"远程校验失败: {output.strip()[-300:]}")
+        lines.extend(chunk_lines)
+    return {path: (line if _SHA256_RE.match(line) else None) for path, line in zip(remote_paths, lines)}
+
+
+class TransferChannels:
+    """为每个文件选择普通或启用 SSH 压缩的 SFTP 通道，并统计压缩带来的收益
+
+    SSH 压缩在连接建立时协商，因此压缩通道使用连接池中同一服务器的另一条连接。
+    """
+
+    def __init__(self, server_cfg, sftp, signals, stop_flag=None, verify=True):
+        self.server_cfg = server_cfg
+        self.mode = compression_mode(server_cfg) if server_cfg and not is_local_server(server_cfg) else "off"
+        self.local = isinstance(sftp, LocalSFTPClient)
+        self.raw_sftp = sftp
+        self.signals = signals
+        self.stop_flag = stop_flag
+        self.verify_enabled = verify
+        self.pending = {}  # 待校验的远程路径 -> (本地路径, 传输时计算的 SHA-256)
+        self._compressed_sftp = None
+        self.compressed_files = 0
+        self.compressed_bytes = 0
+        self.saved_bytes = 0
+        self.saved_seconds = 0.0
+
+    def _choose(self, local_path):
+        """返回 (是否压缩, 预估压缩率)；不可能使用压缩通道时不读取采样数据"""
+        if self.mode == "off":
+            return False, 1.0
+        if self.mode == "auto" and os.path.getsize(local_path) < COMPRESSION_MIN_FILE_SIZE:
+            return False, 1.0
+        ratio = sample_compression_ratio(local_path)
+        if self.mode == "on":
+            return True, ratio
+        return ratio < COMPRESSION_MAX_RATIO, ratio
+
+    def _compressed(self):
+        if self._compressed_sftp is None:
+            ssh = ssh_pool.get(dict(self.server_cfg, _compress=True), self.stop_flag)
+            self._compressed_sftp = ssh.open_sftp()
+        return self._compressed_sftp
+
+    def upload(self, local_path, remote_path, signals=None, stop_flag=None):
+        signals = signals or self.signals
+        stat_key = _stat_key(local_path)
+        digest = hashlib.sha256()
+        use_compression, ratio = self._choose(local_path)
+        if self.local:
+            # 本机复制不经过用户态，哈希取自指纹缓存（未变化的文件不需要重新读取）
+            elapsed = upload_file_to_server(self.raw_sftp, local_path, remote_path, signals, stop_flag)
+            self._sent(local_path, remote_path, stat_key, fingerprints.sha256(local_path))
+            return elapsed
+        if not use_compression:
+            elapsed = upload_file_to_server(self.raw_sftp, local_path, remote_path, signals, stop_flag, digest)
+            self._sent(local_path, remote_path, stat_key, digest.hexdigest())
+            if self.server_cfg:
+                throughput_history.record(self.server_cfg, stat_key[0], elapsed)
+            return elapsed
+
+        signals.log.emit(f"  使用压缩通道（采样压缩率 {ratio:.0%}）")
+        elapsed = upload_file_to_server(self._compressed(), local_path, remote_path, signals, stop_flag, digest)
+        self._sent(local_path, remote_path, stat_key, digest.hexdigest())
+        size = os.path.getsize(local_path)
+        self.compressed_files += 1
+        self.compressed_bytes += size
+        self.saved_bytes += size * (1 - ratio)
+        # 按当前链路速度估算：不压缩时传输量为 1/ratio 倍
+        self.saved_seconds += elapsed * (1 / max(ratio, 0.01) - 1)
+        return elapsed
+
+    def rebind(self, sftp):
+        """连接中断重连后改用新的 SFTP 通道，压缩通道所在的连接也一并丢弃"""
+        self.raw_sftp = sftp
+        if self._compressed_sftp is not None:
+            try:
+                self._compressed_sftp.close()
+            except Exception:
+                pass
+            self._compressed_sftp = None
+            ssh_pool.discard(dict(self.server_cfg, _compress=True))
+
+    def _sent(self, local_path, remote_path, stat_key, hexdigest):
+        # 传输时已读过一遍文件，顺便更新指纹缓存
+        fingerprints.remember(local_path, stat_key, hexdigest)
+        self.pending[remote_path] = (local_path, hexdigest)
+
+    def expect(self, remote_path, local_path):
+        """登记非本通道上传（如跳板机中转）的文件，一并校验"""
+        self.pending[remote_path] = (local_path, fingerprints.sha256(local_path))
+
+    def verify(self, ssh):
+        """一次远程 sha256sum 校验所有已上传文件，不一致的自动重传，重试后仍不一致则抛出异常"""
+        if not self.verify_enabled:
+            self.pending = {}
+            return
+        total = len(self.pending)
+        for attempt in range(VERIFY_RETRIES + 1):
+            pending, self.pending = self.pending, {}
+            if not pending:
+                return
+            try:
+                remote_hashes = remote_sha256(ssh, list(pending))
+                mismatched = [path for path, (_, digest) in pending.items() if remote_hashes.get(path) != digest]
+                if not mismatched:
+                    self.signals.log.emit(f"✓ 完整性校验通过: {total} 个文件")
+                    return
+                if attempt == VERIFY_RETRIES:
+                    raise RuntimeError(f"文件校验不一致: {', '.join(mismatched)}")
+                for remote_path in mismatched:
+                    if self.stop_flag and self.stop_flag.get('stop'):
+                        raise OperationStopped()
+                    local_path = pending[remote_path][0]
+                    self.signals.log.emit(f"⚠ 校验不一致，重新上传: {remote_path}")
+                    # 重传不再计入文件进度
+                    self.upload(local_path, remote_path, MutedProgressSignals(self.signals), self.stop_flag)
+            except Exception:
+                # 连接中断后重试时这些文件仍需校验
+                self.pending = {**pending, **self.pending}
+                raise
+
+    def report(self):
+        if self.compressed_files:
+            self.signals.log.emit(
+                f"压缩传输 {self.compressed_files} 个文件 ({self.compressed_bytes / 1024 / 1024:.2f}MB)，"
+                f"预计节省流量 {self.saved_bytes / 1024 / 1024:.2f}MB，节省时间约 {self.saved_seconds:.1f} 秒"
+            )
+
+    def close(self):
+        if self._compressed_sftp is not None:
+            self._compressed_sftp.close()
+            self._compressed_sftp = None
+        fingerprints.save()
+
+
+# ============================================================
+# 压缩包增量上传（jar / war / zip）
+# ============================================================
+ARCHIVE_DELTA_EXTENSIONS = (".jar", ".war", ".zip")
+ARCHIVE_DELTA_MAX_RATIO = 0.5   # 补丁超过原文件一半大小时直接整包上传
+DELTA_MANIFEST_NAME = "__quickdeploy_delta__.json"
+
+# 在服务器上按本地条目顺序重建压缩包：未变化的条目取自旧包，变化的条目取自补丁包，
+# 最后逐条校验 CRC32，任何不一致都以非零退出码结束
+ARCHIVE_REBUILD_SCRIPT = r"""
+import json, shutil, sys, zipfile
+old_path, patch_path, out_path, manifest_name = sys.argv[1:5]
+with zipfile.ZipFile(old_path) as old, zipfile.ZipFile(patch_path) as patch:
+    manifest = json.loads(patch.read(manifest_name))
+    with zipfile.ZipFile(out_path, "w") as out:
+        for entry in manifest["entries"]:
+            source = patch if entry["patch"] else old
+            info = zipfile.ZipInfo(entry["name"], tuple(entry["date_time"]))
+            info.compress_type = entry["compress_type"]
+            info.external_attr = entry["external_attr"]
+            info.create_system = entry["create_system"]
+            info.file_size = entry["size"]
+            with source.open(entry["name"]) as src, out.open(info, "w", force_zip64=entry["size"] >= 1 << 31) as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+        out.comment = manifest["comment"].encode("latin-1")
+with zipfile.ZipFile(out_path) as rebuilt:
+    actual = [(i.filename, i.CRC, i.file_size) for i in rebuilt.infolist()]
+    expected = [(e["name"], e["crc"], e["size"]) for e in manifest["entries"]]
+    if actual != expected:
+        sys.exit("rebuilt archive does not match local entries")
+    bad = rebuilt.testzip()
+    if bad:
+        sys.exit("CRC check failed: " + bad)
+"""
+
+
+class _NullSignal:
+    def emit(self, *args):
+        pass
+
+
+class MutedProgressSignals:
+    """转发日志但忽略进度，用于不单独计入文件进度的辅助传输"""
+
+    def __init__(self, signals):
+        self.log = signals.log
+        self.finished = signals.finished
+        self.progress = _NullSignal()
+        self.progress_max = _NullSignal()
+
+
+def archive_delta_enabled(project_cfg, local_path):
+    return bool(project_cfg.get("archive_delta")) and local_path.lower().endswith(ARCHIVE_DELTA_EXTENSIONS)
+
+
+def read_remote_entries(sftp, remote_path):
+    """通过可随机读取的 SFTP 文件只读取远程压缩包的中央目录，返回 {条目名: (CRC32, 大小)}"""
+    with sftp.open(remote_path, "rb") as f:
+        with zipfile.ZipFile(f) as zf:
+            return {info.filename: (info.CRC, info.file_size) for info in zf.infolist()}
+
+
+def build_archive_patch(local_path, remote_entries, patch_path):
+    """生成只包含变化条目的补丁包，返回变化条目数；本地包带前置脚本等无法按条目重建时返回 None"""
+    changed = 0
+    with zipfile.ZipFile(local_path) as local:
+        infos = local.infolist()
+        if infos and min(info.header_offset for info in infos) > 0:
+            return None
+        entries = []
+        with zipfile.ZipFile(patch_path, "w") as patch:
+            for info in infos:
+                is_changed = remote_entries.get(info.filename) != (info.CRC, info.file_size)
+                if is_changed:
+                    changed += 1
+                    item = zipfile.ZipInfo(info.filename, info.date_time)
+                    item.compress_type = info.compress_type
+                    item.external_attr = info.external_attr
+                    with local.open(info) as src, patch.open(item, "w", force_zip64=info.file_size >= 1 << 31) as dst:
+                        shutil.copyfileobj(src, dst, HASH_CHUNK_SIZE)
+                entries.append({
+                    "name": info.filename,
+                    "patch": is_changed,
+                    "crc": info.CRC,
+                    "size": info.file_size,
+                    "date_time": list(info.date_time),
+                    "compress_type": info.compress_type,
+                    "external_attr": info.external_attr,
+                    "create_system": info.create_system,
+                })
+            manifest = {"entries": entries, "comment": local.comment.decode("latin-1")}
+            patch.writestr(DELTA_MANIFEST_NAME, json.dumps(manifest))
+    return changed
+
+
+def upload_archive_delta(ssh, sftp, local_path, target_path, base_path, signals, stop_flag=None, channels=None):
+    """按条目增量上传压缩包：对比远程旧包的中央目录，只传输变化的条目，由服务器上的 python3 重建
+
+    旧包不存在、服务器没有 python3、补丁收益不大或重建校验失败时退化为整包上传。
+    重建后的压缩包条目内容与本地一致（CRC 逐条校验），但压缩字节不保证与本地文件完全相同，
+    因此不参与整文件 SHA-256 校验；整包上传时经 channels 上传并校验。
+    """
+    file_name = os.path.basename(local_path)
+    full_upload = channels.upload if channels else partial(upload_file_to_server, sftp)
+    try:
+        remote_entries = read_remote_entries(sftp, base_path)
+    except (IOError, zipfile.BadZipFile):
+        remote_entries = None
+    if not remote_entries:
+        full_upload(local_path, target_path, signals, stop_flag)
+        return
+
+    code, _ = run_remote_command(ssh, "command -v python3")
+    if code != 0:
+        signals.log.emit(f"⚠ 服务器没有 python3，{file_name} 改为整包上传")
+        full_upload(local_path, target_path, signals, stop_flag)
+        return
+
+    fd, patch_local = tempfile.mkstemp(suffix=".zip", prefix="qd-delta-")
+    os.close(fd)
+    patch_remote = f"{target_path}.qd-delta"
+    rebuilt_remote = f"{target_path}.qd-rebuild"
+    try:
+        try:
+            changed = build_archive_patch(local_path, remote_entries, patch_local)
+        except zipfile.BadZipFile:
+            changed = None
+        local_size = os.path.getsize(local_path)
+        if changed is None or os.path.getsize(patch_local) > local_size * ARCHIVE_DELTA_MAX_RATIO:
+            full_upload(local_path, target_path, signals, stop_flag)
+            return
+
+        patch_size = os.path.getsize(patch_local)
+        signals.log.emit(
+            f"增量上传 {file_name}: {changed} 个条目变化，补丁 {patch_size / 1024:.1f}KB / 原文件 {local_size / 1024 / 1024:.2f}MB"
+        )
+        upload_file_to_server(sftp, patch_local, patch_remote, MutedProgressSignals(signals), stop_flag)
+        command = (
+            f"python3 - {shlex.quote(base_path)} {shlex.quote(patch_remote)} "
+            f"{shlex.quote(rebuilt_remote)} {DELTA_MANIFEST_NAME} <<'QD_EOF'\n{ARCHIVE_REBUILD_SCRIPT}\nQD_EOF"
+        )
+        code, output = run_remote_command(ssh, command, timeout=300)
+        if code == 0:
+            replace_remote_file(sftp, rebuilt_remote, target_path)
+            signals.progress.emit(1)
+            signals.log.emit(f"✓ 服务器重建并校验完成: {target_path}")
+            return
+        signals.log.emit(f"⚠ 服务器重建 {file_name} 失败，改为整包上传: {output.strip()[-300:]}")
+        run_remote_command(ssh, f"rm -f {shlex.quote(rebuilt_remote)}")
+        full_upload(local_path, target_path, signals, stop_flag)
+    finally:
+        os.remove(patch_local)
+        try:
+            sftp.remove(patch_remote)
+        except IOError:
+            pass
+
+
+# ============================================================
+# 跳板机中转上传（relay）
+# ============================================================
+RELAY_DIR = "$HOME/.quickdeploy/relay"
+RELAY_KEEP_MINUTES = 24 * 60
+_relay_locks = {}
+_relay_locks_guard = threading.Lock()
+
+
+def _relay_lock(bastion_cfg, digest):
+    """同一跳板机上的同一文件只上传一次，滚动部署并发暂存时其余服务器等待"""
+    key = (SSHConnectionPool.key_of(bastion_cfg), digest)
+    with _relay_locks_guard:
+        return _relay_locks.setdefault(key, threading.Lock())
+
+
+def relay_upload(server_cfg, local_path, target_path, signals, stop_flag=None):
+    """先把文件上传到跳板机（相同内容只传一次），再由跳板机通过内网复制到目标服务器
+
+    跳板机到目标服务器需配置免密登录（ssh BatchMode），复制失败时返回 False，由调用方改为经隧道直接上传。
+    """
+    bastion_cfg = resolve_via(server_cfg)
+    bastion = ssh_pool.get(bastion_cfg, stop_flag)
+    file_name = os.path.basename(local_path)
+    digest = file_sha256(local_path)
+
+    with _relay_lock(bastion_cfg, digest):
+        code, output = run_remote_command(
+            bastion,
+            f'mkdir -p "{RELAY_DIR}" && cd "{RELAY_DIR}" && pwd && '
+            f'find . -maxdepth 1 -type f -mmin +{RELAY_KEEP_MINUTES} -delete; '
+            f'[ -f {digest} ] && echo present; true'
+        )
+        lines = output.strip().splitlines()
+        if code != 0 or not lines:
+            signals.log.emit(f"⚠ 跳板机中转目录不可用，{file_name} 改为经隧道上传: {output.strip()}")
+            return False
+        relay_path = f"{lines[0].strip()}/{digest}"
+        if "present" not in lines[1:]:
+            sftp = bastion.open_sftp()
+            try:
+                upload_file_to_server(sftp, local_path, relay_path, MutedProgressSignals(signals), stop_flag)
+            finally:
+                sftp.close()
+        else:
+            signals.log.emit(f"✓ 跳板机已有 {file_name}，跳过广域网传输")
+
+    if stop_flag and stop_flag.get('stop'):
+        raise OperationStopped()
+    target = shlex.quote(target_path)
+    tmp = shlex.quote(f"{target_path}.qd-part")
+    remote_script = (
+        f"mkdir -p {shlex.quote(os.path.dirname(target_path))} && cat > {tmp} && "
+        f"{{ [ ! -e {target} ] || chmod --reference={target} {tmp} 2>/dev/null; true; }} && mv -f {tmp} {target}"
+    )
+    command = (
+        f"ssh -o BatchMode=yes -o ConnectTimeout=10 -p {int(server_cfg['port'])} "
+        f"{shlex.quote(server_cfg['username'] + '@' + server_cfg['host'])} {shlex.quote(remote_script)} "
+        f"< {shlex.quote(relay_path)}"
+    )
+    code, output = run_remote_command(bastion, command, timeout=600)
+    if code != 0:
+        signals.log.emit(f"⚠ 跳板机复制 {file_name} 失败，改为经隧道上传: {output.strip()[-300:]}")
+        return False
+    signals.progress.emit(1)
+    signals.log.emit(f"✓ 跳板机中转完成: {file_name} -> {target_path}")
+    return True
+
+
+STAGED_SUFFIX = ".qd-staged"
+
+
+class StagedUpload:
+    """逐个加入文件并上传（不生效），上传过程与文件解析可以同时进行
+
+    - release 模式：上传到新版本目录，生效时切换 current 软链接
+    - 普通模式：上传为 <远程路径>.qd-staged，生效时统一重命名覆盖目标文件
+    - 服务器启用内容寻址缓存（cas_enabled）时需要先批量查询缓存，文件在 finish_transfer 中统一处理
+    - 服务器经跳板机连接且启用 relay 时，文件先上传到跳板机，再由跳板机复制到目标服务器
+    """
+
+    def __init__(self, ssh, sftp, project_cfg, signals, stop_flag=None, server_cfg=None, total=None,
+                 release_name=None):
+        self.ssh = ssh
+        self.sftp = sftp
+        self.project_cfg = project_cfg
+        self.signals = signals
+        self.stop_flag = stop_flag
+        self.server_cfg = server_cfg
+        self.cas_cfg = cas_config(server_cfg)
+        self.relay = bool(server_cfg and server_cfg.get("via") and parse_bool(server_cfg.get("relay", False)))
+        self.release_cfg = release_config(project_cfg)
+        release_dir = prepare_release(ssh, self.release_cfg, release_name) if self.release_cfg else None
+        if release_dir:
+            signals.log.emit(f"release 模式，上传到新版本目录: {release_dir}")
+        if total is None:
+            signals.log.emit("开始上传项目文件...")
+        else:
+            signals.log.emit(f"开始上传项目文件，共 {total} 个文件...")
+
+        self.staged = {"release_dir": release_dir, "renames": [], "uploaded": 0}
+        self.cas_uploads = []  # (本地路径, 远程写入路径)
+        self.channels = TransferChannels(server_cfg, sftp, signals, stop_flag, verify=project_cfg.get("verify", True))
+
+    def add(self, local_path, remote_path):
+        """加入一个文件，未启用缓存时立即上传"""
+        job = self.register(local_path, remote_path)
+        if job:
+            self.transfer(*job)
+
+    def register(self, local_path, remote_path):
+        """登记文件的暂存位置，返回 transfer 的参数；本地文件不存在或启用缓存（在 finish_transfer 中处理）时返回 None"""
+        if not os.path.exists(local_path):
+            self.signals.log.emit(f"✗ 本地文件不存在: {local_path}")
+            return None
+
+        delta_base = None
+        release_dir = self.staged["release_dir"]
+        target_path = release_target_path(self.release_cfg, release_dir, remote_path) if release_dir else None
+        if target_path is not None:
+            # 新版本目录以硬链接复制了当前版本，目标路径本身就是旧文件
+            delta_base = target_path
+        else:
+            if release_dir:
+                self.signals.log.emit(f"⚠ {remote_path} 不在 release.base 下，按普通模式上传")
+            target_path = remote_path + STAGED_SUFFIX
+            self.staged["renames"].append(remote_path)
+            delta_base = remote_path
+        self.staged["uploaded"] += 1
+
+        if self.cas_cfg:
+            self.cas_uploads.append((local_path, target_path))
+            return None
+        return local_path, target_path, delta_base
+
+    def transfer(self, local_path, target_path, delta_base):
+        """上传一个已登记的文件；连接中断时可在 rebind 后重新调用"""
+        if self.stop_flag and self.stop_flag.get('stop'):
+            raise OperationStopped()
+        if archive_delta_enabled(self.project_cfg, local_path):
+            upload_archive_delta(
+                self.ssh, self.sftp, local_path, target_path, delta_base, self.signals, self.stop_flag, self.channels
+            )
+        elif self.relay and relay_upload(self.server_cfg, local_path, target_path, self.signals, self.stop_flag):
+            self.channels.expect(target_path, local_path)
+        else:
+            self.channels.upload(local_path, target_path, self.signals, self.stop_flag)
+
+    def finish_transfer(self):
+        """所有文件加入后调用：启用缓存时在此查询缓存、上传缺失的内容并放置到位"""
+        if self.cas_cfg:
+            unchanged = cas_place_files(
+                self.ssh, self.sftp, self.cas_cfg, self.cas_uploads, self.signals, self.stop_flag, self.channels
+            )
+            self.staged["renames"] = [
+                path for path in self.staged["renames"] if path + STAGED_SUFFIX not in unchanged
+            ]
+
+    def rebind(self, ssh, sftp):
+        """重新连接后切换到新连接：已上传的文件保留在服务器上，之后只上传剩余的文件"""
+        self.ssh = ssh
+        self.sftp = sftp
+        self.channels.rebind(sftp)
+
+    def verify(self):
+        """完整性校验，不一致的文件自动重传（缓存模式在放置前已校验）"""
+        try:
+            if not self.cas_cfg:
+                self.channels.verify(self.ssh)
+            self.channels.report()
+        finally:
+            self.close()
+
+    def close(self):
+        self.channels.close()
+
+
+def stage_project_files(ssh, sftp, project_cfg, signals, stop_flag=None, server_cfg=None, mappings=None):
+    """上传项目文件但不生效，返回暂存信息供 activate_staged_files 使用
+
+    mappings 为已解析的文件映射（滚动部署时各服务器共用），为空时在此解析。
+    所有文件通过完整性校验后才返回，部署脚本不会在文件不一致时执行。
+    """
+    if mappings is None:
+        mappings = resolve_file_mappings(project_cfg, signals)
+        signals.progress_max.emit(len(mappings))
+    upload = StagedUpload(ssh, sftp, project_cfg, signals, stop_flag, server_cfg, total=len(mappings))
+    try:
+        for local_path, remote_path in mappings:
+            upload.add(local_path, remote_path)
+        upload.finish_transfer()
+        upload.verify()
+    except BaseException:
+        # 已上传的暂存文件不会再生效，尽量清理（连接已断开时忽略）
+        try:
+            discard_staged_files(ssh, sftp, upload.staged)
+        except Exception:
+            pass
+        raise
+    finally:
+        upload.close()
+    return upload.staged
+
+
+def activate_staged_files(ssh, sftp, project_cfg, staged, signals):
+    """让暂存的文件生效，返回生效的文件数；连接中断后重新调用时从尚未生效的文件继续"""
+    renames = staged["renames"]
+    while staged.setdefault("renamed", 0) < len(renames):
+        remote_path = renames[staged["renamed"]]
+        replace_remote_file(sftp, remote_path + STAGED_SUFFIX, remote_path)
+        staged["renamed"] += 1
+
+    release_dir = staged["release_dir"]
+    if release_dir:
+        release_cfg = release_config(project_cfg)
+        release_name = os.path.basename(release_dir)
+        if staged.get("activated_release") != release_dir:
+            activate_release(ssh, release_cfg, release_name)
+            # 已切换后版本目录就是线上版本，之后清理旧版本失败或停止时不能再删除它
+            staged["activated_release"] = release_dir
+            signals.log.emit(f"✓ 已切换 current -> releases/{release_name}")
+        prune_releases(ssh, release_cfg)
+    return staged["uploaded"]
+
+
+def discard_staged_files(ssh, sftp, staged):
+    """放弃未生效的暂存文件（部署中止时调用），连同中断上传留下的临时文件一起删除
+
+    用一条远程命令删除：停止时 SFTP 通道可能已被关闭。current 已切换到的版本目录不会删除。
+    """
+    paths = [remote_path + STAGED_SUFFIX + suffix for remote_path in staged["renames"] for suffix in ("", ".qd-part")]
+    for quoted in chunk_shell_words([shlex.quote(path) for path in paths]):
+        run_remote_command(ssh, "rm -f " + " ".join(quoted))
+    if staged["release_dir"] and staged.get("activated_release") != staged["release_dir"]:
+        run_remote_command(ssh, f"rm -rf {shlex.quote(staged['release_dir'])}")
+
+
+def activate_or_discard_staged(ssh, sftp, project_cfg, staged, signals):
+    """生效暂存的文件，失败时删除尚未生效的暂存文件（版本目录可能已被切换，留给版本清理处理）"""
+    try:
+        return activate_staged_files(ssh, sftp, project_cfg, staged, signals)
+    except BaseException:
+        with contextlib.suppress(Exception):
+            discard_staged_files(ssh, sftp, dict(staged, release_dir=None))
+        raise
+
+
+def upload_project_files(ssh, sftp, project_cfg, signals, stop_flag=None, server_cfg=None):
+    """上传项目配置的所有文件，全部上传完成后统一生效，返回生效的文件数"""
+    signals.progress.emit(0)
+    staged = stage_project_files(ssh, sftp, project_cfg, signals, stop_flag, server_cfg)
+    return activate_staged_files(ssh, sftp, project_cfg, staged, signals)
+
+
+def run_deploy_script(ssh, deploy_script, signals, stop_flag=None):
+    """在远程执行部署脚本并实时输出日志，返回退出码；停止时发送 Ctrl+C 并抛出 OperationStopped"""
+    signals.log.emit(f"执行命令: {deploy_script}")
+    # 使用 get_pty=True 获取实时输出
+    stdin, stdout, stderr = ssh.exec_command(deploy_script, get_pty=True)
+    
+    # 实时读取输出（按块读取，没有换行的输出也不会阻塞停止检查）
+    stream = ChannelLineStream(stdout.channel)
+    while True:
+        if stop_flag and stop_flag.get('stop'):
+            # 尝试发送 Ctrl+C
+            stdin.write('\x03')
+            stdin.channel.close()
+            raise OperationStopped()
+
+        if stdout.channel.recv_ready():
+            for line in stream.read_lines():
+                signals.log.emit(line)
+            if stream.eof:
+                break
+        elif stdout.channel.exit_status_ready():
+            break
+        else:
+            time.sleep(0.1)
+    partial = stream.take_partial()
+    if partial.strip():
+        signals.log.emit(partial)
+    return stdout.channel.recv_exit_status()
+
+
+def run_deploy_and_health(ssh, project_cfg, signals, stop_flag=None):
+    """执行部署脚本并等待健康检查，返回 (是否成功, 消息)"""
+    deploy_script = project_cfg.get("scripts", {}).get("deploy", "")
+    if deploy_script:
+        exit_code = run_deploy_script(ssh, deploy_script, signals, stop_flag)
+        if exit_code != 0:
+            return False, f"部署脚本执行失败，退出码: {exit_code}"
+
+    # 部署后等待服务就绪
+    health_cfg = project_cfg.get("health_check")
+    if health_cfg:
+        return wait_for_healthy(ssh, health_cfg, signals, stop_flag)
+    return True, "部署完成"
+
+
+# ============================================================
+# 部署预检（与本地构建同时进行，在构建和上传之前发现服务器问题）
+# ============================================================
+PREFLIGHT_SPACE_MARGIN = 1.2                   # 预计占用空间的余量系数
+PREFLIGHT_RESERVE_BYTES = 64 * 1024 * 1024     # 上传后分区至少保留的可用空间
+
+
+def preflight_targets(project_cfg):
+    """估算每个远程目标目录需要的空间，返回 {远程目录: 字节数}
+
+    构建尚未完成，按本地现有文件（上次构建的产物）估算；目录和通配符映射以 remote 目录为目标，
+    release 模式以 release.base 为目标（新版本目录在其下创建）。
+    """
+    release_cfg = release_config(project_cfg)
+    if release_cfg:
+        targets = {release_cfg["base"].rstrip("/") or "/": 0}
+    else:
+        targets = {}
+        for file_info in project_cfg.get("files", []):
+            local_path, remote_path = file_info.get("local", ""), file_info.get("remote", "")
+            if not local_path or not remote_path:
+                continue
+            base, pattern = _split_glob(local_path)
+            if pattern is None and not os.path.isdir(local_path):
+                target = posixpath.dirname(expand_remote_path(local_path, remote_path))
+            else:
+                target = remote_path.rstrip("/")
+            targets.setdefault(target or "/", 0)
+    # 文件归入最长的匹配目标目录
+    ordered = sorted(targets, key=len, reverse=True)
+    for local_path, remote_path in resolve_file_mappings(project_cfg):
+        try:
+            size = os.path.getsize(local_path)
+        except OSError:
+            continue
+        target = next((t for t in ordered if remote_path.startswith(t.rstrip("/") + "/")), None)
+        if target is not None:
+            targets[target] += size
+    return targets
+
+
+def preflight_check(ssh, project_cfgs):
+    """一次远程命令检查目标目录的写权限、所在分区的可用空间和所需命令，返回问题列表（为空表示通过）
+
+    project_cfgs 为部署到这台服务器的所有项目，同一分区上的空间需求会累加。
+    """
+    targets = {}
+    tools = set()
+    for project_cfg in project_cfgs:
+        for target, size in preflight_targets(project_cfg).items():
+            targets[target] = targets.get(target, 0) + size
+        if project_cfg.get("verify", True):
+            tools.add("sha256sum")
+    if not targets:
+        return []
+
+    # 目录尚不存在时检查最近的已存在上级目录（上传时由它创建子目录）
+    quoted = " ".join(shlex.quote(target) for target in targets)
+    command = (
+        f'for d in {quoted}; do p="$d"; while [ ! -e "$p" ]; do p=$(dirname "$p"); done; '
+        f'[ -w "$p" ] && w=1 || w=0; echo "$w $(df -Pk "$p" 2>/dev/null | awk \'NR==2 {{print $4, $6}}\')"; done; '
+        f'echo "--"; for t in {" ".join(sorted(tools))}; do command -v "$t" >/dev/null 2>&1 || echo "$t"; done'
+    )
+    code, output = run_remote_command(ssh, command + "; true")
+    lines = output.splitlines()
+    if "--" not in lines or lines.index("--") != len(targets):
+        raise RuntimeError(f"预检查询失败: {output.strip()[-300:]}")
+
+    problems = []
+    mounts = {}  # 挂载点 -> [可用字节数, 预计需要的字节数]
+    for (target, size), line in zip(targets.items(), lines):
+        fields = line.split(None, 2)
+        if fields[0] != "1":
+            problems.append(f"没有写权限: {target}")
+        if len(fields) == 3 and fields[1].isdigit():
+            mount = mounts.setdefault(fields[2], [int(fields[1]) * 1024, 0])
+            mount[1] += size
+    for mount_point, (available, needed) in mounts.items():
+        required = int(needed * PREFLIGHT_SPACE_MARGIN) + PREFLIGHT_RESERVE_BYTES
+        if available < required:
+            problems.append(
+                f"{mount_point} 可用空间 {_format_size(available)}，预计需要 {_format_size(required)}"
+            )
+    missing = lines[lines.index("--") + 1:]
+    if missing:
+        problems.append(f"缺少命令: {', '.join(missing)}（可在项目中设置 \"verify\": false 关闭校验）")
+    return problems
+
+
+def preflight_enabled(project_cfg):
+    return parse_bool(project_cfg.get("preflight", True)) and bool(project_cfg.get("files"))
+
+
+def _preflight_server(server_cfg, project_cfgs):
+    ssh = ssh_pool.get(server_cfg)
+    try:
+        return preflight_check(ssh, project_cfgs)
+    except Exception:
+        ssh_pool.discard(server_cfg)
+        raise
+
+
+async def preflight_servers(hosts, signals, build_flag=None):
+    """并发预检多台服务器，hosts 为 {服务器名: (服务器配置, [项目配置])}，返回失败说明列表
+
+    任一服务器未通过时停止 build_flag，正在执行的本地构建随之中止。
+    """
+    async def check(name, server_cfg, project_cfgs):
+        try:
+            async with orchestrator.session(server_cfg):
+                problems = await orchestrator.blocking(_preflight_server, server_cfg, project_cfgs)
+        except Exception as e:
+            problems = [f"预检失败: {str(e) or e.__class__.__name__}"]
+        if problems:
+            signals.log.emit(f"✗ [{name}] 预检未通过: {'；'.join(problems)}")
+            if build_flag is not None:
+                request_stop(build_flag)
+            return f"{name}: {'；'.join(problems)}"
+        signals.log.emit(f"✓ [{name}] 预检通过")
+        return None
+
+    results = await asyncio.gather(*(
+        check(name, server_cfg, project_cfgs) for name, (server_cfg, project_cfgs) in hosts.items()
+    ))
+    return [result for result in results if result]
+
+
+def run_build_with_preflight(pre_commands, hosts, signals, stop_flag=None):
+    """执行本地构建，同时在后台预检所有服务器；返回 (是否成功, 失败消息)"""
+    build_flag = linked_stop_flag(stop_flag)
+    try:
+        preflight = orchestrator.submit(preflight_servers(hosts, signals, build_flag)) if hosts else None
+        built = True
+        if pre_commands:
+            built = execute_local_commands(pre_commands, signals, build_flag)
+        failures = preflight.result() if preflight else []
+    finally:
+        unlink_stop_flag(build_flag)
+    if is_stopped(stop_flag):
+        raise OperationStopped()
+    if failures:
+        return False, f"预检未通过: {'；'.join(failures)}"
+    if not built:
+        return False, "前置命令执行失败"
+    return True, ""
+
+
+# ============================================================
+# 失败重试（按阶段配置，指数退避 + 随机抖动）
+# ============================================================
+RETRY_PHASE_NAMES = {"connect": "连接", "transfer": "传输", "exec": "执行", "health": "健康检查"}
+# 脚本可能已执行了一部分，默认不重试；健康检查本身会轮询到超时，重试会让等待时间成倍增加，默认也不重试
+RETRY_DEFAULT_ATTEMPTS = {"connect": 3, "transfer": 3, "exec": 1, "health": 1}
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+RETRY_JITTER = 0.5    # 每次等待时间随机缩短至多 50%，避免多台服务器同时重连
+
+
+class RetryPolicy:
+    """单个阶段的重试策略，attempts 为总尝试次数（1 表示不重试）"""
+
+    def __init__(self, attempts=1, delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY, jitter=RETRY_JITTER):
+        self.attempts = max(1, int(attempts))
+        self.delay = float(delay)
+        self.max_delay = float(max_delay)
+        self.jitter = min(max(float(jitter), 0.0), 1.0)
+
+    @classmethod
+    def for_phase(cls, project_cfg, phase):
+        """项目 retry 配置中的阶段策略，如 {"transfer": {"attempts": 5, "delay": 2}}"""
+        cfg = dict((project_cfg or {}).get("retry", {}).get(phase) or {})
+        cfg.setdefault("attempts", RETRY_DEFAULT_ATTEMPTS[phase])
+        return cls(**{key: cfg[key] for key in ("attempts", "delay", "max_delay", "jitter") if key in cfg})
+
+    def backoff(self, attempt):
+        """第 attempt 次失败后的等待秒数"""
+        delay = min(self.max_delay, self.delay * 2 ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+
+def is_transient_error(error, ssh=None):
+    """连接断开、超时等可以通过重试恢复的错误；认证失败、文件不存在、脚本失败等不重试"""
+    if isinstance(error, (paramiko.AuthenticationException, paramiko.BadHostKeyException)):
+        return False
+    if isinstance(error, (paramiko.SSHException, paramiko.ssh_exception.NoValidConnectionsError,
+                          EOFError, ConnectionError, TimeoutError)):
+        return True
+    # SFTP 在连接断开后抛出的错误没有 errno（如 "Socket is closed"），以连接状态为准
+    if ssh is not None and isinstance(error, (OSError, IOError)):
+        transport = ssh.get_transport()
+        return transport is None or not transport.is_active()
+    return False
+
+
+class RetryRunner:
+    """按阶段的策略执行操作并统计重试次数
+
+    recover 在每次重试前调用（如重新连接），connection 返回当前连接，用于判断错误是否由连接断开引起。
+    """
+
+    def __init__(self, project_cfg, signals, stop_flag=None, connection=None):
+        self.policies = {phase: RetryPolicy.for_phase(project_cfg, phase) for phase in RETRY_PHASE_NAMES}
+        self.signals = signals
+        self.stop_flag = stop_flag
+        self.connection = connection
+        self.counts = {}
+
+    def run(self, phase, func, recover=None):
+        policy = self.policies[phase]
+        attempt = 1
+        while True:
+            try:
+                return func()
+            except OperationStopped:
+                raise
+            except Exception as e:
+                ssh = self.connection() if self.connection else None
+                if attempt >= policy.attempts or is_stopped(self.stop_flag) or not is_transient_error(e, ssh):
+                    raise
+                delay = policy.backoff(attempt)
+                self.counts[phase] = self.counts.get(phase, 0) + 1
+                self.signals.log.emit(
+                    f"⚠ {RETRY_PHASE_NAMES[phase]}失败: {str(e) or e.__class__.__name__}，"
+                    f"{delay:.1f} 秒后重试（{attempt}/{policy.attempts - 1}）"
+                )
+                self._sleep(delay)
+                if recover:
+                    recover()
+                attempt += 1
+
+    def _sleep(self, delay):
+        deadline = time.time() + delay
+        while True:
+            if is_stopped(self.stop_flag):
+                raise OperationStopped()
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 0.2))
+
+    def summary(self):
+        return "、".join(f"{RETRY_PHASE_NAMES[phase]} {count} 次" for phase, count in self.counts.items())
+
+
+# ============================================================
+# 部署流水线（构建 → 连接 → 计划 → 传输 → 校验 → 执行 → 健康检查）
+# ============================================================
+PIPELINE_QUEUE_SIZE = 32   # 阶段之间队列的容量，下游处理不过来时上游等待
+_PIPELINE_END = object()
+
+
+class PipelineAborted(Exception):
+    """流水线中其他阶段已失败，当前阶段随之结束"""
+
+
+class PipelineContext:
+    """一次流水线执行中各阶段共享的状态"""
+
+    def __init__(self, server_cfg, project_cfg, signals, stop_flag=None):
+        self.server_cfg = server_cfg
+        self.project_cfg = project_cfg or {}
+        self.signals = signals
+        self.stop_flag = stop_flag
+        self.ssh = None
+        self.sftp = None
+        self.total = 0           # 计划阶段解析出的文件数
+        self.upload = None       # 传输阶段的 StagedUpload
+        self.activated = False
+        self.message = ""
+        self.failure = None
+        self.aborted = threading.Event()
+        self.abort_flag = linked_stop_flag(stop_flag)  # 任一阶段失败时停止，用于中止本地构建和重试等待
+        self.timings = {}        # 阶段名 -> 实际工作耗时（不含等待上下游的时间）
+        self.retry = RetryRunner(self.project_cfg, signals, self.abort_flag, connection=lambda: self.ssh)
+        self._open_sftp = False
+
+    def connect(self, sftp):
+        """建立连接（连接阶段的策略重试）"""
+        def attempt():
+            ssh = connect_ssh(self.server_cfg, self.stop_flag)
+            try:
+                sftp_client = ssh.open_sftp() if sftp else None
+            except Exception:
+                ssh.close()
+                raise
+            self.ssh, self.sftp = ssh, sftp_client
+
+        self._open_sftp = sftp
+        self.retry.run("connect", attempt)
+
+    def reconnect(self):
+        """连接中断后重新连接，已暂存的上传切换到新连接继续"""
+        old, self.ssh, self.sftp = self.ssh, None, None
+        if old is not None:
+            try:
+                old.close()
+            except Exception:
+                pass
+        self.connect(self._open_sftp)
+        self.signals.log.emit(f"✓ 已重新连接: {server_label(self.server_cfg)}")
+        if self.upload is not None:
+            self.upload.rebind(self.ssh, self.sftp)
+
+    def fail(self, message):
+        if self.failure is None:
+            self.failure = message
+        self.aborted.set()
+        request_stop(self.abort_flag)
+
+    def check(self):
+        if is_stopped(self.stop_flag):
+            self.aborted.set()
+            raise OperationStopped()
+        if self.aborted.is_set():
+            raise PipelineAborted()
+
+
+class PipelineStage:
+    """流水线阶段：每个阶段在独立线程中运行，通过有界队列与上下游交换数据
+
+    - start：线程启动后立即执行，不等待上游（如连接服务器与本地构建同时进行）
+    - process：处理上游的每一项，默认原样传给下游
+    - finish：上游全部结束后执行
+    """
+    name = ""
+
+    def start(self, ctx):
+        pass
+
+    def process(self, ctx, item, emit):
+        emit(item)
+
+    def finish(self, ctx, emit):
+        pass
+
+
+class BuildStage(PipelineStage):
+    name = "构建"
+
+    def process(self, ctx, item, emit):
+        pre_commands = ctx.project_cfg.get("pre_commands", [])
+        if pre_commands:
+            ctx.signals.log.emit("=" * 60)
+            ctx.signals.log.emit("执行前置命令...")
+            ctx.signals.log.emit("=" * 60)
+            if not execute_local_commands(pre_commands, ctx.signals, ctx.abort_flag):
+                ctx.check()
+                raise RuntimeError("前置命令执行失败或被停止")
+            ctx.signals.log.emit("=" * 60)
+            ctx.signals.log.emit("前置命令执行完成")
+            ctx.signals.log.emit("=" * 60)
+        ctx.message = "前置命令执行完成"
+        emit(item)
+
+
+class ConnectStage(PipelineStage):
+    name = "连接"
+
+    def __init__(self, sftp=True, preflight=False):
+        self.sftp = sftp
+        self.preflight = preflight
+
+    def start(self, ctx):
+        ctx.connect(self.sftp)
+        ctx.signals.log.emit(f"✓ SSH 连接成功: {server_label(ctx.server_cfg)}")
+        # 与本地构建同时进行，未通过时构建随之中止
+        if self.preflight and preflight_enabled(ctx.project_cfg):
+            problems = ctx.retry.run("connect", lambda: preflight_check(ctx.ssh, [ctx.project_cfg]), ctx.reconnect)
+            if problems:
+                ctx.signals.log.emit(f"✗ 预检未通过，停止构建: {'；'.join(problems)}")
+                raise RuntimeError(f"预检未通过: {'；'.join(problems)}")
+            ctx.signals.log.emit("✓ 预检通过（磁盘空间、写权限、所需命令）")
+
+
+class PlanStage(PipelineStage):
+    name = "计划"
+
+    def process(self, ctx, item, emit):
+        if not ctx.project_cfg.get("files"):
+            raise RuntimeError("项目未配置任何文件")
+        mappings = resolve_file_mappings(ctx.project_cfg, ctx.signals)
+        ctx.total = len(mappings)
+        ctx.signals.progress_max.emit(len(mappings))
+        for mapping in mappings:
+            emit(mapping)
+
+
+class TransferStage(PipelineStage):
+    name = "传输"
+
+    def _upload(self, ctx):
+        if ctx.upload is None:
+            # 版本目录名在重试之外确定，重试时复用同一个目录
+            release_name = new_release_name()
+            ctx.upload = ctx.retry.run("transfer", lambda: StagedUpload(
+                ctx.ssh, ctx.sftp, ctx.project_cfg, ctx.signals, ctx.stop_flag, ctx.server_cfg, total=ctx.total,
+                release_name=release_name,
+            ), ctx.reconnect)
+        return ctx.upload
+
+    def process(self, ctx, item, emit):
+        # 连接中断时重新连接并只重传当前文件，之前的文件已暂存在服务器上
+        upload = self._upload(ctx)
+        job = upload.register(*item)
+        if job:
+            ctx.retry.run("transfer", lambda: upload.transfer(*job), ctx.reconnect)
+
+    def finish(self, ctx, emit):
+        upload = self._upload(ctx)
+        ctx.retry.run("transfer", upload.finish_transfer, ctx.reconnect)
+        emit(upload)
+
+
+class VerifyStage(PipelineStage):
+    name = "校验"
+
+    def process(self, ctx, upload, emit):
+        ctx.retry.run("transfer", upload.verify, ctx.reconnect)
+        emit(upload)
+
+
+class ExecuteStage(PipelineStage):
+    """生效暂存的文件，再执行脚本
+
+    detached 为 True 时脚本在远程后台运行（执行脚本按钮），可以用健康检查作为完成条件；
+    否则在当前会话中执行（部署脚本），健康检查由后续阶段完成。
+    """
+    name = "执行"
+
+    def __init__(self, script_cmd="", detached=False, health_cfg=None):
+        self.script_cmd = script_cmd
+        self.detached = detached
+        self.health_cfg = health_cfg
+
+    def process(self, ctx, upload, emit):
+        if upload is None:  # 没有传输阶段时上游只传来开始信号
+            return
+        total_files = ctx.retry.run(
+            "transfer",
+            lambda: activate_staged_files(ctx.ssh, ctx.sftp, ctx.project_cfg, upload.staged, ctx.signals),
+            ctx.reconnect,
+        )
+        ctx.activated = True
+        ctx.message = f"文件上传完成，共 {total_files} 个文件"
+
+    def finish(self, ctx, emit):
+        if not self.script_cmd:
+            emit(None)
+            return
+        if ctx.sftp:
+            ctx.signals.log.emit("上传完成，开始执行部署脚本...")
+        if self.detached:
+            success, message = ctx.retry.run("exec", lambda: run_detached_script(
+                ctx.ssh, self.script_cmd, ctx.signals, ctx.stop_flag, self.health_cfg
+            ), ctx.reconnect)
+        else:
+            exit_code = ctx.retry.run(
+                "exec", lambda: run_deploy_script(ctx.ssh, self.script_cmd, ctx.signals, ctx.stop_flag), ctx.reconnect
+            )
+            success, message = exit_code == 0, f"部署脚本执行失败，退出码: {exit_code}"
+        if not success:
+            raise RuntimeError(message)
+        ctx.message = message if self.detached else "部署完成"
+        emit(None)
+
+
+class HealthStage(PipelineStage):
+    name = "健康检查"
+
+    def finish(self, ctx, emit):
+        health_cfg = ctx.project_cfg.get("health_check")
+        if health_cfg:
+            success, message = ctx.retry.run(
+                "health", lambda: wait_for_healthy(ctx.ssh, health_cfg, ctx.signals, ctx.stop_flag), ctx.reconnect
+            )
+            if not success:
+                raise RuntimeError(message)
+        ctx.message = "部署完成"
+
+
+def _run_pipeline_stage(stage, ctx, inbox, outbox):
+    busy = [0.0]
+    waited = [0.0]   # 等待下游队列空位的时间，不计入本阶段耗时
+
+    def emit(item):
+        wait_start = time.time()
+        try:
+            while True:
+                ctx.check()
+                try:
+                    outbox.put(item, timeout=0.2)
+                    return
+                except queue.Full:
+                    pass
+        finally:
+            waited[0] += time.time() - wait_start
+
+    def timed(hook, *args):
+        # 其他阶段失败或已停止时不再执行（包括上游异常结束后的 finish）
+        ctx.check()
+        hook_start, waited_before = time.time(), waited[0]
+        try:
+            hook(ctx, *args)
+        finally:
+            busy[0] += time.time() - hook_start - (waited[0] - waited_before)
+
+    try:
+        timed(stage.start)
+        while True:
+            try:
+                item = inbox.get(timeout=0.2)
+            except queue.Empty:
+                ctx.check()
+                continue
+            if item is _PIPELINE_END:
+                break
+            timed(stage.process, item, emit)
+        timed(stage.finish, emit)
+    except (OperationStopped, PipelineAborted):
+        ctx.aborted.set()
+    except Exception as e:
+        if is_stopped(ctx.stop_flag):
+            ctx.aborted.set()
+        else:
+            ctx.fail(str(e))
+    finally:
+        ctx.timings[stage.name] = busy[0]
+        if outbox is not None:
+            outbox.put(_PIPELINE_END)
+
+
+def run_pipeline(stages, ctx, failure_prefix="执行失败"):
+    """运行流水线并发出 finished 信号：各阶段并发运行，任一阶段失败时其他阶段随之结束
+
+    结束后输出每个阶段的实际工作耗时；文件已暂存但未生效时清理暂存文件。
+    """
+    signals = ctx.signals
+    inboxes = [queue.Queue(maxsize=PIPELINE_QUEUE_SIZE) for _ in stages]
+    # 最后一个阶段的输出无人读取，使用无界队列
+    outboxes = inboxes[1:] + [queue.Queue()]
+    inboxes[0].put(None)
+    inboxes[0].put(_PIPELINE_END)
+    threads = [
+        threading.Thread(target=_run_pipeline_stage, args=(stage, ctx, inbox, outbox), daemon=True)
+        for stage, inbox, outbox in zip(stages, inboxes, outboxes)
+    ]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    unlink_stop_flag(ctx.abort_flag)
+
+    if ctx.upload is not None and not ctx.activated and ctx.ssh is not None:
+        try:
+            discard_staged_files(ctx.ssh, ctx.sftp, ctx.upload.staged)
+        except Exception:
+            pass
+        ctx.upload.close()
+    if ctx.ssh is not None:
+        ctx.ssh.close()
+
+    if len(stages) > 1:
+        timings = " | ".join(f"{stage.name} {ctx.timings.get(stage.name, 0):.1f}s" for stage in stages)
+        signals.log.emit(f"阶段耗时: {timings}（总计 {time.time() - start:.1f}s）")
+    if ctx.retry.counts:
+        signals.log.emit(f"重试次数: {ctx.retry.summary()}")
+
+    if ctx.failure is not None:
+        signals.finished.emit(False, f"{failure_prefix}: {ctx.failure}")
+    elif ctx.aborted.is_set():
+        signals.log.emit("🛑 操作已停止")
+        signals.finished.emit(False, "操作已停止")
+    else:
+        signals.finished.emit(True, ctx.message)
+
+
+def pipeline_preset(preset, project_cfg, script_cmd="", health_cfg=None):
+    """界面按钮对应的流水线
+
+    - build：只执行前置命令
+    - upload：构建 → 连接（同时预检服务器）→ 计划 → 传输 → 校验 → 生效
+    - deploy：upload 之后执行部署脚本并等待健康检查
+    - script：连接 → 后台执行脚本（可选以健康检查作为完成条件）
+    """
+    scripts = project_cfg.get("scripts", {})
+    if preset == "build":
+        return [BuildStage()]
+    if preset == "script":
+        return [ConnectStage(sftp=False), ExecuteStage(script_cmd, detached=True, health_cfg=health_cfg)]
+    stages = [BuildStage(), ConnectStage(preflight=True), PlanStage(), TransferStage(), VerifyStage()]
+    if preset == "upload":
+        return stages + [ExecuteStage()]
+    return stages + [ExecuteStage(scripts.get("deploy", "")), HealthStage()]
+
+
+def upload_project_files_worker(server_cfg, project_cfg, signals, stop_flag=None):
+    """上传项目配置的所有文件"""
+    run_pipeline(pipeline_preset("upload", project_cfg),
+                 PipelineContext(server_cfg, project_cfg, signals, stop_flag), "上传失败")
+
+
+def full_deploy_worker(server_cfg, project_cfg, signals, stop_flag=None):
+    """完整部署流程：上传文件 + 执行部署脚本"""
+    run_pipeline(pipeline_preset("deploy", project_cfg),
+                 PipelineContext(server_cfg, project_cfg, signals, stop_flag), "部署失败")
+
+
+def execute_script_worker(server_cfg, script_cmd, signals, stop_flag=None, health_cfg=None):
+    """执行远程脚本，实时输出日志；配置了健康检查时以服务就绪作为完成条件"""
+    run_pipeline(pipeline_preset("script", {}, script_cmd, health_cfg),
+                 PipelineContext(server_cfg, {}, signals, stop_flag))
+
+
+def pre_commands_worker(project_cfg, signals, stop_flag=None):
+    """只执行前置命令"""
+    run_pipeline(pipeline_preset("build", project_cfg), PipelineContext(None, project_cfg, signals, stop_flag))
+
+
+# ============================================================
+# 滚动部署（服务器组分批发布）
+# ============================================================
+class TaggedLog:
+    """给日志加上来源前缀，用于并发任务的日志区分"""
+
+    def __init__(self, log, tag):
+        self._log = log
+        self.tag = tag
+
+    def emit(self, text):
+        self._log.emit("\n".join(f"[{self.tag}] {line}" for line in str(text).split("\n")))
+
+
+class TaggedSignals:
+    def __init__(self, signals, tag):
+        self.progress = signals.progress
+        self.finished = signals.finished
+        self.log = TaggedLog(signals.log, tag)
+        # 进度总数由滚动部署按全部服务器统一设置
+        self.progress_max = _NullSignal()
+
+
+def project_server_names(project_cfg):
+    """项目关联的服务器列表：配置了 servers（服务器组）时使用组，否则为单个 server"""
+    servers = project_cfg.get("servers")
+    if servers:
+        return list(servers)
+    return [project_cfg.get("server", "")]
+
+
+def plan_batches(items, batch_size):
+    """按批大小分批，batch_size 可以是数量或百分比字符串（如 "25%"）"""
+    if isinstance(batch_size, str) and batch_size.strip().endswith("%"):
+        percent = float(batch_size.strip()[:-1])
+        size = max(1, int(len(items) * percent / 100))
+    else:
+        size = max(1, int(batch_size or 1))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _stage_host(server_name, server_cfg, project_cfg, mappings, signals, stop_flag):
+    """连接并暂存一台服务器的文件，返回 (ssh, sftp, staged)"""
+    host_signals = TaggedSignals(signals, server_name)
+    retry = RetryRunner(project_cfg, host_signals, stop_flag)
+    ssh = retry.run("connect", lambda: connect_ssh(server_cfg, stop_flag))
+    sftp = ssh.open_sftp()
+    try:
+        staged = stage_project_files(ssh, sftp, project_cfg, host_signals, stop_flag, server_cfg, mappings)
+    except Exception:
+        ssh.close()
+        raise
+    return ssh, sftp, staged
+
+
+def _activate_host(server_name, session, project_cfg, signals, stop_flag):
+    """生效文件、执行部署脚本并等待健康检查，返回 (是否成功, 消息)"""
+    host_signals = TaggedSignals(signals, server_name)
+    ssh, sftp, staged = session
+    try:
+        activate_or_discard_staged(ssh, sftp, project_cfg, staged, host_signals)
+        return run_deploy_and_health(ssh, project_cfg, host_signals, stop_flag)
+    finally:
+        ssh.close()
+
+
+def rolling_deploy_worker(config, project_cfg, signals, stop_flag=None):
+    """滚动部署：按批次发布到服务器组，每批健康后再进行下一批
+
+    - 本地构建只执行一次
+    - 当前批次执行部署脚本和健康检查时，下一批次的文件已在后台上传（只暂存、不生效）
+    - 任一服务器失败则停止发布，尚未生效的暂存文件会被清理
+    """
+    try:
+        servers = server_configs(config)
+        names = project_server_names(project_cfg)
+        missing = [name for name in names if name not in servers]
+        if missing:
+            signals.finished.emit(False, f"服务器配置不存在: {', '.join(missing)}")
+            return
+        if not project_cfg.get("files"):
+            signals.finished.emit(False, "项目未配置任何文件")
+            return
+
+        batch_size = project_cfg.get("rolling", {}).get("batch_size", 1)
+        batches = plan_batches(names, batch_size)
+        signals.log.emit(f"滚动部署: {len(names)} 台服务器，分 {len(batches)} 批，每批最多 {len(batches[0])} 台")
+
+        pre_commands = project_cfg.get("pre_commands", [])
+        if pre_commands:
+            signals.log.emit("=" * 60)
+            signals.log.emit("执行前置命令...")
+            signals.log.emit("=" * 60)
+        hosts = {name: (servers[name], [project_cfg]) for name in names} if preflight_enabled(project_cfg) else {}
+        success, message = run_build_with_preflight(pre_commands, hosts, signals, stop_flag)
+        if not success:
+            signals.finished.emit(False, message)
+            return
+
+        mappings = resolve_file_mappings(project_cfg, signals)
+        signals.progress_max.emit(len(mappings) * len(names))
+        executor = ThreadPoolExecutor(max_workers=len(batches[0]) * 2)
+        # 已开始上传、尚未交给生效的服务器；无论正常结束、失败还是停止，最后都清理它们的暂存文件和连接
+        unclaimed = {}
+        abort_flag = linked_stop_flag(stop_flag)
+
+        def stage_batch(batch):
+            futures = {
+                name: executor.submit(_stage_host, name, servers[name], project_cfg, mappings, signals, abort_flag)
+                for name in batch
+            }
+            unclaimed.update(futures)
+            return futures
+
+        def run_batches():
+            next_stage = stage_batch(batches[0])
+            for index, batch in enumerate(batches, 1):
+                current_stage = next_stage
+                signals.log.emit("=" * 60)
+                signals.log.emit(f"第 {index}/{len(batches)} 批: {', '.join(batch)}")
+                signals.log.emit("=" * 60)
+
+                # 等待本批上传完成
+                sessions, failures = {}, []
+                for name, future in current_stage.items():
+                    try:
+                        sessions[name] = future.result()
+                    except OperationStopped:
+                        raise
+                    except Exception as e:
+                        failures.append(f"{name}: 上传失败 {str(e)}")
+
+                if failures:
+                    remaining = [name for later in batches[index - 1:] for name in later]
+                    signals.log.emit(f"✗ 第 {index} 批上传失败，停止发布，未发布的服务器: {', '.join(remaining)}")
+                    return False, "滚动部署中止，" + "；".join(failures)
+
+                # 本批生效、重启期间，下一批开始上传
+                next_stage = stage_batch(batches[index]) if index < len(batches) else {}
+
+                activate_futures = {}
+                for name, session in sessions.items():
+                    del unclaimed[name]  # 生效过程自行清理并关闭连接
+                    activate_futures[name] = executor.submit(
+                        _activate_host, name, session, project_cfg, signals, stop_flag
+                    )
+                for name, future in activate_futures.items():
+                    try:
+                        success, message = future.result()
+                    except OperationStopped:
+                        raise
+                    except Exception as e:
+                        success, message = False, str(e)
+                    if success:
+                        signals.log.emit(f"[{name}] ✓ {message}")
+                    else:
+                        failures.append(f"{name}: {message}")
+
+                if failures:
+                    remaining = [name for later in batches[index:] for name in later]
+                    signals.log.emit(f"✗ 第 {index} 批失败，停止发布，未发布的服务器: {', '.join(remaining) or '无'}")
+                    return False, "滚动部署中止，" + "；".join(failures)
+
+            return True, f"滚动部署完成，共 {len(names)} 台服务器"
+
+        try:
+            success, message = run_batches()
+        finally:
+            # 中止仍在上传的服务器，等待其结束后删除暂存文件并关闭连接
+            if unclaimed:
+                request_stop(abort_flag)
+            for future in unclaimed.values():
+                try:
+                    ssh, sftp, staged = future.result()
+                except BaseException:
+                    continue  # 上传失败或被中止时 stage_project_files 已清理并关闭连接
+                with contextlib.suppress(Exception):
+                    discard_staged_files(ssh, sftp, staged)
+                ssh.close()
+            unlink_stop_flag(abort_flag)
+            executor.shutdown(wait=False)
+        signals.finished.emit(success, message)
+    except OperationStopped:
+        signals.log.emit("🛑 操作已停止")
+        signals.finished.emit(False, "操作已停止")
+    except Exception as e:
+        if stop_flag and stop_flag.get('stop'):
+            signals.finished.emit(False, "操作已停止")
+            return
+        signals.finished.emit(False, f"滚动部署失败: {str(e)}")
+
+
+class _ResultSignal:
+    """记录单机操作的结束结果，由 each_server_worker 汇总"""
+
+    def __init__(self):
+        self.result = None
+
+    def emit(self, success, message):
+        self.result = (success, message)
+
+
+class _FirstProgressMax:
+    """服务器组逐台操作时，进度总数按第一台服务器的文件数乘以服务器数设置一次"""
+
+    def __init__(self, signal, count):
+        self.signal = signal
+        self.count = count
+
+    def emit(self, value):
+        if self.signal is not None:
+            self.signal.emit(value * self.count)
+            self.signal = None
+
+
+def each_server_worker(config, project_cfg, signals, stop_flag, host_worker):
+    """在项目关联的每台服务器上依次执行单机操作 host_worker(server_cfg, signals, stop_flag)
+
+    单台服务器时直接执行；服务器组时日志带服务器前缀，任一服务器失败即停止，不再操作后面的服务器。
+    """
+    servers = server_configs(config)
+    names = project_server_names(project_cfg)
+    missing = [name for name in names if name not in servers]
+    if missing:
+        signals.finished.emit(False, f"服务器配置不存在: {', '.join(missing)}")
+        return
+    if len(names) == 1:
+        host_worker(servers[names[0]], signals, stop_flag)
+        return
+
+    progress_max = _FirstProgressMax(signals.progress_max, len(names))
+    for index, name in enumerate(names):
+        if is_stopped(stop_flag):
+            signals.finished.emit(False, "操作已停止")
+            return
+        signals.log.emit("=" * 60)
+        signals.log.emit(f"服务器 {index + 1}/{len(names)}: {name}")
+        signals.log.emit("=" * 60)
+        host_signals = TaggedSignals(signals, name)
+        host_signals.progress_max = progress_max
+        host_signals.finished = _ResultSignal()
+        host_worker(servers[name], host_signals, stop_flag)
+        success, message = host_signals.finished.result or (False, "未完成")
+        if not success:
+            remaining = names[index + 1:]
+            if remaining:
+                signals.log.emit(f"✗ 停止操作，未执行的服务器: {', '.join(remaining)}")
+            signals.finished.emit(False, f"{name}: {message}")
+            return
+        signals.log.emit(f"[{name}] ✓ {message}")
+    signals.finished.emit(True, f"{len(names)} 台服务器全部完成")
+
+
+# ============================================================
+# 异步调度（后台线程中的 asyncio 事件循环 + 有界线程池）
+# ============================================================
+ASYNC_MAX_WORKERS = 64      # 执行阻塞 SSH 调用（建立连接、打开通道、传输文件）的线程数
+ASYNC_MAX_SESSIONS = 512    # 同时进行的主机会话数
+
+
+class AsyncOrchestrator:
+    """大量主机并发操作的调度核心
+
+    - 事件循环在后台线程中运行，任意线程都可以提交协程（submit / run）
+    - 阻塞的 paramiko 调用在有界线程池中执行（blocking），等待远程输出时不占用线程（run_remote_command_async）
+    - 全局和每台服务器的信号量限制同时进行的会话数，超时和取消时通过 stop_flag 中断线程中的阻塞操作
+    - 结果通过 Qt 信号回到界面线程（跨线程 emit 由 Qt 自动排队）
+    """
+
+    def __init__(self, max_workers=ASYNC_MAX_WORKERS, max_sessions=ASYNC_MAX_SESSIONS):
+        self.max_workers = max_workers
+        self.max_sessions = max_sessions
+        self._loop = None
+        self._executor = None
+        self._sessions = None
+        self._server_semaphores = {}
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="quickdeploy-io")
+                # 选择器事件循环才支持 add_reader（Windows 默认的 Proactor 不支持）
+                loop = asyncio.SelectorEventLoop()
+                loop.set_default_executor(self._executor)
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                threading.Thread(target=run, name="quickdeploy-asyncio", daemon=True).start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro):
+        """提交协程，返回 concurrent.futures.Future；对其 cancel() 会取消协程"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """提交协程并等待结果，供工作线程调用（不能在事件循环线程中调用）"""
+        return self.submit(coro).result()
+
+    async def blocking(self, func, *args, stop_flag=None, timeout=None):
+        """在线程池中执行阻塞调用；超时或被取消时置位 stop_flag，让线程中的操作尽快结束"""
+        future = asyncio.get_running_loop().run_in_executor(self._executor, partial(func, *args))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if stop_flag is not None:
+                request_stop(stop_flag)
+            raise
+
+    @contextlib.asynccontextmanager
+    async def session(self, server_cfg, limit=None, stop_flag=None):
+        """占用一个主机会话名额（全局 max_sessions，同一服务器最多 limit 个），拿到名额时已停止则直接结束"""
+        if self._sessions is None:
+            self._sessions = asyncio.Semaphore(self.max_sessions)
+        server_semaphore = None
+        if limit:
+            key = (SSHConnectionPool.key_of(server_cfg), limit)
+            server_semaphore = self._server_semaphores.setdefault(key, asyncio.Semaphore(limit))
+        async with self._sessions:
+            if server_semaphore is not None:
+                await server_semaphore.acquire()
+            try:
+                if is_stopped(stop_flag):
+                    raise OperationStopped()
+                yield
+            finally:
+                if server_semaphore is not None:
+                    server_semaphore.release()
+
+
+orchestrator = AsyncOrchestrator()
 
-        signals.finished.emit(True, f"文件上传完成，共 {total_files} 个文件")
-    except Exception as e:
-        signals.finished.emit(False, f"上传失败: {str(e)}")
 
+def _open_exec_channel(ssh, command, timeout):
+    channel = ssh.get_transport().open_session(timeout=timeout)
+    channel.set_combine_stderr(True)
+    channel.exec_command(command)
+    return channel
 
-def full_deploy_worker(server_cfg, project_cfg, signals, stop_flag=None):
-    """完整部署流程：上传文件 + 执行部署脚本"""
+
+async def run_remote_command_async(ssh, command, timeout=30):
+    """与 run_remote_command 相同，返回 (退出码, 合并后的输出)
+
+    只有打开通道时占用线程，等待输出期间由事件循环在通道可读时回调读取；超时或取消时关闭通道。
+    """
+    loop = asyncio.get_running_loop()
+    opening = loop.run_in_executor(None, _open_exec_channel, ssh, command, timeout)
     try:
-        # 执行前置命令（如果有）
-        pre_commands = project_cfg.get("pre_commands", [])
-        if pre_commands:
-            signals.log.emit("=" * 60)
-            signals.log.emit("执行前置命令...")
-            signals.log.emit("=" * 60)
-            if not execute_local_commands(pre_commands, signals, stop_flag):
-                signals.finished.emit(False, "前置命令执行失败或被停止")
+        channel = await asyncio.shield(opening)
+    except asyncio.CancelledError:
+        # 线程中的通道仍会打开，打开后立即关闭，避免远程命令无人等待地继续运行
+        opening.add_done_callback(lambda future: future.exception() is None and future.result().close())
+        raise
+    chunks = []
+    done = loop.create_future()
+    fd = channel.fileno()
+
+    def on_readable():
+        # 通道可读（有数据或已结束）时 recv 不会阻塞
+        try:
+            data = channel.recv(65536)
+        except Exception as e:
+            loop.remove_reader(fd)
+            if not done.done():
+                done.set_exception(e)
+            return
+        if data:
+            chunks.append(data)
+            return
+        loop.remove_reader(fd)
+        if not done.done():
+            done.set_result(None)
+
+    loop.add_reader(fd, on_readable)
+    try:
+        await asyncio.wait_for(done, timeout)
+        # 输出结束后退出码随即到达
+        exit_code = await orchestrator.blocking(channel.recv_exit_status, timeout=timeout)
+    finally:
+        loop.remove_reader(fd)
+        channel.close()
+    return exit_code, b"".join(chunks).decode('utf-8', errors='replace')
+
+
+# ============================================================
+# 批量部署（多个项目）
+# ============================================================
+SERVER_MAX_PARALLEL_DEFAULT = 2  # 同一服务器同时部署的项目数（服务器配置 max_parallel）
+
+
+def normalize_command(command):
+    """前置命令的比较键：忽略首尾空白和连续空白的差异"""
+    return " ".join(command.split())
+
+
+def merge_pre_commands(project_cfgs):
+    """合并多个项目的前置命令，每个项目自己的命令顺序保持不变
+
+    相同的命令只执行一次，前提是它在每个项目中最多出现一次、且与其他共用命令的先后顺序在各项目中一致；
+    顺序有冲突的命令按各项目分别执行。
+    """
+    sequences = []
+    for project_cfg in project_cfgs:
+        sequence = [(normalize_command(command), command) for command in project_cfg.get("pre_commands", [])]
+        sequences.append([(key, command) for key, command in sequence if key])
+
+    # 可共用的命令：每个项目中最多出现一次
+    shared = set()
+    repeated = set()
+    for sequence in sequences:
+        counts = Counter(key for key, _ in sequence)
+        shared.update(counts)
+        repeated.update(key for key, count in counts.items() if count > 1)
+    shared -= repeated
+
+    while True:
+        # 节点：共用命令为 key，其他为 (项目序号, 位置)；每个项目的相邻命令之间连一条边
+        nodes, edges = {}, defaultdict(set)
+        for index, sequence in enumerate(sequences):
+            previous = None
+            for position, (key, command) in enumerate(sequence):
+                node = key if key in shared else (index, position)
+                nodes.setdefault(node, ((index, position), command))
+                if previous is not None:
+                    edges[previous].add(node)
+                previous = node
+        cycle = _find_cycle(nodes, edges)
+        if not cycle:
+            break
+        # 顺序冲突的命令不再共用，回到各自项目中执行
+        shared -= {node for node in cycle if isinstance(node, str)}
+
+    # 拓扑排序，可同时执行的命令中先执行最早出现的
+    indegree = Counter(target for targets in edges.values() for target in targets)
+    ready = [(order, node) for node, (order, _) in nodes.items() if not indegree[node]]
+    heapq.heapify(ready)
+    merged = []
+    while ready:
+        _, node = heapq.heappop(ready)
+        merged.append(nodes[node][1])
+        for target in edges[node]:
+            indegree[target] -= 1
+            if not indegree[target]:
+                heapq.heappush(ready, (nodes[target][0], target))
+    return merged
+
+
+def _find_cycle(nodes, edges):
+    """返回图中任意一个环上的节点，无环时返回空列表"""
+    state = {}
+    for start in nodes:
+        if start in state:
+            continue
+        stack, path = [(start, iter(edges[start]))], [start]
+        state[start] = 1
+        while stack:
+            node, targets = stack[-1]
+            for target in targets:
+                if state.get(target) == 1:
+                    return path[path.index(target):]
+                if target not in state:
+                    state[target] = 1
+                    stack.append((target, iter(edges[target])))
+                    path.append(target)
+                    break
+            else:
+                state[node] = 2
+                stack.pop()
+                path.pop()
+    return []
+
+
+def server_max_parallel(server_cfg):
+    return max(1, int(server_cfg.get("max_parallel") or SERVER_MAX_PARALLEL_DEFAULT))
+
+
+async def _batch_deploy_host(name, server_cfg, project_cfg, mappings, signals, stop_flag):
+    """占用服务器名额后上传并部署一台服务器，返回 (是否成功, 消息)"""
+    async with orchestrator.session(server_cfg, server_max_parallel(server_cfg), stop_flag):
+        session = await orchestrator.blocking(
+            _stage_host, name, server_cfg, project_cfg, mappings, signals, stop_flag, stop_flag=stop_flag
+        )
+        return await orchestrator.blocking(
+            _activate_host, name, session, project_cfg, signals, stop_flag, stop_flag=stop_flag
+        )
+
+
+async def _batch_deploy_project(project_id, project_cfg, servers, mappings, signals, stop_flag):
+    """部署一个项目（不执行前置命令），服务器组按 rolling.batch_size 分批，返回 (是否成功, 消息)"""
+    project_signals = TaggedSignals(signals, project_id)
+    names = project_server_names(project_cfg)
+    for batch in plan_batches(names, project_cfg.get("rolling", {}).get("batch_size", 1)):
+        results = await asyncio.gather(*(
+            _batch_deploy_host(name, servers[name], project_cfg, mappings, project_signals, stop_flag)
+            for name in batch
+        ), return_exceptions=True)
+        failures = []
+        for name, result in zip(batch, results):
+            if isinstance(result, OperationStopped):
+                raise result
+            if isinstance(result, BaseException):
+                result = (False, str(result))
+            if not result[0]:
+                failures.append(f"{name}: {result[1]}")
+        if failures:
+            return False, "；".join(failures)
+    return True, f"{len(names)} 台服务器部署完成"
+
+
+async def _batch_deploy_all(project_ids, projects, servers, mappings, signals, stop_flag):
+    results = await asyncio.gather(*(
+        _batch_deploy_project(project_id, projects[project_id], servers, mappings[project_id], signals, stop_flag)
+        for project_id in project_ids
+    ), return_exceptions=True)
+    if any(isinstance(result, OperationStopped) for result in results):
+        raise OperationStopped()
+    return {
+        project_id: (False, str(result)) if isinstance(result, BaseException) else result
+        for project_id, result in zip(project_ids, results)
+    }
+
+
+def batch_deploy_worker(config, project_ids, signals, stop_flag=None):
+    """批量部署多个项目
+
+    - 所有项目的前置命令合并去重后只执行一次（如多个模块共用根目录的一次构建）
+    - 构建完成后各项目在异步调度器中并发上传、部署，同一服务器同时部署的项目数受 max_parallel 限制
+    - 单个项目失败不影响其他项目
+    """
+    try:
+        servers = server_configs(config)
+        projects = config.get("projects", {})
+        for project_id in project_ids:
+            project_cfg = projects.get(project_id)
+            if not project_cfg:
+                signals.finished.emit(False, f"项目配置不存在: {project_id}")
                 return
-            
-            if stop_flag and stop_flag.get('stop'):
+            if not project_cfg.get("files"):
+                signals.finished.emit(False, f"项目未配置任何文件: {project_id}")
+                return
+            missing = [name for name in project_server_names(project_cfg) if name not in servers]
+            if missing:
+                signals.finished.emit(False, f"服务器配置不存在: {', '.join(missing)}（{project_id}）")
                 return
 
+        project_cfgs = [projects[project_id] for project_id in project_ids]
+        pre_commands = merge_pre_commands(project_cfgs)
+        total_commands = sum(len(cfg.get("pre_commands", [])) for cfg in project_cfgs)
+        signals.log.emit(f"批量部署 {len(project_ids)} 个项目: {', '.join(project_ids)}")
+        if pre_commands:
             signals.log.emit("=" * 60)
-            signals.log.emit("前置命令执行完成")
+            signals.log.emit(f"执行前置命令（共 {total_commands} 条，去重后 {len(pre_commands)} 条）...")
             signals.log.emit("=" * 60)
-        
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(
-            server_cfg["host"],
-            int(server_cfg["port"]),
-            server_cfg["username"],
-            server_cfg["password"]
-        )
-        signals.log.emit(f"✓ SSH 连接成功: {server_cfg['host']}")
+        # 每台服务器一次预检，覆盖部署到它的所有项目
+        hosts = {}
+        for cfg in project_cfgs:
+            if preflight_enabled(cfg):
+                for name in project_server_names(cfg):
+                    hosts.setdefault(name, (servers[name], []))[1].append(cfg)
+        success, message = run_build_with_preflight(pre_commands, hosts, signals, stop_flag)
+        if not success:
+            signals.finished.emit(False, message)
+            return
 
-        sftp = ssh.open_sftp()
+        mappings = {
+            project_id: resolve_file_mappings(projects[project_id], TaggedSignals(signals, project_id))
+            for project_id in project_ids
+        }
+        signals.progress_max.emit(sum(
+            len(mappings[project_id]) * len(project_server_names(projects[project_id])) for project_id in project_ids
+        ))
 
-        files = project_cfg.get("files", [])
-        if not files:
+        results = orchestrator.run(_batch_deploy_all(project_ids, projects, servers, mappings, signals, stop_flag))
+
+        signals.log.emit("=" * 60)
+        failed = []
+        for project_id, (success, message) in results.items():
+            signals.log.emit(f"{'✓' if success else '✗'} {project_id}: {message}")
+            if not success:
+                failed.append(project_id)
+        if failed:
+            signals.finished.emit(False, f"批量部署完成，{len(failed)} 个项目失败: {', '.join(failed)}")
+        else:
+            signals.finished.emit(True, f"批量部署完成，共 {len(project_ids)} 个项目")
+    except OperationStopped:
+        signals.log.emit("🛑 操作已停止")
+        signals.finished.emit(False, "操作已停止")
+    except Exception as e:
+        if is_stopped(stop_flag):
+            signals.finished.emit(False, "操作已停止")
+            return
+        signals.finished.emit(False, f"批量部署失败: {str(e)}")
+
+
+class BatchDeployDialog(QDialog):
+    """选择批量部署的项目"""
+
+    def __init__(self, config, current_project=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("批量部署")
+        self.resize(420, 480)
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("选择要部署的项目（相同的前置命令只执行一次）："))
+
+        self.list_projects = QListWidget()
+        for project_id, project_data in config.get("projects", {}).items():
+            item = QListWidgetItem(f"{project_data.get('name', project_id)} ({project_id})")
+            item.setData(Qt.ItemDataRole.UserRole, project_id)
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            checked = project_id == current_project
+            item.setCheckState(Qt.CheckState.Checked if checked else Qt.CheckState.Unchecked)
+            self.list_projects.addItem(item)
+        layout.addWidget(self.list_projects)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        btn_ok = QPushButton("开始部署")
+        btn_ok.clicked.connect(self.accept)
+        btn_cancel = QPushButton("取消")
+        btn_cancel.clicked.connect(self.reject)
+        buttons.addWidget(btn_ok)
+        buttons.addWidget(btn_cancel)
+        layout.addLayout(buttons)
+
+    def selected_projects(self):
+        items = (self.list_projects.item(i) for i in range(self.list_projects.count()))
+        return [
+            item.data(Qt.ItemDataRole.UserRole) for item in items
+            if item.checkState() == Qt.CheckState.Checked
+        ]
+
+
+# ============================================================
+# 监听模式（文件变化后自动构建、增量部署）
+# ============================================================
+WATCH_DEBOUNCE_SECONDS = 0.5   # 最后一次变化后保持安静多久才开始部署
+WATCH_POLL_INTERVAL = 1.0      # 不支持 inotify 时的轮询间隔
+WATCH_KEEPALIVE = 30
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+INOTIFY_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+                | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+INOTIFY_EVENT = struct.Struct("iIII")   # struct inotify_event: int wd; uint32 mask, cookie, len; char name[]
+
+
+def build_outputs(project_cfg):
+    """files 中的本地产物路径（绝对路径），通配符取其基准目录"""
+    return [
+        os.path.abspath(_split_glob(file_info["local"])[0])
+        for file_info in project_cfg.get("files", []) if file_info.get("local")
+    ]
+
+
+def outputs_under(root, outputs):
+    """root 下的构建产物的相对路径；单个文件排除其所在目录（构建工具常在同一目录生成中间文件）"""
+    rel_paths = []
+    for output in outputs:
+        if not os.path.isdir(output) and os.path.dirname(output) != root:
+            output = os.path.dirname(output)
+        rel_path = os.path.relpath(output, root)
+        if rel_path != "." and not rel_path.startswith(".."):
+            rel_paths.append(rel_path.replace(os.sep, "/"))
+    return rel_paths
+
+
+def watch_roots(project_cfg):
+    """监听的目录列表 [(目录, 是否递归, PathFilter)]
+
+    配置了 watch.paths 时监听源码（变化后先执行前置命令再部署），源码目录中的构建产物自动排除，
+    否则监听 files 中的产物。单个文件监听其所在目录（构建工具常以重命名方式替换文件）。
+    """
+    watch_cfg = project_cfg.get("watch") or {}
+    if watch_cfg.get("paths"):
+        outputs = build_outputs(project_cfg)
+        entries = []
+        for path in watch_cfg["paths"]:
+            path_filter = PathFilter(watch_cfg.get("include"), watch_cfg.get("exclude"))
+            path_filter.exclude_paths(outputs_under(os.path.abspath(path), outputs))
+            entries.append((path, path_filter))
+    else:
+        entries = []
+        for file_info in project_cfg.get("files", []):
+            base, _ = _split_glob(file_info.get("local", ""))
+            entries.append((base, PathFilter(None, file_info.get("exclude"))))
+
+    roots = {}
+    for path, path_filter in entries:
+        if not path:
+            continue
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            roots[path] = (path, True, path_filter)
+        elif os.path.dirname(path) not in roots:
+            roots[os.path.dirname(path)] = (os.path.dirname(path), False, PathFilter())
+    return list(roots.values())
+
+
+class InotifyWatcher:
+    """Linux inotify 监听（ctypes 调用 libc），递归目录中新建的子目录自动加入监听"""
+
+    def __init__(self, roots):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self._watches = {}   # wd -> (目录, 所属监听根)
+        try:
+            for root in roots:
+                self._add_tree(root[0], root)
+        except Exception:
+            self.close()
+            raise
+
+    def _add_tree(self, path, root):
+        root_path, recursive, path_filter = root
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(current), INOTIFY_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    raise OSError(err, "inotify 监听数量达到上限（fs.inotify.max_user_watches）")
+                continue  # 目录已被删除等
+            self._watches[wd] = (current, root)
+            if not recursive:
+                continue
+            try:
+                with os.scandir(current) as it:
+                    for item in it:
+                        if item.is_dir(follow_symlinks=False):
+                            rel_path = os.path.relpath(item.path, root_path).replace(os.sep, "/")
+                            if not path_filter.excluded(rel_path):
+                                stack.append(item.path)
+            except OSError:
+                pass
+
+    def _relevant(self, wd, mask, name):
+        """处理一条事件，返回是否为需要关心的变化"""
+        if mask & IN_Q_OVERFLOW:
+            return True
+        entry = self._watches.get(wd)
+        if entry is None:
+            return False
+        directory, root = entry
+        if not name:
+            return bool(mask & (IN_DELETE_SELF | IN_MOVE_SELF))
+        path = os.path.join(directory, name)
+        rel_path = os.path.relpath(path, root[0]).replace(os.sep, "/")
+        if root[2].excluded(rel_path):
+            return False
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and root[1]:
+            self._add_tree(path, root)
+        return True
+
+    def wait(self, timeout):
+        """等待变化，timeout 秒内有需要关心的变化返回 True"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset + INOTIFY_EVENT.size <= len(data):
+                wd, mask, _, name_len = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = data[offset:offset + name_len]
+                offset += name_len
+                if self._relevant(wd, mask, os.fsdecode(name.rstrip(b"\0"))):
+                    changed = True
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """轮询监听：定期比较监听目录中所有文件的大小和修改时间"""
+
+    def __init__(self, roots, interval=WATCH_POLL_INTERVAL):
+        self.roots = roots
+        self.interval = interval
+        self._snapshot = self._take_snapshot()
+
+    def _take_snapshot(self):
+        snapshot = {}
+        for root_path, recursive, path_filter in self.roots:
+            if recursive:
+                tree, _ = scan_index.scan(root_path, path_filter, json.dumps([root_path, "watch"]))
+                rel_paths = [p for p in scan_index.files_of(tree) if not path_filter.excluded(p)]
+                paths = [os.path.join(root_path, p) for p in rel_paths]
+            else:
+                try:
+                    paths = [entry.path for entry in os.scandir(root_path) if entry.is_file()]
+                except OSError:
+                    paths = []
+            for path in paths:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        snapshot = self._take_snapshot()
+        changed = snapshot != self._snapshot
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(roots, signals):
+    """优先使用 inotify，不可用时（非 Linux、监听数量超限等）退回轮询"""
+    if sys.platform.startswith("linux"):
+        try:
+            watcher = InotifyWatcher(roots)
+            signals.log.emit(f"使用 inotify 监听 {len(watcher._watches)} 个目录")
+            return watcher
+        except (OSError, AttributeError) as e:
+            signals.log.emit(f"⚠ inotify 不可用（{str(e)}），改为每 {WATCH_POLL_INTERVAL:g} 秒轮询")
+    else:
+        signals.log.emit(f"每 {WATCH_POLL_INTERVAL:g} 秒轮询文件变化")
+    return PollingWatcher(roots)
+
+
+def _current_file_state(mappings):
+    state = {}
+    for local_path, _ in mappings:
+        try:
+            state[local_path] = _stat_key(local_path)
+        except OSError:
+            pass
+    return state
+
+
+class WatchSession:
+    """监听模式下保持的服务器连接，断开后下次部署时重连"""
+
+    def __init__(self, server_cfg):
+        self.server_cfg = server_cfg
+        self.ssh = None
+        self.sftp = None
+
+    def open(self, stop_flag):
+        transport = self.ssh.get_transport() if self.ssh else None
+        if transport is None or not transport.is_active():
+            self.close()
+            self.ssh = connect_ssh(self.server_cfg, stop_flag)
+            self.ssh.get_transport().set_keepalive(WATCH_KEEPALIVE)
+            self.sftp = self.ssh.open_sftp()
+        return self.ssh, self.sftp
+
+    def close(self):
+        if self.ssh:
+            self.ssh.close()
+        self.ssh = self.sftp = None
+
+
+def _watch_deploy_host(name, session, project_cfg, changed, signals, stop_flag):
+    """把变化的文件推送到一台服务器并执行部署脚本，返回 (是否成功, 消息)"""
+    host_signals = TaggedSignals(signals, name)
+    try:
+        ssh, sftp = session.open(stop_flag)
+        staged = stage_project_files(ssh, sftp, project_cfg, host_signals, stop_flag, session.server_cfg, changed)
+        activate_or_discard_staged(ssh, sftp, project_cfg, staged, host_signals)
+        return run_deploy_and_health(ssh, project_cfg, host_signals, stop_flag)
+    except OperationStopped:
+        raise
+    except Exception as e:
+        session.close()
+        return False, str(e)
+
+
+def watch_deploy_worker(config, project_cfg, signals, stop_flag=None):
+    """监听模式：文件变化后自动构建并只推送变化的文件，直到停止
+
+    - 连续的变化在安静 WATCH_DEBOUNCE_SECONDS 秒后合并为一次部署
+    - 部署期间发生的变化不会丢失，全部合并为部署结束后的下一次部署
+    - 每台服务器保持一个连接；某台服务器失败时其未部署的文件留到下一次重试
+    """
+    watcher = None
+    sessions = {}
+    runs = 0
+    try:
+        servers = server_configs(config)
+        names = project_server_names(project_cfg)
+        missing = [name for name in names if name not in servers]
+        if missing:
+            signals.finished.emit(False, f"服务器配置不存在: {', '.join(missing)}")
+            return
+        if not project_cfg.get("files"):
             signals.finished.emit(False, "项目未配置任何文件")
             return
 
-        total_files = len(files)
-        signals.progress.emit(0)
-        signals.log.emit(f"开始上传项目文件，共 {total_files} 个文件...")
+        watch_cfg = project_cfg.get("watch") or {}
+        build = bool(watch_cfg.get("paths"))
+        debounce = float(watch_cfg.get("debounce", WATCH_DEBOUNCE_SECONDS))
+        roots = watch_roots(project_cfg)
+        if not roots:
+            signals.finished.emit(False, "没有可监听的本地目录")
+            return
 
-        for file_info in files:
-            if stop_flag and stop_flag.get('stop'):
-                signals.log.emit("🛑 部署已停止")
-                sftp.close()
-                ssh.close()
-                signals.finished.emit(False, "操作已停止")
-                return
+        for name in names:
+            sessions[name] = WatchSession(servers[name])
+            sessions[name].open(stop_flag)
+            signals.log.emit(f"✓ SSH 连接成功: {name}")
+
+        watcher = create_watcher(roots, signals)
+        for root_path, recursive, _ in roots:
+            signals.log.emit(f"监听{'源码' if build else '产物'}: {root_path}{'（含子目录）' if recursive else ''}")
+        # 监听目录本身位于构建产物中时无法排除产物，构建期间的变化全部忽略，避免构建后再次触发
+        outputs = build_outputs(project_cfg)
+        ignore_build_events = build and any(
+            root_path == output or root_path.startswith(output.rstrip(os.sep) + os.sep)
+            for root_path, _, _ in roots for output in outputs
+        )
+        if ignore_build_events:
+            signals.log.emit("⚠ 监听目录位于构建产物中，构建期间的文件变化将被忽略")
 
-            local_path = file_info.get("local", "")
-            remote_path = file_info.get("remote", "")
-            
-            if not local_path or not remote_path:
-                signals.log.emit(f"⚠ 跳过无效配置: {file_info}")
+        # 以当前本地文件为基准，之后变化的文件才会部署
+        baseline = _current_file_state(resolve_file_mappings(project_cfg))
+        deployed = {name: dict(baseline) for name in names}
+        signals.log.emit("监听中，文件变化后自动部署（点击停止结束监听）...")
+
+        while True:
+            if is_stopped(stop_flag):
+                raise OperationStopped()
+            if not watcher.wait(0.5):
                 continue
-            
-            if not os.path.exists(local_path):
-                signals.log.emit(f"✗ 本地文件不存在: {local_path}")
+            # 去抖：等到连续 debounce 秒没有新的变化
+            while watcher.wait(debounce):
+                if is_stopped(stop_flag):
+                    raise OperationStopped()
+
+            signals.log.emit("=" * 60)
+            signals.log.emit(f"检测到文件变化（{time.strftime('%H:%M:%S')}）")
+            if build and project_cfg.get("pre_commands"):
+                if not execute_local_commands(project_cfg["pre_commands"], signals, stop_flag):
+                    if is_stopped(stop_flag):
+                        raise OperationStopped()
+                    signals.log.emit("✗ 前置命令执行失败，等待下一次变化")
+                    continue
+                if ignore_build_events:
+                    while watcher.wait(0):
+                        pass
+
+            mappings = resolve_file_mappings(project_cfg, signals)
+            state = _current_file_state(mappings)
+            pending = {
+                name: [(local, remote) for local, remote in mappings
+                       if local in state and state[local] != deployed[name].get(local)]
+                for name in names
+            }
+            total = sum(len(changed) for changed in pending.values())
+            if not total:
+                signals.log.emit("部署文件没有变化，跳过")
                 continue
-            
-            # 如果远程路径以 / 结尾，说明是目录，需要添加文件名
-            if remote_path.endswith("/"):
-                remote_path = remote_path + os.path.basename(local_path)
-            
-            upload_file_to_server(sftp, local_path, remote_path, signals)
+
+            runs += 1
+            start = time.time()
+            signals.progress_max.emit(total)
+            failures = []
+            for name in names:
+                changed = pending[name]
+                if not changed:
+                    continue
+                success, message = _watch_deploy_host(
+                    name, sessions[name], project_cfg, changed, signals, stop_flag
+                )
+                if success:
+                    deployed[name].update((local, state[local]) for local, _ in changed)
+                    signals.log.emit(f"[{name}] ✓ {message}")
+                else:
+                    failures.append(name)
+                    signals.log.emit(f"[{name}] ✗ {message}")
+            elapsed = time.time() - start
+            if failures:
+                signals.log.emit(f"✗ 第 {runs} 次自动部署失败: {', '.join(failures)}（{elapsed:.1f}s），下次变化时重试")
+            else:
+                signals.log.emit(f"✓ 第 {runs} 次自动部署完成，{total} 个文件（{elapsed:.1f}s）")
+    except OperationStopped:
+        signals.log.emit("🛑 监听已停止")
+        signals.finished.emit(True, f"监听已停止，共自动部署 {runs} 次")
+    except Exception as e:
+        if is_stopped(stop_flag):
+            signals.finished.emit(True, f"监听已停止，共自动部署 {runs} 次")
+            return
+        signals.finished.emit(False, f"监听失败: {str(e)}")
+    finally:
+        if watcher:
+            watcher.close()
+        for session in sessions.values():
+            session.close()
 
 
-        sftp.close()
-        
-        if stop_flag and stop_flag.get('stop'):
-            signals.log.emit("🛑 部署已停止")
-            ssh.close()
-            signals.finished.emit(False, "操作已停止")
+# ============================================================
+# 部署计划（预演）
+# ============================================================
+THROUGHPUT_FILE = os.path.join(os.path.dirname(os.path.abspath(CONFIG_FILE)), "throughput.json")
+THROUGHPUT_MIN_SAMPLE_BYTES = 256 * 1024   # 小文件的耗时主要是往返延迟，不计入速度统计
+THROUGHPUT_SMOOTHING = 0.3
+
+
+class ThroughputHistory:
+    """按服务器记录实测上传速度（指数加权平均，KB/s），用于估算部署耗时"""
+
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_of(server_cfg):
+        return f"{server_cfg.get('username', '')}@{server_cfg.get('host', '')}:{server_cfg.get('port', 22)}"
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    def record(self, server_cfg, size, elapsed):
+        if size < THROUGHPUT_MIN_SAMPLE_BYTES or elapsed <= 0:
             return
+        speed = size / 1024 / elapsed
+        key = self.key_of(server_cfg)
+        with self._lock:
+            data = self._load()
+            previous = data.get(key, {}).get("kbps")
+            if previous:
+                speed = previous + THROUGHPUT_SMOOTHING * (speed - previous)
+            data[key] = {"kbps": round(speed, 1), "updated": time.strftime("%Y-%m-%d %H:%M:%S")}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def estimate(self, server_cfg):
+        """返回预计上传速度（KB/s），同时考虑全局和服务器限速；没有历史数据时返回 None"""
+        with self._lock:
+            speed = self._load().get(self.key_of(server_cfg), {}).get("kbps")
+        if not speed:
+            return None
+        limits = [bandwidth.global_limiter.rate_kb]
+        try:
+            limits.append(float(server_cfg.get("rate_limit") or 0))
+        except ValueError:
+            pass
+        return min([speed] + [limit for limit in limits if limit > 0])
 
-        signals.log.emit("上传完成，开始执行部署脚本...")
 
-        deploy_script = project_cfg.get("scripts", {}).get("deploy", "")
-        if deploy_script:
-            signals.log.emit(f"执行命令: {deploy_script}")
-            # 使用 get_pty=True 获取实时输出
-            stdin, stdout, stderr = ssh.exec_command(deploy_script, get_pty=True)
-            
-            # 实时读取输出
-            while True:
-                if stop_flag and stop_flag.get('stop'):
-                    signals.log.emit("🛑 操作已停止")
-                    # 尝试发送 Ctrl+C
-                    stdin.write('\x03')
-                    stdin.channel.close()
-                    ssh.close()
-                    signals.finished.emit(False, "操作已停止")
-                    return
+throughput_history = ThroughputHistory(THROUGHPUT_FILE)
 
-                if stdout.channel.recv_ready():
-                    line = stdout.readline()
-                    if line:
-                        signals.log.emit(line.rstrip())
-                    else:
-                        break
-                elif stdout.channel.exit_status_ready():
-                    break
-                else:
-                    time.sleep(0.1)
 
-        ssh.close()
+def query_remote_state(ssh, remote_paths, cas_hashes=()):
+    """获取目标文件的 SHA-256（不存在为 None）以及服务器缓存中已有的哈希，按参数长度上限分批查询"""
+    states = []
+    for quoted in chunk_shell_words([shlex.quote(path) for path in remote_paths]):
+        command = (
+            f'for f in {" ".join(quoted)}; do if [ -f "$f" ]; then h=$(sha256sum < "$f" | cut -c1-64); '
+            f'echo "${{h:-unknown}}"; else echo missing; fi; done; echo "--"; true'
+        )
+        code, output = run_remote_command(ssh, command, timeout=600)
+        lines = [line.strip() for line in output.splitlines()]
+        if "--" not in lines:
+            raise RuntimeError(f"远程查询失败: {output.strip()[-300:]}")
+        chunk_states = lines[:lines.index("--")]
+        if len(chunk_states) != len(quoted):
+            raise RuntimeError(f"远程查询结果不完整: {output.strip()[-300:]}")
+        states.extend(chunk_states)
+    remote = {path: (state if _SHA256_RE.match(state) else None) for path, state in zip(remote_paths, states)}
+
+    cached = set()
+    for checks in chunk_shell_words(list(cas_hashes)):
+        command = f'cd "{CAS_DIR}" 2>/dev/null && for h in {" ".join(checks)}; do [ -f "$h" ] && echo "$h"; done; true'
+        code, output = run_remote_command(ssh, command, timeout=600)
+        cached.update(line.strip() for line in output.splitlines() if _SHA256_RE.match(line.strip()))
+    return remote, cached
+
+
+def estimate_archive_delta(sftp, local_path, remote_path):
+    """读取远程压缩包中央目录，估算增量上传需要发送的字节数（变化条目的压缩后大小）"""
+    remote_entries = read_remote_entries(sftp, remote_path)
+    with zipfile.ZipFile(local_path) as local:
+        return sum(
+            info.compress_size for info in local.infolist()
+            if remote_entries.get(info.filename) != (info.CRC, info.file_size)
+        )
+
+
+def plan_server(server_name, server_cfg, project_cfg):
+    """生成单台服务器的部署计划"""
+    release_cfg = release_config(project_cfg)
+    cas_cfg = cas_config(server_cfg)
+    entries = []
+    for local_path, remote_path in resolve_file_mappings(project_cfg):
+        compare_path = remote_path
+        if release_cfg:
+            compare_path = release_target_path(release_cfg, f"{release_cfg['base'].rstrip('/')}/current", remote_path) or remote_path
+        entries.append({"local": local_path, "remote": remote_path, "compare": compare_path})
+
+    existing = [entry["local"] for entry in entries if os.path.isfile(entry["local"])]
+    local_hashes = fingerprints.sha256_many(existing)
+    ssh = ssh_pool.get(server_cfg)
+    remote, cached = query_remote_state(
+        ssh,
+        [entry["compare"] for entry in entries],
+        sorted(set(local_hashes.values())) if cas_cfg else (),
+    )
+
+    sftp = None
+    try:
+        for entry in entries:
+            local_path = entry["local"]
+            if local_path not in local_hashes:
+                entry.update(status="本地不存在", size=0, send=0, note="前置命令可能会生成该文件")
+                continue
+            size = os.path.getsize(local_path)
+            digest = local_hashes[local_path]
+            remote_digest = remote.get(entry["compare"])
+            status = "新增" if remote_digest is None else ("未变化" if remote_digest == digest else "已变化")
+            entry.update(status=status, size=size, send=size, note="")
+            if cas_cfg and digest in cached:
+                entry.update(send=0, note="服务器缓存命中")
+            elif status == "未变化":
+                entry["note"] = "内容相同，仍会上传"
+            elif status == "已变化" and archive_delta_enabled(project_cfg, local_path) and not cas_cfg:
+                try:
+                    sftp = sftp or ssh.open_sftp()
+                    delta = estimate_archive_delta(sftp, local_path, entry["compare"])
+                    if delta <= size * ARCHIVE_DELTA_MAX_RATIO:
+                        entry.update(send=delta, note="按条目增量上传（估算）")
+                except (IOError, zipfile.BadZipFile):
+                    pass
+    finally:
+        if sftp:
+            sftp.close()
+
+    send_bytes = sum(entry["send"] for entry in entries)
+    speed = throughput_history.estimate(server_cfg)
+    return {
+        "name": server_name,
+        "files": entries,
+        "send_bytes": send_bytes,
+        "speed_kbps": speed,
+        "eta": send_bytes / 1024 / speed if speed else None,
+    }
+
 
-        signals.finished.emit(True, "部署完成")
+def build_deploy_plan(config, project_cfg):
+    """预演完整部署：不执行任何命令、不上传文件，每台服务器只执行一次远程查询"""
+    servers = server_configs(config)
+    plan = {
+        "project": project_cfg.get("name", ""),
+        "pre_commands": list(project_cfg.get("pre_commands", [])),
+        "has_deploy_script": bool(project_cfg.get("scripts", {}).get("deploy")),
+        "health_check": describe_health_check(project_cfg["health_check"]) if project_cfg.get("health_check") else "",
+        "servers": [],
+    }
+    for server_name in project_server_names(project_cfg):
+        server_cfg = servers.get(server_name)
+        if not server_cfg:
+            plan["servers"].append({"name": server_name, "error": "服务器配置不存在"})
+            continue
+        try:
+            plan["servers"].append(plan_server(server_name, server_cfg, project_cfg))
+        except Exception as e:
+            ssh_pool.discard(server_cfg)
+            plan["servers"].append({"name": server_name, "error": str(e)})
+    return plan
+
+
+def _format_size(size):
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.2f}MB"
+    return f"{size / 1024:.1f}KB"
+
+
+def format_deploy_plan(plan):
+    lines = [f"部署计划: {plan['project']}", "=" * 60]
+    if plan["pre_commands"]:
+        lines.append("前置命令（将执行，没有构建缓存）:")
+        lines.extend(f"  - {command}" for command in plan["pre_commands"])
+    else:
+        lines.append("前置命令: 无")
+
+    total_send = 0
+    total_eta = 0.0
+    eta_known = True
+    for server in plan["servers"]:
+        lines.append("")
+        lines.append(f"[{server['name']}]")
+        if server.get("error"):
+            lines.append(f"  ✗ 无法生成计划: {server['error']}")
+            eta_known = False
+            continue
+        for entry in server["files"]:
+            note = f"  ({entry['note']})" if entry["note"] else ""
+            lines.append(f"  {entry['status']:<4} {_format_size(entry['size']):>10}  {entry['remote']}{note}")
+        eta = server["eta"]
+        speed = f"{server['speed_kbps']:.0f} KB/s" if server["speed_kbps"] else "无历史速度数据"
+        eta_text = f"约 {eta:.1f} 秒" if eta is not None else "未知"
+        lines.append(f"  发送 {_format_size(server['send_bytes'])}，预计速度 {speed}，传输耗时 {eta_text}")
+        total_send += server["send_bytes"]
+        if eta is None:
+            eta_known = False
+        else:
+            total_eta += eta
+
+    lines.append("")
+    lines.append("=" * 60)
+    lines.append(f"合计发送 {_format_size(total_send)}，传输耗时 {f'约 {total_eta:.1f} 秒' if eta_known else '未知（部分服务器无历史数据）'}")
+    lines.append(f"部署脚本: {'上传后执行' if plan['has_deploy_script'] else '未配置'}")
+    if plan["health_check"]:
+        lines.append(f"健康检查: {plan['health_check']}")
+    return "\n".join(lines)
+
+
+class PlanSignals(QObject):
+    done = pyqtSignal(str)
+
+
+def deploy_plan_worker(config, project_cfg, signals):
+    try:
+        text = format_deploy_plan(build_deploy_plan(config, project_cfg))
     except Exception as e:
-        signals.finished.emit(False, f"部署失败: {str(e)}")
+        text = f"生成部署计划失败: {str(e)}"
+    signals.done.emit(text)
+
+
+class DeployPlanDialog(QDialog):
+    """展示部署计划，确认后开始部署"""
+
+    def __init__(self, text, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("部署计划")
+        self.resize(900, 560)
+        layout = QVBoxLayout(self)
+        view = QPlainTextEdit()
+        view.setReadOnly(True)
+        view.setPlainText(text)
+        layout.addWidget(view)
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        btn_deploy = QPushButton("开始部署")
+        btn_deploy.clicked.connect(self.accept)
+        btn_close = QPushButton("关闭")
+        btn_close.clicked.connect(self.reject)
+        buttons.addWidget(btn_deploy)
+        buttons.addWidget(btn_close)
+        layout.addLayout(buttons)
 
 
 def upload_single_file_worker(server_cfg, local_file, remote_file, signals):
     """上传单个文件"""
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(
-            server_cfg["host"],
-            int(server_cfg["port"]),
-            server_cfg["username"],
-            server_cfg["password"]
-        )
-        signals.log.emit(f"✓ SSH 连接成功: {server_cfg['host']}")
+        ssh = connect_ssh(server_cfg)
+        signals.log.emit(f"✓ SSH 连接成功: {server_label(server_cfg)}")
 
         sftp = ssh.open_sftp()
         upload_file_to_server(sftp, local_file, remote_file, signals)
@@ -503,150 +4660,798 @@ def upload_single_file_worker(server_cfg, local_file, remote_file, signals):
         sftp.close()
         ssh.close()
 
-        signals.finished.emit(True, "文件上传完成")
-    except Exception as e:
-        signals.finished.emit(False, f"上传失败: {str(e)}")
+        signals.finished.emit(True, "文件上传完成")
+    except Exception as e:
+        signals.finished.emit(False, f"上传失败: {str(e)}")
+
+
+# 远程脚本执行前加载登录环境（非交互 SSH 会话默认不加载）
+# 加载 profile 可能较慢（conda、nvm 初始化），加载后的环境变量和函数缓存到服务器上的环境文件，
+# 之后直接读取；缓存超过 TTL 或任一 profile 比缓存新时重新生成
+REMOTE_ENV_CACHE = "~/.quickdeploy/env.sh"
+REMOTE_ENV_CACHE_TTL = 3600
+# 不缓存只读变量和每个会话各自的变量
+REMOTE_ENV_SKIP = r"^declare -[a-zA-Z]*r[a-zA-Z]* |^declare -x (SSH_[A-Z_]*|PWD|OLDPWD|SHLVL|_)(=|$)"
+REMOTE_ENV_PRELUDE = f"""qd_env={REMOTE_ENV_CACHE}
+qd_env_age=$(( $(date +%s) - $(stat -c %Y "$qd_env" 2>/dev/null || echo 0) ))
+if [ -s "$qd_env" ] && [ $qd_env_age -lt {REMOTE_ENV_CACHE_TTL} ] && ! [ /etc/profile -nt "$qd_env" ] \\
+    && ! [ ~/.bashrc -nt "$qd_env" ] && ! [ ~/.bash_profile -nt "$qd_env" ]; then
+    source "$qd_env" 2>/dev/null
+else
+    source /etc/profile 2>/dev/null || true
+    source ~/.bashrc 2>/dev/null || true
+    source ~/.bash_profile 2>/dev/null || true
+    mkdir -p ~/.quickdeploy 2>/dev/null \\
+        && {{ export -p | grep -Ev '{REMOTE_ENV_SKIP}'; declare -f; }} > "$qd_env.$$" 2>/dev/null \\
+        && mv -f "$qd_env.$$" "$qd_env" || rm -f "$qd_env.$$"
+fi
+unset qd_env qd_env_age"""
+
+
+def refresh_remote_env_worker(config, project_cfg, signals, stop_flag=None):
+    """删除项目各服务器上的环境缓存并重新生成（修改了 profile 之外的环境配置时使用）"""
+    try:
+        servers = server_configs(config)
+        refresh_cmd = f"rm -f {REMOTE_ENV_CACHE}; bash -c {shlex.quote(REMOTE_ENV_PRELUDE)}"
+        check_cmd = f"bash -c {shlex.quote(REMOTE_ENV_PRELUDE)}"
+        failed = []
+        for name in project_server_names(project_cfg):
+            if is_stopped(stop_flag):
+                raise OperationStopped()
+            server_cfg = servers.get(name)
+            if not server_cfg:
+                signals.log.emit(f"✗ {name}: 服务器配置不存在")
+                failed.append(name)
+                continue
+            try:
+                ssh = ssh_pool.get(server_cfg, stop_flag)
+                start_time = time.time()
+                run_remote_command(ssh, refresh_cmd, timeout=120)
+                load_time = time.time() - start_time
+                start_time = time.time()
+                run_remote_command(ssh, check_cmd)
+                cached_time = time.time() - start_time
+            except OperationStopped:
+                raise
+            except Exception as e:
+                ssh_pool.discard(server_cfg)
+                signals.log.emit(f"✗ {name}: {str(e)}")
+                failed.append(name)
+                continue
+            signals.log.emit(f"✓ {name}: 已重新生成环境缓存（加载登录环境 {load_time:.2f} 秒，读取缓存 {cached_time:.2f} 秒）")
+        if failed:
+            signals.finished.emit(False, f"{len(failed)} 台服务器刷新失败: {', '.join(failed)}")
+        else:
+            signals.finished.emit(True, "远程环境缓存已刷新")
+    except OperationStopped:
+        signals.finished.emit(False, "操作已停止")
+
+
+def run_detached_script(ssh, script_cmd, signals, stop_flag=None, health_cfg=None):
+    """在远程后台执行脚本并实时输出日志，返回 (是否成功, 消息)
+
+    脚本以独立进程组在后台运行，读取日志的连接断开不影响脚本；配置了健康检查时以服务就绪作为完成条件。
+    停止时终止远程脚本进程组并抛出 OperationStopped。
+    """
+    # 使用临时文件避免引号问题
+    # 1. 创建临时脚本文件
+    timestamp = int(time.time())
+    script_file = f"/tmp/deploy_script_{timestamp}.sh"
+    log_file = f"/tmp/deploy_log_{timestamp}.log"
+    done_file = f"/tmp/deploy_done_{timestamp}.flag"
+
+    signals.log.emit(f"执行命令: {script_cmd}")
+    signals.log.emit("=" * 60)
+
+    # 写入脚本内容
+    script_content = f"""#!/bin/bash
+{REMOTE_ENV_PRELUDE}
+{script_cmd}
+exit_code=$?
+echo "=== 脚本执行完成，退出码: $exit_code ==="
+echo $exit_code > {done_file}
+exit $exit_code
+"""
+    create_cmd = f"cat > {script_file} << 'EOFSCRIPT'\n{script_content}\nEOFSCRIPT\nchmod +x {script_file}"
+    # 等待脚本写入完成再启动，避免两条命令并发执行时脚本尚未创建
+    run_remote_command(ssh, create_cmd)
+
+    # 将脚本放到后台执行，输出到日志文件
+    # 使用 setsid 让脚本成为独立进程组，停止时可以连同子进程一起终止
+    bg_cmd = (
+        f"if command -v setsid >/dev/null 2>&1; then "
+        f"nohup setsid {script_file} > {log_file} 2>&1 < /dev/null & "
+        f"else nohup {script_file} > {log_file} 2>&1 < /dev/null & fi; echo $!"
+    )
+    signals.log.emit("脚本已在后台启动，正在读取日志...")
+
+    # 执行后台命令
+    stdin, stdout, stderr = ssh.exec_command(bg_cmd)
+    script_pid = stdout.read().decode('utf-8', errors='ignore').strip()
+
+    # 使用 tail -F 实时读取日志文件（文件尚未创建时会自动重试，无需固定等待）
+    tail_cmd = f"tail -n +1 -F {log_file} 2>/dev/null"
+    stdin, stdout, stderr = ssh.exec_command(tail_cmd, get_pty=True)
+
+    # 未配置健康检查时沿用超时判断（60秒无输出 / 总计10分钟）
+    start_time = time.time()
+    timeout = 600
+    last_line_time = start_time
+    # 完成标记的检查间隔自适应：从 0.25 秒开始逐步放大到 2 秒
+    check_interval = 0.25
+    last_check_time = start_time
+    stream = ChannelLineStream(stdout.channel)
+
+    # 配置了健康检查时，以服务就绪作为完成条件
+    gate = HealthGate(ssh, health_cfg) if health_cfg else None
+    if gate:
+        signals.log.emit(f"健康检查: {describe_health_check(health_cfg)}")
+    healthy = False
+    script_exit_code = None
+    drain_until = None  # 结束前再读取一小段时间，确保尾部日志输出完整
+
+    while True:
+        # 停止检查：终止远程脚本进程组，清理工作不等待结果
+        if stop_flag and stop_flag.get('stop'):
+            signals.log.emit("🛑 操作已停止，正在终止远程脚本...")
+            if script_pid.isdigit():
+                ssh.exec_command(
+                    f"kill -TERM -- -{script_pid} 2>/dev/null || kill -TERM {script_pid} 2>/dev/null; "
+                    f"rm -f {script_file} {log_file} {done_file}"
+                )
+            try:
+                stdout.channel.close()
+            except Exception:
+                pass
+            raise OperationStopped()
+
+        current_time = time.time()
+
+        if drain_until is not None:
+            if current_time >= drain_until:
+                break
+        else:
+            healthy_now = bool(gate and gate.poll())
+
+            # 检查完成标记文件（内容为脚本退出码）
+            # 健康检查刚通过时也立即检查一次，避免脚本失败时旧进程仍在运行被误判为成功
+            if script_exit_code is None and (healthy_now or current_time - last_check_time >= check_interval):
+                stdin_check, stdout_check, stderr_check = ssh.exec_command(f"cat {done_file} 2>/dev/null")
+                check_result = stdout_check.read().decode('utf-8', errors='ignore').strip()
+                if check_result:
+                    script_exit_code = check_result
+                    signals.log.emit("检测到脚本执行完成标记")
+                    # 脚本失败立即结束；未配置健康检查时脚本结束即完成
+                    if gate is None or script_exit_code != '0':
+                        drain_until = current_time + 0.5
+                last_check_time = current_time
+                check_interval = min(check_interval * 1.5, 2)
+
+            if gate and drain_until is None:
+                if healthy_now:
+                    healthy = True
+                    signals.log.emit(
+                        f"✓ 健康检查通过（{time.time() - start_time:.1f} 秒，第 {gate.attempts} 次检查）"
+                    )
+                    drain_until = current_time + 0.3
+                elif gate.expired():
+                    signals.log.emit(f"✗ 健康检查超时，最后一次输出: {gate.last_output}")
+                    break
+            elif gate is None and drain_until is None:
+                # 检查是否超时（超过60秒没有新输出）
+                if current_time - last_line_time > 60:
+                    signals.log.emit("日志输出超时（60秒无新输出），脚本可能已执行完成")
+                    break
+
+                # 检查总超时
+                if current_time - start_time > timeout:
+                    signals.log.emit("执行超时（10分钟）")
+                    break
+
+        # 非阻塞读取（按块读取，避免 readline 在没有换行的输出上阻塞导致无法停止）
+        if stdout.channel.recv_ready():
+            lines = stream.read_lines()
+            if lines:
+                last_line_time = current_time
+            for line in lines:
+                if line:
+                    signals.log.emit(line)
+        else:
+            time.sleep(0.05)
+
+    # 停止 tail 命令
+    try:
+        stdout.channel.close()
+    except Exception:
+        pass
+
+    # 读取退出码（未检测到完成标记时）
+    if script_exit_code is None and gate is None:
+        stdin, stdout, stderr = ssh.exec_command(f"cat {done_file} 2>/dev/null || echo '0'")
+        script_exit_code = stdout.read().decode('utf-8', errors='ignore').strip()
+
+    # 清理临时文件
+    ssh.exec_command(f"rm -f {script_file} {log_file} {done_file}")
+
+    signals.log.emit("=" * 60)
+
+    if script_exit_code not in (None, '0'):
+        return False, f"脚本执行失败，退出码: {script_exit_code}"
+    if gate and not healthy:
+        return False, f"健康检查未通过: {gate.last_output}"
+    if gate:
+        return True, "脚本执行完成，服务健康检查通过"
+    return True, "脚本执行完成"
+
+
+# ============================================================
+# 状态总览
+# ============================================================
+STATUS_CACHE_TTL = 30      # 状态结果缓存有效期（秒）
+STATUS_MAX_PER_SERVER = 8  # 同一服务器同时执行的状态脚本数（sshd 默认每个连接最多 10 个会话）
+STATUS_TIMEOUT = 30
+
+
+class StatusCache:
+    """项目状态结果缓存，键为 (项目 ID, 服务器名称)，超过 TTL 的结果会在后台刷新"""
+
+    def __init__(self, ttl=STATUS_CACHE_TTL):
+        self.ttl = ttl
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._results.get(key)
+
+    def put(self, key, result):
+        with self._lock:
+            self._results[key] = result
+
+    def is_fresh(self, key):
+        result = self.get(key)
+        return bool(result) and time.time() - result["checked_at"] < self.ttl
+
+
+status_cache = StatusCache()
+
+
+async def check_project_status_async(server_cfg, project_cfg, timeout=STATUS_TIMEOUT):
+    """通过连接池执行项目的状态脚本，返回结果字典；同一服务器的检查共用一个连接"""
+    script = project_cfg.get("scripts", {}).get("status", "")
+    result = {"exit_code": None, "output": "", "error": "", "latency": 0.0, "checked_at": 0.0}
+    start_time = time.time()
+    try:
+        async with orchestrator.session(server_cfg, STATUS_MAX_PER_SERVER):
+            ssh = await orchestrator.blocking(ssh_pool.get, server_cfg, timeout=timeout)
+            command = f"bash -c {shlex.quote(REMOTE_ENV_PRELUDE + chr(10) + script)}"
+            result["exit_code"], result["output"] = await run_remote_command_async(ssh, command, timeout)
+    except asyncio.TimeoutError:
+        # 超时的连接可能已经卡住，丢弃后下次重连
+        await orchestrator.blocking(ssh_pool.discard, server_cfg)
+        result["error"] = f"超时（{timeout} 秒）"
+    except Exception as e:
+        # 连接可能已失效，丢弃后下次重连
+        await orchestrator.blocking(ssh_pool.discard, server_cfg)
+        result["error"] = str(e) or e.__class__.__name__
+    result["latency"] = time.time() - start_time
+    result["checked_at"] = time.time()
+    return result
+
+
+def check_project_status(server_cfg, project_cfg, timeout=STATUS_TIMEOUT):
+    """check_project_status_async 的同步版本，供工作线程调用"""
+    return orchestrator.run(check_project_status_async(server_cfg, project_cfg, timeout))
+
+
+class DashboardSignals(QObject):
+    result = pyqtSignal(object, dict)
+
+
+class StatusDashboard(QDialog):
+    """所有项目的状态总览：在异步调度器中并发执行状态脚本，按服务器复用连接，结果带 TTL 缓存"""
+
+    COLUMNS = ["项目", "服务器", "状态", "退出码", "耗时", "检查时间", "输出"]
+
+    def __init__(self, get_config, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("状态总览")
+        self.resize(1000, 500)
+        self.get_config = get_config
+        self.in_flight = set()
+        self.rows = {}
+        self.round_start = None
+        self.last_round = None
+
+        self.signals = DashboardSignals()
+        self.signals.result.connect(self.on_result)
 
+        layout = QVBoxLayout(self)
 
-def execute_script_worker(server_cfg, script_cmd, signals, stop_flag=None):
-    """执行远程脚本，实时输出日志"""
-    try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(
-            server_cfg["host"],
-            int(server_cfg["port"]),
-            server_cfg["username"],
-            server_cfg["password"]
-        )
-        signals.log.emit(f"✓ SSH 连接成功: {server_cfg['host']}")
-        
-        # 使用临时文件避免引号问题
-        # 1. 创建临时脚本文件
-        timestamp = int(time.time())
-        script_file = f"/tmp/deploy_script_{timestamp}.sh"
-        log_file = f"/tmp/deploy_log_{timestamp}.log"
-        done_file = f"/tmp/deploy_done_{timestamp}.flag"
-        
-        signals.log.emit(f"执行命令: {script_cmd}")
-        signals.log.emit("=" * 60)
+        self.tree = QTreeWidget()
+        self.tree.setHeaderLabels(self.COLUMNS)
+        self.tree.setRootIsDecorated(False)
+        self.tree.setColumnWidth(0, 200)
+        self.tree.setColumnWidth(1, 120)
+        layout.addWidget(self.tree)
 
-        # 写入脚本内容
-        script_content = f"""#!/bin/bash
-source /etc/profile 2>/dev/null || true
-source ~/.bashrc 2>/dev/null || true
-source ~/.bash_profile 2>/dev/null || true
-{script_cmd}
-exit_code=$?
-echo "=== 脚本执行完成，退出码: $exit_code ==="
-echo $exit_code > {done_file}
-exit $exit_code
-"""
-        create_cmd = f"cat > {script_file} << 'EOFSCRIPT'\n{script_content}\nEOFSCRIPT\nchmod +x {script_file}"
-        ssh.exec_command(create_cmd)
-        
-        # 将脚本放到后台执行，输出到日志文件
-        bg_cmd = f"nohup {script_file} > {log_file} 2>&1 &"
-        signals.log.emit("脚本已在后台启动，正在读取日志...")
-        
-        # 执行后台命令
-        stdin, stdout, stderr = ssh.exec_command(bg_cmd)
-        stdout.channel.recv_exit_status()
-        
-        # 等待日志文件创建
-        time.sleep(1)
-        
-        # 使用 tail -f 实时读取日志文件
-        tail_cmd = f"tail -f {log_file}"
-        stdin, stdout, stderr = ssh.exec_command(tail_cmd, get_pty=True)
-        
-        # 设置超时时间（10分钟）
-        start_time = time.time()
-        timeout = 600
-        last_line_time = start_time
-        check_interval = 2  # 每2秒检查一次完成标记
-        last_check_time = start_time
-        
-        while True:
-            # 停止检查
-            if stop_flag and stop_flag.get('stop'):
-                signals.log.emit("🛑 操作已停止，正在清理...")
-                break
+        bottom_layout = QHBoxLayout()
+        self.lbl_summary = QLabel("")
+        bottom_layout.addWidget(self.lbl_summary, 1)
+        self.btn_refresh = QPushButton("全部刷新")
+        self.btn_refresh.clicked.connect(lambda: self.refresh(force=True))
+        bottom_layout.addWidget(self.btn_refresh)
+        layout.addLayout(bottom_layout)
 
-            current_time = time.time()
-            
-            # 每2秒检查一次完成标记文件
-            if current_time - last_check_time >= check_interval:
-                # 检查完成标记文件是否存在
-                stdin_check, stdout_check, stderr_check = ssh.exec_command(f"test -f {done_file} && echo 'DONE'")
-                check_result = stdout_check.read().decode('utf-8', errors='ignore').strip()
-                if check_result == 'DONE':
-                    signals.log.emit("检测到脚本执行完成标记")
-                    time.sleep(1)  # 等待1秒确保所有日志都输出
-                    break
-                last_check_time = current_time
-            
-            # 检查是否超时（超过60秒没有新输出）
-            if current_time - last_line_time > 60:
-                signals.log.emit("日志输出超时（60秒无新输出），脚本可能已执行完成")
-                break
-            
-            # 检查总超时
-            if current_time - start_time > timeout:
-                signals.log.emit("执行超时（10分钟）")
-                break
-            
-            # 非阻塞读取
-            if stdout.channel.recv_ready():
-                line = stdout.readline()
-                if line:
-                    last_line_time = current_time
-                    # 去除 ANSI 颜色代码
-                    clean_line = re.sub(r'\x1b\[[0-9;]*m', '', line.rstrip())
-                    if clean_line:
-                        signals.log.emit(clean_line)
-            else:
-                time.sleep(0.1)
-        
-        # 停止 tail 命令
+        # 后台定时刷新过期的结果
+        self.timer = QTimer(self)
+        self.timer.setInterval(5000)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.reload_projects()
+        self.refresh()
+        self.timer.start()
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def reload_projects(self):
+        """按当前配置重建行（服务器组的项目每台服务器一行），已有缓存结果直接显示"""
+        config = self.get_config()
+        self.tree.clear()
+        self.rows = {}
+        for project_id, project_cfg in config.get("projects", {}).items():
+            if not project_cfg.get("scripts", {}).get("status"):
+                continue
+            name = f"{project_cfg.get('name', project_id)} ({project_id})"
+            for server_name in project_server_names(project_cfg):
+                item = QTreeWidgetItem(self.tree, [name, server_name, "", "", "", "", ""])
+                key = (project_id, server_name)
+                self.rows[key] = item
+                cached = status_cache.get(key)
+                if cached:
+                    self.render_result(item, cached)
+                else:
+                    item.setText(2, "等待检查")
+        self.update_summary()
+
+    def refresh(self, force=False):
+        """刷新过期（或全部）项目的状态，已在检查中的项目不会重复提交"""
+        config = self.get_config()
+        servers = server_configs(config)
+        submitted = 0
+        for key, item in self.rows.items():
+            if key in self.in_flight:
+                continue
+            if not force and status_cache.is_fresh(key):
+                continue
+            project_id, server_name = key
+            project_cfg = config.get("projects", {}).get(project_id)
+            server_cfg = servers.get(server_name) if project_cfg else None
+            if not server_cfg:
+                item.setText(2, "✗ 服务器不存在")
+                continue
+            self.in_flight.add(key)
+            item.setText(2, "检查中…")
+            orchestrator.submit(self._check(key, server_cfg, project_cfg))
+            submitted += 1
+        if submitted and self.round_start is None:
+            self.round_start = time.time()
+
+    async def _check(self, key, server_cfg, project_cfg):
+        result = await check_project_status_async(server_cfg, project_cfg)
+        status_cache.put(key, result)
         try:
-            stdout.channel.close()
-        except:
-            pass
-        
-        # 读取退出码
-        stdin, stdout, stderr = ssh.exec_command(f"cat {done_file} 2>/dev/null || echo '0'")
-        script_exit_code = stdout.read().decode('utf-8', errors='ignore').strip()
-        
-        # 清理临时文件
-        ssh.exec_command(f"rm -f {script_file} {log_file} {done_file}")
-        
-        signals.log.emit("=" * 60)
-        
-        ssh.close()
+            self.signals.result.emit(key, result)
+        except RuntimeError:
+            pass  # 窗口已销毁
+
+    def on_result(self, key, result):
+        self.in_flight.discard(key)
+        item = self.rows.get(key)
+        if item:
+            self.render_result(item, result)
+        self.update_summary()
+
+    def render_result(self, item, result):
+        if result["error"]:
+            status = "✗ 连接失败"
+        elif result["exit_code"] == 0:
+            status = "✓ 正常"
+        else:
+            status = "✗ 异常"
+        output = result["error"] or result["output"].strip()
+        last_line = output.splitlines()[-1] if output else ""
+        item.setText(2, status)
+        item.setText(3, "" if result["exit_code"] is None else str(result["exit_code"]))
+        item.setText(4, f"{result['latency'] * 1000:.0f} ms")
+        item.setText(5, time.strftime("%H:%M:%S", time.localtime(result["checked_at"])))
+        item.setText(6, last_line)
+        item.setToolTip(6, output[-4000:])
+
+    def update_summary(self):
+        ok = bad = 0
+        for key in self.rows:
+            cached = status_cache.get(key)
+            if not cached:
+                continue
+            if cached["exit_code"] == 0 and not cached["error"]:
+                ok += 1
+            else:
+                bad += 1
+        projects = len({project_id for project_id, _ in self.rows})
+        text = f"共 {len(self.rows)} 项（{projects} 个项目），正常 {ok}，异常 {bad}"
+        if not self.in_flight and self.round_start is not None:
+            self.last_round = time.time() - self.round_start
+            self.round_start = None
+        if self.last_round is not None:
+            text += f"，上次检查耗时 {self.last_round:.1f} 秒"
+        if self.in_flight:
+            text += f"，检查中 {len(self.in_flight)} 个"
+        self.lbl_summary.setText(text)
 
-        if stop_flag and stop_flag.get('stop'):
-            signals.finished.emit(False, "操作已停止")
-            return
 
-        if script_exit_code == '0':
-            signals.finished.emit(True, "脚本执行完成")
-        else:
-            signals.finished.emit(False, f"脚本执行失败，退出码: {script_exit_code}")
-    except Exception as e:
-        signals.finished.emit(False, f"执行失败: {str(e)}")
+# ============================================================
+# 远程日志跟踪
+# ============================================================
+class SpillingLogBuffer:
+    """有界内存日志缓冲
+
+    内存中最多保留 max_lines 行，超出的旧行以及被限流的行写入磁盘溢出文件，
+    界面只从内存中取尚未显示的新行。溢出文件只在跟踪期间保留，close 时删除。
+    """
+
+    def __init__(self, max_lines=20000):
+        self.max_lines = max_lines
+        self.lines = deque()
+        self.unseen = 0
+        self.spilled = 0
+        self.lock = threading.Lock()
+        self.spill_file = tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", prefix="quick_deploy_logs_", suffix=".log", delete=False
+        )
+
+    @property
+    def spill_path(self):
+        return self.spill_file.name
+
+    def append(self, lines):
+        with self.lock:
+            self.lines.extend(lines)
+            self.unseen = min(self.unseen + len(lines), self.max_lines)
+            overflow = len(self.lines) - self.max_lines
+            if overflow > 0:
+                self._spill([self.lines.popleft() for _ in range(overflow)])
+
+    def spill(self, lines):
+        """不进入内存视图、直接写入溢出文件（被限流的行）"""
+        with self.lock:
+            self._spill(lines)
+
+    def _spill(self, lines):
+        # 停止后跟踪线程可能还有最后一批行，文件已关闭则丢弃
+        if self.spill_file.closed:
+            return
+        self.spill_file.write("\n".join(lines) + "\n")
+        self.spill_file.flush()
+        self.spilled += len(lines)
+
+    def drain_new(self):
+        """取出界面尚未显示的行"""
+        with self.lock:
+            if not self.unseen:
+                return []
+            new_lines = list(self.lines)[-self.unseen:]
+            self.unseen = 0
+            return new_lines
+
+    def close(self):
+        with self.lock:
+            self.spill_file.close()
+            try:
+                os.remove(self.spill_file.name)
+            except OSError:
+                pass
+
+
+class RemoteLogFollower:
+    """通过连接池同时跟踪多台服务器上的日志文件
+
+    每个日志文件在对应服务器的共享连接上打开一个通道执行 tail -F，
+    配置了过滤条件时在服务器端用 grep 过滤以节省带宽；每个日志流单独限速，
+    超出速率的行只写入溢出文件。
+    """
+
+    RECONNECT_DELAY = 3
+
+    def __init__(self, targets, buffer, pattern="", lines_per_second=200):
+        # targets: [(标签, server_cfg, 日志路径)]
+        self.targets = targets
+        self.buffer = buffer
+        self.pattern = pattern
+        self.lines_per_second = lines_per_second
+        self.running = False
+        self.threads = []
+        self.channels = []
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def build_command(self, path):
+        command = f"tail -n 0 -F {shlex.quote(path)} 2>&1"
+        if self.pattern:
+            command += f" | grep --line-buffered -E -- {shlex.quote(self.pattern)}"
+        return command
+
+    def start(self):
+        self.running = True
+        for tag, server_cfg, path in self.targets:
+            self.stats[tag] = {"lines": 0, "throttled": 0}
+            t = threading.Thread(target=self._follow, args=(tag, server_cfg, path), daemon=True)
+            self.threads.append(t)
+            t.start()
+
+    def stop(self):
+        self.running = False
+        with self.lock:
+            channels, self.channels = self.channels, []
+        for channel in channels:
+            try:
+                channel.close()
+            except Exception:
+                pass
+
+    def _follow(self, tag, server_cfg, path):
+        bucket = TokenBucket(self.lines_per_second, self.lines_per_second * 2)
+        stats = self.stats[tag]
+        while self.running:
+            ssh = channel = None
+            try:
+                ssh = ssh_pool.get(server_cfg)
+                channel = ssh.get_transport().open_session()
+                with self.lock:
+                    self.channels.append(channel)
+                channel.exec_command(self.build_command(path))
+                self.buffer.append([f"[{tag}] ▶ 开始跟踪 {path}"])
+                stream = ChannelLineStream(channel)
+                while self.running and not stream.eof:
+                    lines = stream.read_lines()
+                    if not lines:
+                        if channel.exit_status_ready() and not channel.recv_ready():
+                            break
+                        time.sleep(0.05)
+                        continue
+                    shown, throttled = [], []
+                    for line in lines:
+                        tagged = f"[{tag}] {line}"
+                        (shown if bucket.try_take() else throttled).append(tagged)
+                    stats["lines"] += len(lines)
+                    if shown:
+                        self.buffer.append(shown)
+                    if throttled:
+                        stats["throttled"] += len(throttled)
+                        self.buffer.spill(throttled)
+            except Exception as e:
+                if self.running:
+                    self.buffer.append([f"[{tag}] ✗ 跟踪中断: {str(e)}，{self.RECONNECT_DELAY} 秒后重连"])
+                    # 连接由其他日志流和状态总览共用，只有连接本身已断开时才丢弃
+                    transport = ssh.get_transport() if ssh is not None else None
+                    if transport is None or not transport.is_active():
+                        ssh_pool.discard(server_cfg)
+            finally:
+                if channel is not None:
+                    channel.close()
+                    with self.lock:
+                        if channel in self.channels:
+                            self.channels.remove(channel)
+            if self.running:
+                time.sleep(self.RECONNECT_DELAY)
+
+
+def collect_log_targets(config, project_ids):
+    """根据项目配置的 logs 字段生成日志跟踪目标"""
+    targets = []
+    servers = server_configs(config)
+    for project_id in project_ids:
+        project_cfg = config.get("projects", {}).get(project_id, {})
+        logs = project_cfg.get("logs", [])
+        for server_name in project_server_names(project_cfg):
+            server_cfg = servers.get(server_name)
+            if not server_cfg:
+                continue
+            for path in logs:
+                tag = server_name if len(logs) == 1 else f"{server_name}:{os.path.basename(path)}"
+                targets.append((tag, server_cfg, path))
+    return targets
 
 
+class LogFollowDialog(QDialog):
+    """多服务器日志实时跟踪面板"""
 
+    MAX_VIEW_LINES = 5000
 
+    def __init__(self, get_config, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("日志跟踪")
+        self.resize(1100, 650)
+        self.get_config = get_config
+        self.follower = None
+        self.buffer = None
 
+        layout = QVBoxLayout(self)
 
+        top_layout = QHBoxLayout()
+        self.project_list = QTreeWidget()
+        self.project_list.setHeaderLabels(["项目（配置了 logs）"])
+        self.project_list.setMaximumHeight(140)
+        top_layout.addWidget(self.project_list, 1)
+
+        option_layout = QFormLayout()
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("服务器端 grep -E 过滤，例如 ERROR|WARN")
+        option_layout.addRow("过滤:", self.filter_edit)
+        self.rate_spin = QSpinBox()
+        self.rate_spin.setRange(1, 100000)
+        self.rate_spin.setValue(200)
+        self.rate_spin.setSuffix(" 行/秒")
+        option_layout.addRow("每个日志限速:", self.rate_spin)
+        btn_layout = QHBoxLayout()
+        self.btn_start = QPushButton("开始跟踪")
+        self.btn_start.clicked.connect(self.start_follow)
+        self.btn_stop = QPushButton("停止跟踪")
+        self.btn_stop.clicked.connect(self.stop_follow)
+        self.btn_stop.setEnabled(False)
+        btn_clear = QPushButton("清空")
+        btn_layout.addWidget(self.btn_start)
+        btn_layout.addWidget(self.btn_stop)
+        btn_layout.addWidget(btn_clear)
+        option_layout.addRow(btn_layout)
+        top_layout.addLayout(option_layout, 1)
+        layout.addLayout(top_layout)
+
+        self.view = QPlainTextEdit()
+        self.view.setReadOnly(True)
+        self.view.setMaximumBlockCount(self.MAX_VIEW_LINES)
+        btn_clear.clicked.connect(self.view.clear)
+        layout.addWidget(self.view)
+
+        self.lbl_stats = QLabel("")
+        layout.addWidget(self.lbl_stats)
+
+        # 定时批量把新行刷到界面，避免每行一个信号
+        self.timer = QTimer(self)
+        self.timer.setInterval(200)
+        self.timer.timeout.connect(self.flush_view)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.follower is None:
+            self.reload_projects()
+
+    def reload_projects(self):
+        self.project_list.clear()
+        for project_id, project_cfg in self.get_config().get("projects", {}).items():
+            if not project_cfg.get("logs"):
+                continue
+            item = QTreeWidgetItem(self.project_list, [f"{project_cfg.get('name', project_id)} ({project_id})"])
+            item.setData(0, Qt.ItemDataRole.UserRole, project_id)
+            item.setCheckState(0, Qt.CheckState.Checked)
+
+    def selected_projects(self):
+        project_ids = []
+        for i in range(self.project_list.topLevelItemCount()):
+            item = self.project_list.topLevelItem(i)
+            if item.checkState(0) == Qt.CheckState.Checked:
+                project_ids.append(item.data(0, Qt.ItemDataRole.UserRole))
+        return project_ids
+
+    def start_follow(self):
+        targets = collect_log_targets(self.get_config(), self.selected_projects())
+        if not targets:
+            QMessageBox.warning(self, "提示", "请选择配置了 logs 的项目")
+            return
+        self.buffer = SpillingLogBuffer()
+        self.follower = RemoteLogFollower(
+            targets, self.buffer, self.filter_edit.text().strip(), self.rate_spin.value()
+        )
+        self.follower.start()
+        self.timer.start()
+        self.btn_start.setEnabled(False)
+        self.btn_stop.setEnabled(True)
+        self.view.appendPlainText(f"开始跟踪 {len(targets)} 个日志，溢出文件: {self.buffer.spill_path}")
+
+    def stop_follow(self):
+        if self.follower:
+            self.follower.stop()
+            self.flush_view()
+            self.buffer.close()
+        self.follower = None
+        self.timer.stop()
+        self.btn_start.setEnabled(True)
+        self.btn_stop.setEnabled(False)
 
+    def flush_view(self):
+        if not self.buffer:
+            return
+        new_lines = self.buffer.drain_new()
+        if new_lines:
+            self.view.appendPlainText("\n".join(new_lines[-self.MAX_VIEW_LINES:]))
+        if self.follower:
+            total = sum(stat["lines"] for stat in self.follower.stats.values())
+            throttled = sum(stat["throttled"] for stat in self.follower.stats.values())
+            self.lbl_stats.setText(
+                f"已接收 {total} 行，限流 {throttled} 行，写入溢出文件 {self.buffer.spilled} 行"
+            )
+
+    def hideEvent(self, event):
+        # Esc / reject / hide 都不经过 closeEvent，在隐藏时停止跟踪；最小化不停止
+        if not event.spontaneous():
+            self.stop_follow()
+        super().hideEvent(event)
+
+    def closeEvent(self, event):
+        self.stop_follow()
+        super().closeEvent(event)
 
 
 # ============================================================
 # 配置编辑器
 # ============================================================
+CONFIG_KEY_ROLE = Qt.ItemDataRole.UserRole + 1      # 条目名（服务器名称 / 项目 ID）
+CONFIG_SEARCH_ROLE = Qt.ItemDataRole.UserRole + 2   # 搜索匹配的文本
+
+
+class ReusableRows:
+    """表单中可增删的一组行（文件映射、前置命令），切换条目时复用已创建的控件
+
+    rows 与布局中的顺序一致，前 active 行可见；删除的行隐藏后移到末尾，下次添加时复用。
+    """
+
+    def __init__(self, layout, create, fill):
+        self.layout = layout
+        self.create = create
+        self.fill = fill
+        self.rows = []
+        self.active = 0
+
+    def _row(self, index):
+        while len(self.rows) <= index:
+            row = self.create()
+            self.rows.append(row)
+            self.layout.addWidget(row["widget"])
+        return self.rows[index]
+
+    def set_values(self, values):
+        values = list(values)
+        for index, value in enumerate(values):
+            row = self._row(index)
+            self.fill(row, value)
+            row["widget"].show()
+        for row in self.rows[len(values):]:
+            row["widget"].hide()
+        self.active = len(values)
+
+    def append(self, value):
+        row = self._row(self.active)
+        self.fill(row, value)
+        row["widget"].show()
+        self.active += 1
+        return row
+
+    def remove(self, row):
+        self.rows.remove(row)
+        self.rows.append(row)
+        self.layout.removeWidget(row["widget"])
+        self.layout.addWidget(row["widget"])
+        row["widget"].hide()
+        self.active -= 1
+
+    def active_rows(self):
+        return self.rows[:self.active]
+
+
 class ConfigEditor(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -680,19 +5485,68 @@ class ConfigEditor(QDialog):
         btn_layout.addWidget(self.btn_save)
         layout.addLayout(btn_layout)
 
+    def create_entry_list(self, layout, title, placeholder, on_selected, on_context_menu):
+        """左侧条目列表：模型 + 过滤代理，搜索框输入时增量过滤（不区分大小写，匹配任意位置）"""
+        layout.addWidget(QLabel(title))
+        search_edit = QLineEdit()
+        search_edit.setPlaceholderText(placeholder)
+        search_edit.setClearButtonEnabled(True)
+        layout.addWidget(search_edit)
+
+        model = QStandardItemModel(self)
+        proxy = QSortFilterProxyModel(self)
+        proxy.setSourceModel(model)
+        proxy.setFilterRole(CONFIG_SEARCH_ROLE)
+        proxy.setFilterCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        search_edit.textChanged.connect(proxy.setFilterFixedString)
+
+        view = QListView()
+        view.setModel(proxy)
+        view.setUniformItemSizes(True)
+        view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        view.clicked.connect(lambda index: on_selected(index.data(CONFIG_KEY_ROLE)))
+        view.activated.connect(lambda index: on_selected(index.data(CONFIG_KEY_ROLE)))
+        # 启用右键菜单
+        view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        view.customContextMenuRequested.connect(on_context_menu)
+        layout.addWidget(view)
+        view.search_edit = search_edit
+        return view, model
+
+    def fill_entry_list(self, view, model, entries, current=None):
+        """entries 为 [(条目名, 提示文本)]，重新填充后选中正在编辑的条目"""
+        model.clear()
+        for key, hint in entries:
+            item = QStandardItem(key)
+            item.setData(key, CONFIG_KEY_ROLE)
+            item.setData(f"{key} {hint}", CONFIG_SEARCH_ROLE)
+            if hint:
+                item.setToolTip(hint)
+            model.appendRow(item)
+        if current is not None:
+            self.select_entry(view, model, current)
+
+    def select_entry(self, view, model, key):
+        for row in range(model.rowCount()):
+            item = model.item(row)
+            if item.data(CONFIG_KEY_ROLE) == key:
+                index = view.model().mapFromSource(item.index())
+                if not index.isValid():
+                    # 被搜索条件过滤掉时清空搜索
+                    view.search_edit.clear()
+                    index = view.model().mapFromSource(item.index())
+                view.setCurrentIndex(index)
+                view.scrollTo(index)
+                return
+
     def init_server_tab(self):
         layout = QHBoxLayout(self.server_tab)
 
         # 左侧服务器列表
         left_layout = QVBoxLayout()
-        left_layout.addWidget(QLabel("服务器列表"))
-        self.server_list = QTreeWidget()
-        self.server_list.setHeaderLabels(["服务器名称"])
-        self.server_list.itemClicked.connect(self.on_server_selected)
-        # 启用右键菜单
-        self.server_list.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
-        self.server_list.customContextMenuRequested.connect(self.show_server_context_menu)
-        left_layout.addWidget(self.server_list)
+        self.server_list, self.server_model = self.create_entry_list(
+            left_layout, "服务器列表", "搜索服务器名称或地址", self.on_server_selected, self.show_server_context_menu
+        )
 
         btn_layout = QHBoxLayout()
         btn_add_server = QPushButton("新增服务器")
@@ -714,11 +5568,13 @@ class ConfigEditor(QDialog):
         self.server_form_widget = QWidget()
         self.server_form_layout = QFormLayout(self.server_form_widget)
         self.server_form_area.setWidget(self.server_form_widget)
+        self.server_form_widget.hide()
         right_layout.addWidget(self.server_form_area)
 
         layout.addLayout(right_layout, 7)
 
         self.server_fields = {}
+        self.server_edits = {}   # 已创建的字段输入框，切换服务器时复用
         self.current_server = None
         self.load_server_list()
 
@@ -727,14 +5583,9 @@ class ConfigEditor(QDialog):
 
         # 左侧项目列表
         left_layout = QVBoxLayout()
-        left_layout.addWidget(QLabel("项目列表"))
-        self.project_list = QTreeWidget()
-        self.project_list.setHeaderLabels(["项目名称"])
-        self.project_list.itemClicked.connect(self.on_project_selected)
-        # 启用右键菜单
-        self.project_list.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
-        self.project_list.customContextMenuRequested.connect(self.show_project_context_menu)
-        left_layout.addWidget(self.project_list)
+        self.project_list, self.project_model = self.create_entry_list(
+            left_layout, "项目列表", "搜索项目 ID 或名称", self.on_project_selected, self.show_project_context_menu
+        )
 
         btn_layout = QHBoxLayout()
         btn_add_project = QPushButton("新增项目")
@@ -756,6 +5607,7 @@ class ConfigEditor(QDialog):
         self.project_form_widget = QWidget()
         self.project_form_layout = QFormLayout(self.project_form_widget)
         self.project_form_area.setWidget(self.project_form_widget)
+        self.project_form_widget.hide()
         right_layout.addWidget(self.project_form_area)
 
         layout.addLayout(right_layout, 7)
@@ -765,150 +5617,176 @@ class ConfigEditor(QDialog):
         self.load_project_list()
 
     def load_server_list(self):
-        self.server_list.clear()
-        for server_name in self.config.get("servers", {}).keys():
-            QTreeWidgetItem(self.server_list, [server_name])
+        self.fill_entry_list(self.server_list, self.server_model, [
+            (name, str(server_data.get("host", ""))) for name, server_data in self.config.get("servers", {}).items()
+        ], self.current_server)
 
     def load_project_list(self):
-        self.project_list.clear()
-        for project_name in self.config.get("projects", {}).keys():
-            QTreeWidgetItem(self.project_list, [project_name])
-
-    def clear_form(self, form_layout, fields_dict):
-        while form_layout.count():
-            item = form_layout.takeAt(0)
-            if item.widget():
-                item.widget().deleteLater()
-        fields_dict.clear()
-
-    def on_server_selected(self, item):
-        server_name = item.text(0)
+        self.fill_entry_list(self.project_list, self.project_model, [
+            (project_id, str(project_data.get("name", "")))
+            for project_id, project_data in self.config.get("projects", {}).items()
+        ], self.current_project)
+
+    def on_server_selected(self, server_name):
+        if server_name not in self.config.get("servers", {}):
+            return
         self.current_server = server_name
         self.render_server_form(server_name)
 
+    def server_edit(self, key):
+        """取得字段的输入框，首次用到时创建（插入在测试按钮之前）"""
+        edit = self.server_edits.get(key)
+        if edit is None:
+            edit = QLineEdit()
+            self.server_form_layout.insertRow(self.server_form_layout.rowCount() - 1, QLabel(key), edit)
+            self.server_edits[key] = edit
+        return edit
+
     def render_server_form(self, server_name):
-        self.clear_form(self.server_form_layout, self.server_fields)
+        if "_name" not in self.server_edits:
+            # 首次选中服务器时创建表单，之后只更新内容
+            name_edit = QLineEdit()
+            self.server_form_layout.addRow(QLabel("服务器名称"), name_edit)
+            self.server_edits["_name"] = name_edit
+            btn_test = QPushButton("测试 SSH 连接")
+            btn_test.clicked.connect(lambda: self.test_ssh_connection(self.current_server))
+            self.server_form_layout.addRow(btn_test)
 
         server_data = self.config["servers"][server_name]
-
-        # 服务器名称
-        name_edit = QLineEdit(server_name)
-        self.server_form_layout.addRow(QLabel("服务器名称"), name_edit)
-        self.server_fields["_name"] = name_edit
-
-        # 其他字段
-        for key, value in server_data.items():
-            edit = QLineEdit(str(value))
-            if key == "password":
-                edit.setEchoMode(QLineEdit.EchoMode.Password)
-            self.server_form_layout.addRow(QLabel(key), edit)
+        self.server_fields = {"_name": self.server_edits["_name"]}
+        self.server_fields["_name"].setText(server_name)
+
+        # 配置中已有的字段，其余可选字段留空
+        for key in list(server_data) + [key for key in SERVER_OPTIONAL_KEYS if key not in server_data]:
+            edit = self.server_edit(key)
+            edit.setText(str(server_data.get(key, "")))
+            edit.setPlaceholderText("" if key in server_data else "可选")
+            edit.setEchoMode(QLineEdit.EchoMode.Password if key == "password" else QLineEdit.EchoMode.Normal)
             self.server_fields[key] = edit
+        for key, edit in self.server_edits.items():
+            self.server_form_layout.setRowVisible(edit, key in self.server_fields)
+        self.server_form_widget.show()
 
-        # 测试连接按钮
-        btn_test = QPushButton("测试 SSH 连接")
-        btn_test.clicked.connect(lambda: self.test_ssh_connection(server_name))
-        self.server_form_layout.addRow(btn_test)
-
-    def on_project_selected(self, item):
-        project_name = item.text(0)
+    def on_project_selected(self, project_name):
+        if project_name not in self.config.get("projects", {}):
+            return
         self.current_project = project_name
         self.render_project_form(project_name)
 
-    def render_project_form(self, project_name):
-        self.clear_form(self.project_form_layout, self.project_fields)
-
-        project_data = self.config["projects"][project_name]
+    def build_project_form(self):
+        """创建项目表单（首次选中项目时），之后切换项目只更新控件内容"""
+        form = self.project_form_layout
 
         # 项目 ID
-        id_edit = QLineEdit(project_name)
-        self.project_form_layout.addRow(QLabel("项目 ID"), id_edit)
+        id_edit = QLineEdit()
+        form.addRow(QLabel("项目 ID"), id_edit)
         self.project_fields["_id"] = id_edit
 
         # 项目名称
-        name_edit = QLineEdit(project_data.get("name", ""))
-        self.project_form_layout.addRow(QLabel("项目名称"), name_edit)
+        name_edit = QLineEdit()
+        form.addRow(QLabel("项目名称"), name_edit)
         self.project_fields["name"] = name_edit
 
         # 关联服务器
         server_combo = QComboBox()
-        server_combo.addItems(self.config.get("servers", {}).keys())
-        current_server = project_data.get("server", "")
-        if current_server in self.config.get("servers", {}):
-            server_combo.setCurrentText(current_server)
-        self.project_form_layout.addRow(QLabel("关联服务器"), server_combo)
+        form.addRow(QLabel("关联服务器"), server_combo)
         self.project_fields["server"] = server_combo
+        self.server_combo_names = None
 
         # 文件配置区域
-        self.project_form_layout.addRow(QLabel(""), QLabel(""))  # 空行
+        form.addRow(QLabel(""), QLabel(""))  # 空行
         files_label = QLabel("文件配置（本地路径 -> 远程路径）")
         files_label.setStyleSheet("font-weight: bold;")
-        self.project_form_layout.addRow(files_label)
+        form.addRow(files_label)
 
-        # 文件列表
-        files = project_data.get("files", [])
-        self.project_fields["files"] = []
-        
-        for idx, file_info in enumerate(files):
-            self.add_file_row(idx, file_info.get("local", ""), file_info.get("remote", ""), init=True)
+        files_widget = QWidget()
+        files_layout = QVBoxLayout(files_widget)
+        files_layout.setContentsMargins(0, 0, 0, 0)
+        form.addRow(files_widget)
+        self.file_rows = ReusableRows(files_layout, self.create_file_row, self.fill_file_row)
 
-        # 记录"+ 添加文件"按钮的位置
-        self.file_add_button_row = self.project_form_layout.rowCount()
         btn_add_file = QPushButton("+ 添加文件")
         btn_add_file.clicked.connect(self.add_file_row_empty)
-        self.project_form_layout.addRow(btn_add_file)
+        form.addRow(btn_add_file)
 
         # 前置命令配置
-        self.pre_cmd_section_start = self.project_form_layout.rowCount()
-        self.project_form_layout.addRow(QLabel(""), QLabel(""))  # 空行
+        form.addRow(QLabel(""), QLabel(""))  # 空行
         pre_cmd_label = QLabel("前置命令（上传前执行的本地命令）")
         pre_cmd_label.setStyleSheet("font-weight: bold;")
-        self.project_form_layout.addRow(pre_cmd_label)
-        
-        pre_commands = project_data.get("pre_commands", [])
-        self.project_fields["pre_commands"] = []
-        
-        for idx, cmd in enumerate(pre_commands):
-            self.add_pre_command_row(idx, cmd, init=True)
-        
-        # 记录"+ 添加命令"按钮的位置
-        self.pre_cmd_add_button_row = self.project_form_layout.rowCount()
+        form.addRow(pre_cmd_label)
+
+        pre_cmd_widget = QWidget()
+        pre_cmd_layout = QVBoxLayout(pre_cmd_widget)
+        pre_cmd_layout.setContentsMargins(0, 0, 0, 0)
+        form.addRow(pre_cmd_widget)
+        self.pre_command_rows = ReusableRows(pre_cmd_layout, self.create_pre_command_row, self.fill_pre_command_row)
+
         btn_add_cmd = QPushButton("+ 添加命令")
         btn_add_cmd.clicked.connect(self.add_pre_command_row_empty)
-        self.project_form_layout.addRow(btn_add_cmd)
+        form.addRow(btn_add_cmd)
 
         # 脚本配置
-        self.script_section_start = self.project_form_layout.rowCount()
-        self.project_form_layout.addRow(QLabel(""), QLabel(""))  # 空行
+        form.addRow(QLabel(""), QLabel(""))  # 空行
         scripts_label = QLabel("脚本配置")
         scripts_label.setStyleSheet("font-weight: bold;")
-        self.project_form_layout.addRow(scripts_label)
-        
+        form.addRow(scripts_label)
+
+        for key, label in (("deploy", "部署脚本"), ("restart", "重启脚本"), ("status", "状态脚本")):
+            edit = QLineEdit()
+            form.addRow(QLabel(label), edit)
+            self.project_fields[f"script_{key}"] = edit
+
+        # 高级配置：表单未覆盖的字段（如 health_check）直接以 JSON 编辑
+        form.addRow(QLabel(""), QLabel(""))  # 空行
+        extra_label = QLabel("高级配置（JSON，如 health_check）")
+        extra_label.setStyleSheet("font-weight: bold;")
+        form.addRow(extra_label)
+
+        extra_edit = QTextEdit()
+        extra_edit.setAcceptRichText(False)
+        extra_edit.setMinimumHeight(120)
+        extra_edit.setPlaceholderText('例如: {"health_check": {"type": "http", "port": 8080, "path": "/health"}}')
+        form.addRow(extra_edit)
+        self.project_fields["extra"] = extra_edit
+
+    def render_project_form(self, project_name):
+        if not self.project_fields:
+            self.build_project_form()
+
+        project_data = self.config["projects"][project_name]
+        self.project_fields["_id"].setText(project_name)
+        self.project_fields["name"].setText(project_data.get("name", ""))
+
+        # 服务器列表变化时才重新填充下拉框
+        server_combo = self.project_fields["server"]
+        server_names = list(self.config.get("servers", {}))
+        if server_names != self.server_combo_names:
+            server_combo.clear()
+            server_combo.addItems(server_names)
+            self.server_combo_names = server_names
+        current_server = project_data.get("server", "")
+        server_combo.setCurrentIndex(server_names.index(current_server) if current_server in server_names else 0)
+
+        self.file_rows.set_values(project_data.get("files", []))
+        self.pre_command_rows.set_values(project_data.get("pre_commands", []))
+
         scripts = project_data.get("scripts", {})
-        
-        deploy_edit = QLineEdit(scripts.get("deploy", ""))
-        self.project_form_layout.addRow(QLabel("部署脚本"), deploy_edit)
-        self.project_fields["script_deploy"] = deploy_edit
-
-        restart_edit = QLineEdit(scripts.get("restart", ""))
-        self.project_form_layout.addRow(QLabel("重启脚本"), restart_edit)
-        self.project_fields["script_restart"] = restart_edit
-
-        status_edit = QLineEdit(scripts.get("status", ""))
-        self.project_form_layout.addRow(QLabel("状态脚本"), status_edit)
-        self.project_fields["script_status"] = status_edit
-
-    def add_file_row(self, idx=None, local_path="", remote_path="", init=False):
-        """添加文件配置行"""
-        if idx is None:
-            idx = len(self.project_fields.get("files", []))
-        
+        for key in ("deploy", "restart", "status"):
+            self.project_fields[f"script_{key}"].setText(scripts.get(key, ""))
+
+        extra = {k: v for k, v in project_data.items() if k not in PROJECT_FORM_KEYS}
+        self.project_fields["extra"].setPlainText(json.dumps(extra, indent=4, ensure_ascii=False) if extra else "")
+        self.project_form_widget.show()
+
+    def create_file_row(self):
+        """创建文件配置行，file_info 中表单之外的字段保存时原样保留"""
         row_widget = QWidget()
         row_layout = QHBoxLayout(row_widget)
         row_layout.setContentsMargins(0, 0, 0, 0)
 
         # 本地文件
-        local_edit = QLineEdit(local_path)
-        local_edit.setPlaceholderText("本地文件路径")
+        local_edit = QLineEdit()
+        local_edit.setPlaceholderText("本地文件、目录或通配符")
         row_layout.addWidget(local_edit, 3)
 
         # 浏览按钮
@@ -921,110 +5799,65 @@ class ConfigEditor(QDialog):
         row_layout.addWidget(arrow_label)
 
         # 远程文件
-        remote_edit = QLineEdit(remote_path)
+        remote_edit = QLineEdit()
         remote_edit.setPlaceholderText("远程文件路径")
         row_layout.addWidget(remote_edit, 3)
 
+        # 过滤规则（目录或通配符时生效）
+        filter_edit = QLineEdit()
+        filter_edit.setPlaceholderText("过滤规则，如 *.js; !*.map")
+        filter_edit.setToolTip("本地路径为目录或通配符时生效，多条规则用 ; 分隔，以 ! 开头的规则表示排除")
+        row_layout.addWidget(filter_edit, 2)
+
+        row = {
+            "widget": row_widget,
+            "local": local_edit,
+            "remote": remote_edit,
+            "filter": filter_edit,
+            "data": {},
+        }
+
         # 删除按钮
         btn_delete = QPushButton("删除")
-        btn_delete.clicked.connect(lambda: self.remove_file_row(row_widget))
+        btn_delete.clicked.connect(lambda: self.file_rows.remove(row))
         row_layout.addWidget(btn_delete)
+        return row
 
-        if init:
-            # 初始化时直接添加到末尾
-            self.project_form_layout.addRow(row_widget)
-        else:
-            # 动态添加时插入到"+ 添加文件"按钮之前
-            insert_pos = self.file_add_button_row
-            self.project_form_layout.insertRow(insert_pos, row_widget)
-            self.file_add_button_row += 1  # 更新按钮位置
-            self.pre_cmd_section_start += 1  # 更新后续区域位置
-            self.pre_cmd_add_button_row += 1
-            self.script_section_start += 1
-        
-        self.project_fields["files"].append({
-            "widget": row_widget,
-            "local": local_edit,
-            "remote": remote_edit
-        })
+    def fill_file_row(self, row, file_info):
+        row["data"] = file_info
+        row["local"].setText(file_info.get("local", ""))
+        row["remote"].setText(file_info.get("remote", ""))
+        row["filter"].setText(format_path_filter(file_info.get("include"), file_info.get("exclude")))
 
     def add_file_row_empty(self):
         """添加空的文件配置行"""
-        self.add_file_row()
-
-    def remove_file_row(self, row_widget):
-        """删除文件配置行"""
-        # 从布局中移除
-        for i in range(self.project_form_layout.count()):
-            item = self.project_form_layout.itemAt(i)
-            if item and item.widget() == row_widget:
-                self.project_form_layout.removeRow(i)
-                break
-        
-        # 从字段列表中移除
-        self.project_fields["files"] = [
-            f for f in self.project_fields.get("files", [])
-            if f["widget"] != row_widget
-        ]
-        
-        # 删除widget
-        row_widget.deleteLater()
+        self.file_rows.append({})
 
-    def add_pre_command_row(self, idx=None, command="", init=False):
-        """添加前置命令行"""
-        if idx is None:
-            idx = len(self.project_fields.get("pre_commands", []))
-        
+    def create_pre_command_row(self):
+        """创建前置命令行"""
         row_widget = QWidget()
         row_layout = QHBoxLayout(row_widget)
         row_layout.setContentsMargins(0, 0, 0, 0)
 
         # 命令输入框
-        cmd_edit = QLineEdit(command)
+        cmd_edit = QLineEdit()
         cmd_edit.setPlaceholderText("例如: cd D:/project && mvn clean package")
         row_layout.addWidget(cmd_edit, 1)
 
+        row = {"widget": row_widget, "command": cmd_edit}
+
         # 删除按钮
         btn_delete = QPushButton("删除")
-        btn_delete.clicked.connect(lambda: self.remove_pre_command_row(row_widget))
+        btn_delete.clicked.connect(lambda: self.pre_command_rows.remove(row))
         row_layout.addWidget(btn_delete)
+        return row
 
-        if init:
-            # 初始化时直接添加到末尾
-            self.project_form_layout.addRow(row_widget)
-        else:
-            # 动态添加时插入到"+ 添加命令"按钮之前
-            insert_pos = self.pre_cmd_add_button_row
-            self.project_form_layout.insertRow(insert_pos, row_widget)
-            self.pre_cmd_add_button_row += 1  # 更新按钮位置
-            self.script_section_start += 1  # 更新后续区域位置
-        
-        self.project_fields["pre_commands"].append({
-            "widget": row_widget,
-            "command": cmd_edit
-        })
+    def fill_pre_command_row(self, row, command):
+        row["command"].setText(command)
 
     def add_pre_command_row_empty(self):
         """添加空的前置命令行"""
-        self.add_pre_command_row()
-
-    def remove_pre_command_row(self, row_widget):
-        """删除前置命令行"""
-        # 从布局中移除
-        for i in range(self.project_form_layout.count()):
-            item = self.project_form_layout.itemAt(i)
-            if item and item.widget() == row_widget:
-                self.project_form_layout.removeRow(i)
-                break
-        
-        # 从字段列表中移除
-        self.project_fields["pre_commands"] = [
-            c for c in self.project_fields.get("pre_commands", [])
-            if c["widget"] != row_widget
-        ]
-        
-        # 删除widget
-        row_widget.deleteLater()
+        self.pre_command_rows.append("")
 
     def browse_file(self, line_edit):
         """浏览选择文件"""
@@ -1074,7 +5907,8 @@ class ConfigEditor(QDialog):
             del self.config["servers"][self.current_server]
             save_full_config(self.config)
             self.current_server = None
-            self.clear_form(self.server_form_layout, self.server_fields)
+            self.server_fields = {}
+            self.server_form_widget.hide()
             self.load_server_list()
 
     def add_project(self):
@@ -1122,7 +5956,7 @@ class ConfigEditor(QDialog):
             del self.config["projects"][self.current_project]
             save_full_config(self.config)
             self.current_project = None
-            self.clear_form(self.project_form_layout, self.project_fields)
+            self.project_form_widget.hide()
             self.load_project_list()
 
     def test_ssh_connection(self, server_name):
@@ -1131,6 +5965,14 @@ class ConfigEditor(QDialog):
             QMessageBox.warning(self, "提示", "请先选择或编辑服务器配置")
             return
         
+        local_field = self.server_fields.get("local")
+        if local_field is not None and parse_bool(local_field.text().strip() or False):
+            if LOCAL_SHELL is None:
+                QMessageBox.warning(self, "提示", "本机服务器的命令需要 bash 执行，请安装 Git for Windows 并将 bash 加入 PATH")
+                return
+            QMessageBox.information(self, "成功", "本机服务器，文件直接复制、命令在本机执行，无需 SSH 连接")
+            return
+
         try:
             host = self.server_fields.get("host").text().strip()
             port = int(self.server_fields.get("port").text().strip())
@@ -1153,8 +5995,8 @@ class ConfigEditor(QDialog):
 
 
     def show_server_context_menu(self, pos):
-        item = self.server_list.itemAt(pos)
-        if not item:
+        index = self.server_list.indexAt(pos)
+        if not index.isValid():
             return
             
         menu = QMenu()
@@ -1162,7 +6004,7 @@ class ConfigEditor(QDialog):
         action = menu.exec(self.server_list.mapToGlobal(pos))
         
         if action == dup_action:
-            self.duplicate_server(item.text(0))
+            self.duplicate_server(index.data(CONFIG_KEY_ROLE))
             
     def duplicate_server(self, server_name):
         import copy
@@ -1181,14 +6023,12 @@ class ConfigEditor(QDialog):
             
             # 刷新列表并选中
             self.load_server_list()
-            items = self.server_list.findItems(new_name, Qt.MatchFlag.MatchExactly)
-            if items:
-                self.server_list.setCurrentItem(items[0])
-                self.on_server_selected(items[0])
+            self.select_entry(self.server_list, self.server_model, new_name)
+            self.on_server_selected(new_name)
                 
     def show_project_context_menu(self, pos):
-        item = self.project_list.itemAt(pos)
-        if not item:
+        index = self.project_list.indexAt(pos)
+        if not index.isValid():
             return
             
         menu = QMenu()
@@ -1196,7 +6036,7 @@ class ConfigEditor(QDialog):
         action = menu.exec(self.project_list.mapToGlobal(pos))
         
         if action == dup_action:
-            self.duplicate_project(item.text(0))
+            self.duplicate_project(index.data(CONFIG_KEY_ROLE))
             
     def duplicate_project(self, project_name):
         import copy
@@ -1216,12 +6056,11 @@ class ConfigEditor(QDialog):
             
             # 刷新列表并选中
             self.load_project_list()
-            items = self.project_list.findItems(new_name, Qt.MatchFlag.MatchExactly)
-            if items:
-                self.project_list.setCurrentItem(items[0])
-                self.on_project_selected(items[0])
+            self.select_entry(self.project_list, self.project_model, new_name)
+            self.on_project_selected(new_name)
 
     def save_all(self):
+        changed = []  # 原地修改的条目，其余条目由 save_full_config 按对象是否被替换判断
         # 保存当前编辑的服务器
         if self.current_server and self.server_fields:
             new_name = self.server_fields["_name"].text().strip()
@@ -1238,16 +6077,26 @@ class ConfigEditor(QDialog):
             for key, edit in self.server_fields.items():
                 if key == "_name":
                     continue
-                server_data[key] = edit.text().strip()
+                value = edit.text().strip()
+                if key in SERVER_OPTIONAL_KEYS and not value:
+                    continue
+                server_data[key] = value
 
             # 先添加新配置，再删除旧配置（避免 KeyError）
             self.config.setdefault("servers", {})[new_name] = server_data
             if new_name != self.current_server:
                 del self.config["servers"][self.current_server]
                 # 更新所有引用此服务器的项目
-                for project_data in self.config.get("projects", {}).values():
+                for project_id, project_data in self.config.get("projects", {}).items():
                     if project_data.get("server") == self.current_server:
                         project_data["server"] = new_name
+                        changed.append(("projects", project_id))
+                    if self.current_server in project_data.get("servers", []):
+                        project_data["servers"] = [
+                            new_name if name == self.current_server else name
+                            for name in project_data["servers"]
+                        ]
+                        changed.append(("projects", project_id))
                 self.current_server = new_name
 
         # 保存当前编辑的项目
@@ -1264,22 +6113,37 @@ class ConfigEditor(QDialog):
 
             # 收集文件配置
             files = []
-            for file_row in self.project_fields.get("files", []):
+            for file_row in self.file_rows.active_rows():
                 local = file_row["local"].text().strip()
                 remote = file_row["remote"].text().strip()
                 if local and remote:  # 只保存非空的配置
-                    files.append({
-                        "local": local,
-                        "remote": remote
-                    })
+                    entry = {k: v for k, v in file_row["data"].items() if k not in ("include", "exclude")}
+                    entry.update({"local": local, "remote": remote})
+                    include, exclude = parse_path_filter(file_row["filter"].text())
+                    if include:
+                        entry["include"] = include
+                    if exclude:
+                        entry["exclude"] = exclude
+                    files.append(entry)
 
             # 收集前置命令
             pre_commands = []
-            for cmd_row in self.project_fields.get("pre_commands", []):
+            for cmd_row in self.pre_command_rows.active_rows():
                 cmd = cmd_row["command"].text().strip()
                 if cmd:  # 只保存非空的命令
                     pre_commands.append(cmd)
 
+            # 解析高级配置
+            extra_text = self.project_fields["extra"].toPlainText().strip()
+            try:
+                extra = json.loads(extra_text) if extra_text else {}
+            except ValueError as e:
+                QMessageBox.warning(self, "提示", f"高级配置不是有效的 JSON:\n{str(e)}")
+                return
+            if not isinstance(extra, dict):
+                QMessageBox.warning(self, "提示", "高级配置必须是 JSON 对象")
+                return
+
             project_data = {
                 "name": self.project_fields["name"].text().strip(),
                 "server": self.project_fields["server"].currentText(),
@@ -1291,6 +6155,9 @@ class ConfigEditor(QDialog):
                     "status": self.project_fields["script_status"].text().strip()
                 }
             }
+            for key, value in extra.items():
+                if key not in PROJECT_FORM_KEYS:
+                    project_data[key] = value
 
             # 先添加新配置，再删除旧配置（避免 KeyError）
             self.config.setdefault("projects", {})[new_id] = project_data
@@ -1298,7 +6165,7 @@ class ConfigEditor(QDialog):
                 del self.config["projects"][self.current_project]
                 self.current_project = new_id
 
-        save_full_config(self.config)
+        save_full_config(self.config, changed)
         QMessageBox.information(self, "成功", "配置已保存")
         self.load_server_list()
         self.load_project_list()
@@ -1318,12 +6185,17 @@ class MainWindow(QWidget):
 
         self.signals = SSHSignals()
         self.signals.progress.connect(self.on_progress)
+        self.signals.progress_max.connect(self.on_progress_max)
         self.signals.log.connect(self.on_log)
         self.signals.finished.connect(self.on_finished)
         
         # 停止标志（使用字典以便在线程间共享）
-        self.stop_flag = {'stop': False}
+        self.stop_flag = {'stop': False, 'callbacks': []}
         self.current_thread = None
+        self.dashboard = None
+        self.log_follow = None
+        self.plan_signals = PlanSignals()
+        self.plan_signals.done.connect(self.on_plan_ready)
 
         self.init_ui()
 
@@ -1335,7 +6207,16 @@ class MainWindow(QWidget):
         project_layout = QHBoxLayout()
         project_layout.addWidget(QLabel("项目："))
         self.combo_project = QComboBox()
-        self.combo_project.currentTextChanged.connect(self.on_project_changed)
+        # 可输入搜索：按名称或 ID 的任意部分匹配，只能选择已有项目
+        self.combo_project.setEditable(True)
+        self.combo_project.setInsertPolicy(QComboBox.InsertPolicy.NoInsert)
+        self.combo_project.lineEdit().setPlaceholderText("输入名称或 ID 搜索项目")
+        completer = self.combo_project.completer()
+        completer.setFilterMode(Qt.MatchFlag.MatchContains)
+        completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        completer.setCompletionMode(QCompleter.CompletionMode.PopupCompletion)
+        self.combo_project.lineEdit().editingFinished.connect(self.restore_project_text)
+        self.combo_project.currentIndexChanged.connect(self.on_project_changed)
         project_layout.addWidget(self.combo_project, 1)
         project_group.setLayout(project_layout)
         layout.addWidget(project_group)
@@ -1361,6 +6242,16 @@ class MainWindow(QWidget):
         self.btn_full_deploy = QPushButton("完整部署（上传文件+部署脚本）")
         self.btn_full_deploy.clicked.connect(self.full_deploy)
         row1.addWidget(self.btn_full_deploy)
+        self.btn_plan = QPushButton("部署计划")
+        self.btn_plan.clicked.connect(self.show_deploy_plan)
+        row1.addWidget(self.btn_plan)
+        self.btn_watch = QPushButton("监听模式")
+        self.btn_watch.setToolTip("文件变化后自动构建并只部署变化的文件，点击「停止执行」结束监听")
+        self.btn_watch.clicked.connect(self.watch_deploy)
+        row1.addWidget(self.btn_watch)
+        self.btn_batch_deploy = QPushButton("批量部署")
+        self.btn_batch_deploy.clicked.connect(self.batch_deploy)
+        row1.addWidget(self.btn_batch_deploy)
         action_layout.addLayout(row1)
 
         # 第二行：上传操作
@@ -1383,7 +6274,14 @@ class MainWindow(QWidget):
         self.btn_status_script.clicked.connect(lambda: self.execute_script("status"))
         row3.addWidget(self.btn_deploy_script)
         row3.addWidget(self.btn_restart_script)
+        self.btn_rollback = QPushButton("回滚版本")
+        self.btn_rollback.clicked.connect(self.rollback_release)
+        self.btn_refresh_env = QPushButton("刷新远程环境")
+        self.btn_refresh_env.setToolTip("重新加载服务器的登录环境并更新缓存（修改了 conda/nvm 等环境配置后使用）")
+        self.btn_refresh_env.clicked.connect(self.refresh_remote_env)
         row3.addWidget(self.btn_status_script)
+        row3.addWidget(self.btn_rollback)
+        row3.addWidget(self.btn_refresh_env)
         action_layout.addLayout(row3)
 
         action_group.setLayout(action_layout)
@@ -1393,6 +6291,26 @@ class MainWindow(QWidget):
         self.progress = QProgressBar()
         layout.addWidget(self.progress)
 
+        # 上传限速（运行中调整立即生效）
+        rate_layout = QHBoxLayout()
+        rate_layout.addWidget(QLabel("上传限速："))
+        self.spin_rate = QSpinBox()
+        self.spin_rate.setRange(0, 1000000)
+        self.spin_rate.setSingleStep(256)
+        self.spin_rate.setSuffix(" KB/s")
+        self.spin_rate.setSpecialValueText("不限速")
+        self.spin_rate.setValue(int(self.config.get("upload_rate_limit", 0) or 0))
+        self.spin_rate.valueChanged.connect(self.on_rate_changed)
+        rate_layout.addWidget(self.spin_rate)
+        self.lbl_throughput = QLabel("")
+        rate_layout.addWidget(self.lbl_throughput, 1)
+        layout.addLayout(rate_layout)
+        bandwidth.set_global_rate(self.spin_rate.value())
+
+        self.throughput_timer = QTimer(self)
+        self.throughput_timer.timeout.connect(self.update_throughput)
+        self.throughput_timer.start(1000)
+
         # 日志输出
         log_group = QGroupBox("执行日志")
         log_layout = QVBoxLayout()
@@ -1412,26 +6330,43 @@ class MainWindow(QWidget):
         self.btn_clear_log.clicked.connect(self.log.clear)
         self.btn_config = QPushButton("配置管理")
         self.btn_config.clicked.connect(self.open_config_editor)
+        self.btn_dashboard = QPushButton("状态总览")
+        self.btn_dashboard.clicked.connect(self.open_dashboard)
+        self.btn_logs = QPushButton("日志跟踪")
+        self.btn_logs.clicked.connect(self.open_log_follow)
         bottom_layout.addStretch()
         bottom_layout.addWidget(self.btn_stop)
         bottom_layout.addWidget(self.btn_clear_log)
+        bottom_layout.addWidget(self.btn_dashboard)
+        bottom_layout.addWidget(self.btn_logs)
         bottom_layout.addWidget(self.btn_config)
         layout.addLayout(bottom_layout)
 
         self.load_projects()
 
     def load_projects(self):
+        current_id = self.combo_project.currentData()
+        self.combo_project.blockSignals(True)
         self.combo_project.clear()
         projects = self.config.get("projects", {})
         for project_id, project_data in projects.items():
             display_name = f"{project_data.get('name', project_id)} ({project_id})"
             self.combo_project.addItem(display_name, project_id)
+        # 重新加载后保持之前选择的项目
+        self.combo_project.setCurrentIndex(max(self.combo_project.findData(current_id), 0))
+        self.combo_project.blockSignals(False)
 
         if self.combo_project.count() > 0:
-            self.on_project_changed(self.combo_project.currentText())
+            self.on_project_changed(self.combo_project.currentIndex())
+
+    def restore_project_text(self):
+        """搜索输入未选中任何项目时，恢复显示当前项目"""
+        index = self.combo_project.currentIndex()
+        if index >= 0 and self.combo_project.currentText() != self.combo_project.itemText(index):
+            self.combo_project.setEditText(self.combo_project.itemText(index))
 
-    def on_project_changed(self, text):
-        if not text:
+    def on_project_changed(self, index):
+        if index < 0:
             return
 
         project_id = self.combo_project.currentData()
@@ -1441,7 +6376,7 @@ class MainWindow(QWidget):
         project_data = self.config["projects"].get(project_id, {})
         
         self.lbl_project_name.setText(project_data.get("name", ""))
-        self.lbl_server.setText(project_data.get("server", ""))
+        self.lbl_server.setText(", ".join(project_server_names(project_data)))
         files_count = len(project_data.get("files", []))
         self.lbl_files_count.setText(str(files_count))
 
@@ -1457,13 +6392,14 @@ class MainWindow(QWidget):
             QMessageBox.warning(self, "提示", "项目配置不存在")
             return None, None
 
-        server_name = project_cfg.get("server")
-        server_cfg = self.config["servers"].get(server_name)
-        if not server_cfg:
-            QMessageBox.warning(self, "提示", f"服务器配置不存在: {server_name}")
-            return None, None
+        # 返回的 server_cfg 为组内第一台；上传、执行脚本、回滚由 each_server_worker 逐台执行
+        server_names = project_server_names(project_cfg)
+        for server_name in server_names:
+            if server_name not in self.config["servers"]:
+                QMessageBox.warning(self, "提示", f"服务器配置不存在: {server_name}")
+                return None, None
 
-        return project_cfg, server_cfg
+        return project_cfg, server_configs(self.config)[server_names[0]]
 
     def full_deploy(self):
         project_cfg, server_cfg = self.get_current_project_config()
@@ -1475,18 +6411,69 @@ class MainWindow(QWidget):
             QMessageBox.warning(self, "提示", "项目未配置任何文件")
             return
 
-        total_files = len(files)
+        server_names = project_server_names(project_cfg)
+        total_files = len(files) * len(server_names)
         self.progress.setMaximum(total_files if total_files > 0 else 1)
         self.progress.setValue(0)
         self.log.clear()
         
         # 启用停止按钮并重置停止标志
-        self.stop_flag['stop'] = False
+        reset_stop_flag(self.stop_flag)
+        self.btn_stop.setEnabled(True)
+
+        if len(server_names) > 1:
+            target, args = rolling_deploy_worker, (self.config, project_cfg, self.signals, self.stop_flag)
+        else:
+            target, args = full_deploy_worker, (server_cfg, project_cfg, self.signals, self.stop_flag)
+        t = threading.Thread(target=target, args=args, daemon=True)
+        self.current_thread = t
+        t.start()
+
+    def batch_deploy(self):
+        """选择多个项目，合并前置命令后并发部署"""
+        dlg = BatchDeployDialog(self.config, self.combo_project.currentData(), self)
+        if not dlg.exec():
+            return
+        project_ids = dlg.selected_projects()
+        if not project_ids:
+            QMessageBox.warning(self, "提示", "请至少选择一个项目")
+            return
+
+        self.progress.setMaximum(0)  # 构建期间不确定进度
+        self.progress.setValue(0)
+        self.log.clear()
+
+        reset_stop_flag(self.stop_flag)
+        self.btn_stop.setEnabled(True)
+
+        t = threading.Thread(
+            target=batch_deploy_worker,
+            args=(self.config, project_ids, self.signals, self.stop_flag),
+            daemon=True
+        )
+        self.current_thread = t
+        t.start()
+
+    def watch_deploy(self):
+        """监听本地文件变化，自动构建并增量部署，直到点击停止"""
+        project_cfg, server_cfg = self.get_current_project_config()
+        if not project_cfg or not server_cfg:
+            return
+
+        if not project_cfg.get("files"):
+            QMessageBox.warning(self, "提示", "项目未配置任何文件")
+            return
+
+        self.progress.setMaximum(1)
+        self.progress.setValue(0)
+        self.log.clear()
+
+        reset_stop_flag(self.stop_flag)
         self.btn_stop.setEnabled(True)
 
         t = threading.Thread(
-            target=full_deploy_worker,
-            args=(server_cfg, project_cfg, self.signals, self.stop_flag),
+            target=watch_deploy_worker,
+            args=(self.config, project_cfg, self.signals, self.stop_flag),
             daemon=True
         )
         self.current_thread = t
@@ -1508,19 +6495,14 @@ class MainWindow(QWidget):
         self.log.clear()
         
         # 启用停止按钮并重置停止标志
-        self.stop_flag['stop'] = False
+        reset_stop_flag(self.stop_flag)
         self.btn_stop.setEnabled(True)
 
-        def worker():
-            try:
-                if not execute_local_commands(pre_commands, self.signals, self.stop_flag):
-                    self.signals.finished.emit(False, "前置命令执行失败")
-                else:
-                    self.signals.finished.emit(True, "前置命令执行完成")
-            except Exception as e:
-                self.signals.finished.emit(False, f"执行失败: {str(e)}")
-
-        t = threading.Thread(target=worker, daemon=True)
+        t = threading.Thread(
+            target=pre_commands_worker,
+            args=(project_cfg, self.signals, self.stop_flag),
+            daemon=True
+        )
         self.current_thread = t
         t.start()
 
@@ -1534,18 +6516,21 @@ class MainWindow(QWidget):
             QMessageBox.warning(self, "提示", "项目未配置任何文件")
             return
 
-        total_files = len(files)
+        total_files = len(files) * len(project_server_names(project_cfg))
         self.progress.setMaximum(total_files if total_files > 0 else 1)
         self.progress.setValue(0)
         self.log.clear()
         
         # 启用停止按钮并重置停止标志
-        self.stop_flag['stop'] = False
+        reset_stop_flag(self.stop_flag)
         self.btn_stop.setEnabled(True)
 
+        def host_worker(server_cfg, signals, stop_flag):
+            upload_project_files_worker(server_cfg, project_cfg, signals, stop_flag)
+
         t = threading.Thread(
-            target=upload_project_files_worker,
-            args=(server_cfg, project_cfg, self.signals, self.stop_flag),
+            target=each_server_worker,
+            args=(self.config, project_cfg, self.signals, self.stop_flag, host_worker),
             daemon=True
         )
         self.current_thread = t
@@ -1565,17 +6550,114 @@ class MainWindow(QWidget):
         self.log.clear()
         
         # 启用停止按钮并重置停止标志
-        self.stop_flag['stop'] = False
+        reset_stop_flag(self.stop_flag)
+        self.btn_stop.setEnabled(True)
+
+        # 部署和重启后需要等待服务就绪
+        health_cfg = project_cfg.get("health_check") if script_type in ("deploy", "restart") else None
+
+        def host_worker(server_cfg, signals, stop_flag):
+            execute_script_worker(server_cfg, script_cmd, signals, stop_flag, health_cfg)
+
+        t = threading.Thread(
+            target=each_server_worker,
+            args=(self.config, project_cfg, self.signals, self.stop_flag, host_worker),
+            daemon=True
+        )
+        self.current_thread = t
+        t.start()
+
+    def refresh_remote_env(self):
+        """重新生成项目各服务器上的登录环境缓存"""
+        project_cfg, server_cfg = self.get_current_project_config()
+        if not project_cfg or not server_cfg:
+            return
+
+        self.progress.setMaximum(0)  # 不确定进度
+        self.log.clear()
+        reset_stop_flag(self.stop_flag)
+        self.btn_stop.setEnabled(True)
+
+        t = threading.Thread(
+            target=refresh_remote_env_worker,
+            args=(self.config, project_cfg, self.signals, self.stop_flag),
+            daemon=True
+        )
+        self.current_thread = t
+        t.start()
+
+    def rollback_release(self):
+        """release 模式下切换到已有版本并重启"""
+        project_cfg, server_cfg = self.get_current_project_config()
+        if not project_cfg or not server_cfg:
+            return
+
+        release_cfg = release_config(project_cfg)
+        if not release_cfg:
+            QMessageBox.warning(self, "提示", "项目未启用 release 模式（高级配置中的 release.base）")
+            return
+
+        # 服务器组只列出每台服务器上都有的版本，当前版本以第一台为准
+        releases, current = None, None
+        for server_name in project_server_names(project_cfg):
+            host_cfg = server_configs(self.config)[server_name]
+            try:
+                host_releases, host_current = list_releases(ssh_pool.get(host_cfg), release_cfg)
+            except Exception as e:
+                ssh_pool.discard(host_cfg)
+                QMessageBox.critical(self, "失败", f"读取版本列表失败（{server_name}）:\n{str(e)}")
+                return
+            if releases is None:
+                releases, current = host_releases, host_current
+            else:
+                releases = [name for name in releases if name in host_releases]
+        if not releases:
+            QMessageBox.information(self, "提示", "服务器上没有可用的版本")
+            return
+
+        labels = [f"{name}（当前）" if name == current else name for name in releases]
+        # 默认选中当前版本的上一个版本
+        default_index = releases.index(current) + 1 if current in releases else 0
+        default_index = min(default_index, len(releases) - 1)
+        label, ok = QInputDialog.getItem(self, "回滚版本", "切换到版本:", labels, default_index, False)
+        if not ok:
+            return
+        release_name = releases[labels.index(label)]
+
+        self.progress.setMaximum(0)  # 不确定进度
+        self.log.clear()
+        reset_stop_flag(self.stop_flag)
         self.btn_stop.setEnabled(True)
 
+        def host_worker(server_cfg, signals, stop_flag):
+            rollback_release_worker(server_cfg, project_cfg, release_name, signals, stop_flag)
+
         t = threading.Thread(
-            target=execute_script_worker,
-            args=(server_cfg, script_cmd, self.signals, self.stop_flag),
+            target=each_server_worker,
+            args=(self.config, project_cfg, self.signals, self.stop_flag, host_worker),
             daemon=True
         )
         self.current_thread = t
         t.start()
 
+    def on_rate_changed(self, value):
+        bandwidth.set_global_rate(value)
+        self.config["upload_rate_limit"] = value
+        save_full_config(self.config)
+
+    def update_throughput(self):
+        """显示实际上传速度与限速值"""
+        parts = []
+        for name, actual, rate in bandwidth.report():
+            if name != "全部" or actual > 0 or rate:
+                limit = f"{rate:.0f} KB/s" if rate else "不限"
+                parts.append(f"{name}: {actual:.0f} / {limit}")
+        self.lbl_throughput.setText("  实际/限速  " + "   ".join(parts) if parts else "")
+
+    def on_progress_max(self, value):
+        self.progress.setMaximum(value if value > 0 else 1)
+        self.progress.setValue(0)
+
     def on_progress(self, value):
         if self.progress.maximum() > 0:
             self.progress.setValue(self.progress.value() + value)
@@ -1589,9 +6671,14 @@ class MainWindow(QWidget):
         self.progress.setMaximum(100)
         self.progress.setValue(0)
         
+        # 记录从点击停止到操作真正结束的耗时
+        stop_time = self.stop_flag.get('stop_time')
+        if stop_time:
+            self.log.append(f"🛑 操作已终止，停止耗时 {(time.time() - stop_time) * 1000:.0f} ms")
+
         # 禁用停止按钮
         self.btn_stop.setEnabled(False)
-        self.stop_flag['stop'] = False
+        reset_stop_flag(self.stop_flag)
         self.current_thread = None
         
         if success:
@@ -1601,11 +6688,42 @@ class MainWindow(QWidget):
 
     def stop_execution(self):
         """停止当前执行的操作"""
-        self.stop_flag['stop'] = True
+        request_stop(self.stop_flag)
         self.btn_stop.setEnabled(False)
         self.log.append("\n⚠ 正在停止操作...")
         QMessageBox.information(self, "提示", "已发送停止信号，操作将尽快终止")
 
+    def show_deploy_plan(self):
+        """后台生成部署计划（只查询，不执行任何操作），完成后弹窗确认"""
+        project_cfg, _ = self.get_current_project_config()
+        if not project_cfg:
+            return
+        self.btn_plan.setEnabled(False)
+        self.log.append("正在生成部署计划...")
+        threading.Thread(
+            target=deploy_plan_worker,
+            args=(self.config, project_cfg, self.plan_signals),
+            daemon=True
+        ).start()
+
+    def on_plan_ready(self, text):
+        self.btn_plan.setEnabled(True)
+        dlg = DeployPlanDialog(text, self)
+        if dlg.exec():
+            self.full_deploy()
+
+    def open_dashboard(self):
+        if self.dashboard is None:
+            self.dashboard = StatusDashboard(lambda: self.config, self)
+        self.dashboard.show()
+        self.dashboard.raise_()
+
+    def open_log_follow(self):
+        if self.log_follow is None:
+            self.log_follow = LogFollowDialog(lambda: self.config, self)
+        self.log_follow.show()
+        self.log_follow.raise_()
+
     def open_config_editor(self):
         dlg = ConfigEditor(self)
         dlg.exec()
@@ -1616,7 +6734,41 @@ class MainWindow(QWidget):
 # ============================================================
 # 程序入口
 # ============================================================
+def find_project(config, name):
+    """按项目 ID 或显示名称查找项目配置"""
+    projects = config.get("projects", {})
+    if name in projects:
+        return projects[name]
+    for project_cfg in projects.values():
+        if project_cfg.get("name") == name:
+            return project_cfg
+    return None
+
+
+def run_cli(argv):
+    parser = argparse.ArgumentParser(description="项目部署工具")
+    parser.add_argument("--plan", metavar="PROJECT", help="输出项目的部署计划（预演，不执行任何操作）")
+    args = parser.parse_args(argv)
+    if not args.plan:
+        return None
+
+    ensure_config_exists()
+    config = load_full_config()
+    project_cfg = find_project(config, args.plan)
+    if not project_cfg:
+        print(f"项目不存在: {args.plan}", file=sys.stderr)
+        return 1
+    try:
+        print(format_deploy_plan(build_deploy_plan(config, project_cfg)))
+    finally:
+        ssh_pool.close_all()
+    return 0
+
+
 if __name__ == "__main__":
+    exit_code = run_cli(sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
     app = QApplication(sys.argv)
     app.setStyleSheet(APP_QSS)
     ensure_config_exists()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# deploy.py 在模块级导入 PyQt6，测试中不需要显示窗口
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
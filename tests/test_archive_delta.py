@@ -0,0 +1,79 @@
+import subprocess
+import sys
+import zipfile
+
+from deploy import (
+    ARCHIVE_REBUILD_SCRIPT, DELTA_MANIFEST_NAME, LocalSFTPClient, build_archive_patch, estimate_archive_delta,
+    read_remote_entries,
+)
+
+
+def write_zip(path, entries, prefix=b""):
+    with open(path, "wb") as f:
+        f.write(prefix)
+        with zipfile.ZipFile(f, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, data in entries.items():
+                zf.writestr(name, data)
+    return str(path)
+
+
+def entry_contents(path):
+    with zipfile.ZipFile(path) as zf:
+        return [(info.filename, zf.read(info)) for info in zf.infolist()]
+
+
+def test_read_remote_entries_lists_crc_and_size(tmp_path):
+    old = write_zip(tmp_path / "old.jar", {"a.class": b"aaaa", "lib/b.class": b"bb"})
+    entries = read_remote_entries(LocalSFTPClient(None), old)
+    assert set(entries) == {"a.class", "lib/b.class"}
+    assert entries["a.class"][1] == 4
+
+
+def test_patch_contains_only_changed_and_added_entries(tmp_path):
+    old = write_zip(tmp_path / "old.jar", {"same": b"x" * 1000, "changed": b"v1", "removed": b"gone"})
+    new = write_zip(tmp_path / "new.jar", {"same": b"x" * 1000, "changed": b"v2", "added": b"new"})
+    patch = str(tmp_path / "patch.zip")
+
+    changed = build_archive_patch(new, read_remote_entries(LocalSFTPClient(None), old), patch)
+
+    assert changed == 2
+    with zipfile.ZipFile(patch) as zf:
+        assert sorted(zf.namelist()) == sorted(["changed", "added", DELTA_MANIFEST_NAME])
+
+
+def test_unchanged_archive_produces_empty_patch(tmp_path):
+    old = write_zip(tmp_path / "old.jar", {"a": b"1", "b": b"2"})
+    patch = str(tmp_path / "patch.zip")
+    assert build_archive_patch(old, read_remote_entries(LocalSFTPClient(None), old), patch) == 0
+    assert estimate_archive_delta(LocalSFTPClient(None), old, old) == 0
+
+
+def test_estimate_counts_compressed_size_of_changed_entries(tmp_path):
+    old = write_zip(tmp_path / "old.jar", {"same": b"s", "changed": b"v1"})
+    new = write_zip(tmp_path / "new.jar", {"same": b"s", "changed": b"v2" * 100})
+    with zipfile.ZipFile(new) as zf:
+        expected = zf.getinfo("changed").compress_size
+    assert estimate_archive_delta(LocalSFTPClient(None), new, old) == expected
+
+
+def test_archive_with_prepended_data_is_not_patched(tmp_path):
+    old = write_zip(tmp_path / "old.jar", {"a": b"1"})
+    new = write_zip(tmp_path / "new.jar", {"a": b"2"}, prefix=b"#!/bin/sh\nexec java -jar \"$0\"\n")
+    patch = str(tmp_path / "patch.zip")
+    assert build_archive_patch(new, read_remote_entries(LocalSFTPClient(None), old), patch) is None
+
+
+def test_rebuild_script_reproduces_local_entries(tmp_path):
+    old = write_zip(tmp_path / "old.jar", {"META-INF/MANIFEST.MF": b"Main-Class: A\n", "A.class": b"old", "B.class": b"b"})
+    new = write_zip(tmp_path / "new.jar", {"META-INF/MANIFEST.MF": b"Main-Class: A\n", "C.class": b"c", "A.class": b"new"})
+    patch = str(tmp_path / "patch.zip")
+    rebuilt = str(tmp_path / "rebuilt.jar")
+    build_archive_patch(new, read_remote_entries(LocalSFTPClient(None), old), patch)
+
+    result = subprocess.run(
+        [sys.executable, "-c", ARCHIVE_REBUILD_SCRIPT, old, patch, rebuilt, DELTA_MANIFEST_NAME],
+        capture_output=True, text=True,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert entry_contents(rebuilt) == entry_contents(new)
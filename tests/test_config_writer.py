@@ -0,0 +1,88 @@
+import copy
+import json
+
+import pytest
+
+from deploy import ConfigWriter
+
+
+def expected(data):
+    return json.dumps(data, indent=4, ensure_ascii=False)
+
+
+@pytest.fixture
+def config():
+    return {
+        "servers": {
+            "生产": {"host": "10.0.0.1", "port": 22, "username": "root", "password": "p\"w\\d"},
+            "local": {"local": "true"},
+        },
+        "projects": {
+            "web": {
+                "name": "前端",
+                "server": "生产",
+                "pre_commands": ["npm ci", "npm run build"],
+                "files": [{"local": "dist/", "remote": "/srv/web/"}],
+                "scripts": {"deploy": "systemctl restart web", "status": ""},
+                "release": {"base": "/srv/web", "keep": 5},
+                "empty": {},
+                "none": None,
+            },
+        },
+        "version": 2,
+        "extra": [1, [2, {}], {"a": []}],
+    }
+
+
+@pytest.mark.parametrize("data", [
+    {},
+    {"servers": {}, "projects": {}},
+    {"servers": {"a": {}}, "projects": {"p": {"files": []}}},
+    {"other": {"nested": {"x": 1}}, "servers": {"a": {"host": "h"}}},
+])
+def test_render_matches_json_dump_for_edge_cases(data):
+    assert ConfigWriter("unused").render(data) == expected(data)
+
+
+def test_render_matches_json_dump(config):
+    assert ConfigWriter("unused").render(config) == expected(config)
+
+
+def test_replaced_entry_is_rendered_again(config):
+    writer = ConfigWriter("unused")
+    writer.render(config)
+    project = copy.deepcopy(config["projects"]["web"])
+    project["name"] = "新名称"
+    config["projects"]["web"] = project
+    assert writer.render(config) == expected(config)
+
+
+def test_entry_modified_in_place_is_rendered_again_when_listed_as_changed(config):
+    writer = ConfigWriter("unused")
+    writer.render(config)
+    config["servers"]["生产"]["port"] = 2222
+    assert writer.render(config, changed=[("servers", "生产")]) == expected(config)
+
+
+def test_added_renamed_and_removed_entries(config):
+    writer = ConfigWriter("unused")
+    writer.render(config)
+    config["projects"]["api"] = {"name": "api", "server": "local"}
+    config["servers"]["backup"] = config["servers"].pop("local")
+    assert writer.render(config) == expected(config)
+    del config["projects"]["web"]
+    assert writer.render(config) == expected(config)
+    assert ("projects", "web") not in writer._fragments
+
+
+def test_save_coalesces_and_flush_writes_latest(tmp_path, config):
+    path = tmp_path / "config.json"
+    writer = ConfigWriter(str(path), delay=60)
+    writer.save(config)
+    config["version"] = 3
+    writer.save(config)
+    assert not path.exists()
+    writer.flush()
+    assert path.read_text(encoding="utf-8") == expected(config)
+    assert json.loads(path.read_text(encoding="utf-8")) == config
+    assert not (tmp_path / "config.json.tmp").exists()
@@ -0,0 +1,67 @@
+from deploy import merge_pre_commands
+
+
+def projects(*command_lists):
+    return [{"pre_commands": list(commands)} for commands in command_lists]
+
+
+def keeps_order(commands, merged):
+    """commands 是 merged 的子序列"""
+    remaining = iter(merged)
+    return all(any(command == item for item in remaining) for command in commands)
+
+
+def test_single_project_is_unchanged():
+    assert merge_pre_commands(projects(["a", "b", "c"])) == ["a", "b", "c"]
+
+
+def test_shared_command_runs_once():
+    merged = merge_pre_commands(projects(["npm ci", "npm run build:a"], ["npm ci", "npm run build:b"]))
+    assert merged == ["npm ci", "npm run build:a", "npm run build:b"]
+
+
+def test_commands_are_compared_ignoring_whitespace():
+    merged = merge_pre_commands(projects(["  mvn  install ", "a"], ["mvn install", "b"]))
+    assert merged == ["  mvn  install ", "a", "b"]
+
+
+def test_blank_commands_are_dropped():
+    assert merge_pre_commands(projects(["", "a", "   "])) == ["a"]
+
+
+def test_shared_command_waits_for_every_predecessor():
+    # 两个项目都要求 build 在各自的准备命令之后执行
+    merged = merge_pre_commands(projects(["gen-a", "build"], ["gen-b", "build"]))
+    assert merged.count("build") == 1
+    assert merged.index("build") > merged.index("gen-a")
+    assert merged.index("build") > merged.index("gen-b")
+
+
+def test_conflicting_order_is_not_shared():
+    merged = merge_pre_commands(projects(["x", "y"], ["y", "x"]))
+    assert merged == ["x", "y", "y", "x"]
+
+
+def test_cycle_only_unshares_conflicting_commands():
+    merged = merge_pre_commands(projects(["setup", "x", "y"], ["setup", "y", "x"]))
+    assert merged.count("setup") == 1
+    assert merged[0] == "setup"
+    assert sorted(merged[1:]) == ["x", "x", "y", "y"]
+
+
+def test_command_repeated_within_a_project_is_not_shared():
+    merged = merge_pre_commands(projects(["clean", "build", "clean"], ["clean"]))
+    assert merged.count("clean") == 3
+    assert keeps_order(["clean", "build", "clean"], merged)
+
+
+def test_every_project_keeps_its_own_order():
+    command_lists = [
+        ["fetch", "gen", "compile", "package"],
+        ["fetch", "lint", "compile"],
+        ["gen", "lint", "test"],
+        ["package", "fetch"],
+    ]
+    merged = merge_pre_commands(projects(*command_lists))
+    for commands in command_lists:
+        assert keeps_order(commands, merged), commands
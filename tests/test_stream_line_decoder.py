@@ -0,0 +1,62 @@
+from deploy import StreamLineDecoder
+
+
+def feed_all(decoder, chunks):
+    lines = []
+    for chunk in chunks:
+        lines.extend(decoder.feed(chunk))
+    return lines + decoder.close()
+
+
+def test_multibyte_character_split_across_chunks():
+    data = "构建完成\n".encode("utf-8")
+    decoder = StreamLineDecoder("gbk")
+    assert decoder.feed(data[:4]) == []
+    assert decoder.feed(data[4:]) == [("构建完成", False)]
+    assert decoder.encoding == "utf-8"
+
+
+def test_every_split_point_decodes_the_same():
+    data = "步骤 1\r\n中文输出\n进度 50%\r进度 100%\n".encode("utf-8")
+    expected = [("步骤 1", False), ("中文输出", False), ("进度 50%", True), ("进度 100%", False)]
+    for split in range(1, len(data)):
+        assert feed_all(StreamLineDecoder("gbk"), [data[:split], data[split:]]) == expected, split
+
+
+def test_fallback_encoding_when_output_is_not_utf8():
+    decoder = StreamLineDecoder("gbk")
+    assert feed_all(decoder, ["编译错误\n".encode("gbk")]) == [("编译错误", False)]
+    assert decoder.encoding == "gbk"
+
+
+def test_ascii_prefix_defers_detection():
+    decoder = StreamLineDecoder("gbk")
+    assert decoder.feed(b"ascii only\n") == [("ascii only", False)]
+    assert decoder.encoding is None
+    assert decoder.feed("警告\n".encode("gbk")) == [("警告", False)]
+    assert decoder.encoding == "gbk"
+
+
+def test_carriage_return_marks_progress_lines():
+    decoder = StreamLineDecoder("utf-8")
+    assert decoder.feed(b"10%\r20%\r") == [("10%", True)]
+    assert decoder.feed(b"done\n") == [("20%", True), ("done", False)]
+
+
+def test_crlf_split_across_chunks_is_one_line_break():
+    decoder = StreamLineDecoder("utf-8")
+    assert decoder.feed(b"line\r") == []
+    assert decoder.feed(b"\nnext\n") == [("line", False), ("next", False)]
+
+
+def test_partial_line_is_returned_on_close():
+    decoder = StreamLineDecoder("utf-8")
+    assert decoder.feed(b"no newline") == []
+    assert decoder.close() == [("no newline", False)]
+
+
+def test_take_partial_strips_pending_carriage_return():
+    decoder = StreamLineDecoder("utf-8")
+    decoder.feed(b"downloading 30%\r")
+    assert decoder.take_partial() == "downloading 30%"
+    assert decoder.close() == []
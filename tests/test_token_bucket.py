@@ -0,0 +1,58 @@
+import pytest
+
+import deploy
+from deploy import TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(deploy.time, "time", lambda: now[0])
+    return now
+
+
+def test_bucket_starts_full_and_does_not_overdraw(clock):
+    bucket = TokenBucket(10, 20)
+    assert bucket.try_take(20)
+    assert not bucket.try_take(1)
+
+
+def test_tokens_refill_at_rate(clock):
+    bucket = TokenBucket(10, 20)
+    bucket.try_take(20)
+    clock[0] += 0.5
+    assert bucket.try_take(5)
+    assert not bucket.try_take(1)
+
+
+def test_refill_is_capped_at_burst(clock):
+    bucket = TokenBucket(10, 20)
+    bucket.try_take(20)
+    clock[0] += 3600
+    assert bucket.try_take(20)
+    assert not bucket.try_take(1)
+
+
+def test_burst_defaults_to_rate(clock):
+    bucket = TokenBucket(5)
+    assert bucket.try_take(5)
+    assert not bucket.try_take(1)
+
+
+def test_reserve_overdraws_and_queues_callers(clock):
+    bucket = TokenBucket(100, 100)
+    assert bucket.reserve(100) == 0
+    assert bucket.reserve(50) == pytest.approx(0.5)
+    assert bucket.reserve(50) == pytest.approx(1.0)
+    clock[0] += 1.0
+    assert bucket.reserve(0) == 0
+
+
+def test_set_rate_truncates_tokens_and_changes_refill(clock):
+    bucket = TokenBucket(100, 100)
+    bucket.set_rate(10)
+    assert not bucket.try_take(11)
+    assert bucket.try_take(10)
+    clock[0] += 1.0
+    assert bucket.try_take(10)
+    assert not bucket.try_take(1)